@@ -0,0 +1,3 @@
+"""
+Benchmarks cho Make Mockup Client. Chạy bằng `python -m benchmarks.<module>` từ thư mục gốc project.
+"""
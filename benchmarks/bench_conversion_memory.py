@@ -0,0 +1,142 @@
+# benchmarks/bench_conversion_memory.py - Đo peak memory của conversion WebP (legacy vs bounded)
+"""
+Mỗi mode chạy trong một process riêng để peak RSS không bị lẫn giữa các lần đo.
+
+tracemalloc chỉ thấy các allocation đi qua allocator của Python, còn buffer pixel của Pillow
+được cấp phát bằng malloc nên không nằm trong con số tracemalloc. Vì vậy script báo cả
+peak tracemalloc (phần Python) và peak RSS (toàn bộ), và kiểm tra trên peak RSS.
+
+Ví dụ:
+    python -m benchmarks.bench_conversion_memory --size 8000 --parallel 4
+    python -m benchmarks.bench_conversion_memory --format jpeg --max-peak-mb 300
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import generate_source_image
+
+MODES = ("legacy", "bounded")
+
+
+def peak_rss_bytes() -> int:
+    """Peak RSS của process hiện tại"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về byte
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+
+
+def run_child(mode: str, source: str, parallel: int) -> Dict[str, Any]:
+    """Chạy conversion trong process hiện tại và trả về số liệu bộ nhớ"""
+    from benchmarks import standin
+    standin.install()
+
+    quiet_logger = logging.getLogger("benchmarks.conversion")
+    quiet_logger.setLevel(logging.WARNING)
+    quiet_logger.propagate = False
+
+    if mode == "legacy":
+        from image_procesing import convert_image_with_alpha
+
+        def convert(src, dst):
+            convert_image_with_alpha(src, dst, task_logger=quiet_logger, low_memory=False)
+    else:
+        from utils.image_convert import convert_image_bounded
+
+        def convert(src, dst):
+            convert_image_bounded(src, dst, task_logger=quiet_logger)
+
+    baseline_rss = peak_rss_bytes()
+    tracemalloc.start()
+    out_dir = tempfile.mkdtemp(prefix="bench_conv_")
+    errors: List[str] = []
+
+    def job(index: int):
+        try:
+            convert(source, os.path.join(out_dir, f"out_{index}.webp"))
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(parallel)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "mode": mode,
+        "parallel": parallel,
+        "peak_rss_delta_mb": round((peak_rss_bytes() - baseline_rss) / (1024 * 1024), 1),
+        "tracemalloc_peak_kb": round(traced_peak / 1024, 1),
+        "errors": errors,
+    }
+    if mode == "bounded":
+        from utils.memory_budget import get_conversion_budget
+        stats = get_conversion_budget().get_stats()
+        result["budget_peak_mb"] = round(stats["peak_bytes"] / (1024 * 1024), 1)
+        result["budget_waits"] = stats["waits"]
+    return result
+
+
+def measure(mode: str, source: str, parallel: int) -> Dict[str, Any]:
+    cmd = [sys.executable, "-m", "benchmarks.bench_conversion_memory", "--child", mode,
+           "--source", source, "--parallel", str(parallel)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{proc.stderr}")
+    # Logger manager có thể in thêm dòng khi shutdown, lấy dòng JSON kết quả
+    result_line = [line for line in proc.stdout.splitlines() if line.startswith("{")][-1]
+    return json.loads(result_line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Peak memory of WebP conversion: legacy vs bounded")
+    parser.add_argument("--size", type=int, default=8000, help="Kích thước ảnh nguồn (px)")
+    parser.add_argument("--format", choices=("png", "jpeg"), default="png")
+    parser.add_argument("--no-alpha", action="store_true")
+    parser.add_argument("--parallel", type=int, default=1, help="Số conversion chạy song song")
+    parser.add_argument("--max-peak-mb", type=float, default=None,
+                        help="Fail nếu peak RSS của bounded vượt ngưỡng (mặc định: phải thấp hơn legacy)")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--source", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.source, args.parallel)))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="bench_conv_src_") as tmp_dir:
+        source = os.path.join(tmp_dir, f"source.{'jpg' if args.format == 'jpeg' else 'png'}")
+        generate_source_image(source, args.size, args.format, not args.no_alpha)
+        results = {mode: measure(mode, source, args.parallel) for mode in MODES}
+
+    for result in results.values():
+        print(json.dumps(result))
+
+    bounded_peak = results["bounded"]["peak_rss_delta_mb"]
+    legacy_peak = results["legacy"]["peak_rss_delta_mb"]
+    limit = args.max_peak_mb if args.max_peak_mb is not None else legacy_peak
+    if results["bounded"]["errors"] or bounded_peak > limit:
+        print(f"FAIL: bounded peak {bounded_peak} MB > limit {limit} MB", file=sys.stderr)
+        return 1
+    print(f"OK: bounded peak {bounded_peak} MB vs legacy {legacy_peak} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# benchmarks/bench_logging.py - So sánh logging đồng bộ và logging qua queue/listener
+"""
+Mỗi mode chạy trong một process riêng, cwd là thư mục tạm có config.json với
+settings.queue_logging tương ứng, nên singleton enhanced_logger_manager được tạo đúng mode.
+
+Số liệu:
+- caller_records_per_sec: tốc độ phía thread gọi logger.info (cái worker thực sự phải chờ)
+- end_to_end_records_per_sec: tính cả thời gian drain queue và flush ra file
+- latency_us: p50/p99/max của từng call logger.info
+
+Ví dụ:
+    python -m benchmarks.bench_logging --records 20000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+MODES = ("sync", "queue")
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(sorted_values: List[int], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))]
+
+
+def _time_calls(logger, records: int, label: str) -> Dict[str, Any]:
+    latencies = []
+    start = time.perf_counter()
+    for i in range(records):
+        t0 = time.perf_counter_ns()
+        logger.info(f"🔧 PSD Processing | {label} record {i}/{records}: 'Jacket-MK-{i % 8}.psd' ✅")
+        latencies.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "caller_seconds": elapsed,
+        "caller_records_per_sec": round(records / elapsed, 1),
+        "latency_us": {
+            "p50": round(_percentile(latencies, 50) / 1000, 2),
+            "p99": round(_percentile(latencies, 99) / 1000, 2),
+            "max": round(latencies[-1] / 1000, 2),
+        },
+    }
+
+
+def run_child(mode: str, records: int) -> Dict[str, Any]:
+    import logging
+    from utils.enhanced_logger_manager import enhanced_logger_manager, get_task_logger
+
+    result: Dict[str, Any] = {"mode": mode, "records": records}
+
+    root_stats = _time_calls(logging.getLogger("benchmarks.logging"), records, "root")
+    task_logger = get_task_logger("bench")
+    task_stats = _time_calls(task_logger, records, "task")
+
+    drain_start = time.perf_counter()
+    enhanced_logger_manager.shutdown()
+    drain_seconds = time.perf_counter() - drain_start
+
+    total_caller = root_stats["caller_seconds"] + task_stats["caller_seconds"]
+    result["root"] = root_stats
+    result["task"] = task_stats
+    result["drain_seconds"] = round(drain_seconds, 4)
+    result["end_to_end_records_per_sec"] = round(2 * records / (total_caller + drain_seconds), 1)
+    return result
+
+
+def measure(mode: str, records: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"bench_log_{mode}_") as tmp_dir:
+        with open(os.path.join(tmp_dir, "config.json"), "w", encoding="utf-8") as f:
+            json.dump({"settings": {"queue_logging": mode == "queue"}}, f)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = PROJECT_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+        cmd = [sys.executable, "-m", "benchmarks.bench_logging", "--child", mode, "--records", str(records)]
+        # Console handler ghi ra stderr: vẫn tính chi phí I/O nhưng không in ra màn hình
+        proc = subprocess.run(cmd, cwd=tmp_dir, env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} run failed (exit {proc.returncode})")
+    result_line = [line for line in proc.stdout.splitlines() if line.startswith("{")][-1]
+    return json.loads(result_line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Logging throughput: sync handlers vs queue listener")
+    parser.add_argument("--records", type=int, default=20000, help="Số record cho mỗi logger (root và task)")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.records)))
+        return 0
+
+    results = {mode: measure(mode, args.records) for mode in MODES}
+    for result in results.values():
+        print(json.dumps(result))
+
+    sync_root = results["sync"]["root"]
+    queue_root = results["queue"]["root"]
+    print(f"Root logger caller: {sync_root['caller_records_per_sec']:,.0f} -> "
+          f"{queue_root['caller_records_per_sec']:,.0f} records/s, "
+          f"p50 {sync_root['latency_us']['p50']} -> {queue_root['latency_us']['p50']} us")
+    print(f"End-to-end: {results['sync']['end_to_end_records_per_sec']:,.0f} -> "
+          f"{results['queue']['end_to_end_records_per_sec']:,.0f} records/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# benchmarks/bench_naming.py - Throughput của slug và cấp tên output (utils.mockup_naming)
+"""
+Số liệu:
+- slug: call/s của create_slug cũ (3 regex, xoá ký tự không ASCII), slugify không cache và có cache
+  trên tên sản phẩm có dấu; kèm số slug rỗng / bị mất chữ của mỗi cách
+- allocate: N thread, mỗi thread là một task cùng tên sản phẩm render cùng bộ PSD vào cùng export folder;
+  đếm tên trùng khi chỉ dùng generate_image_filename và khi qua OutputNameAllocator
+
+Ví dụ:
+    python -m benchmarks.bench_naming --threads 8 --tasks 200
+"""
+import argparse
+import json
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.suite import MOCKUP_FILENAMES, PRODUCT_NAMES
+from utils.mockup_naming import LABELS, OutputNameAllocator, generate_image_filename, slugify
+
+EXTRA_NAMES = [
+    "Áo thun", "Ao thun", "Áo Thun Nữ", "Áo thun nữ", "Quần jean ống đứng", "Đầm dự tiệc đỏ",
+    "Giày thể thao Đà Nẵng", "Straße Köln Hoodie", "Crème brûlée Tee", "Ñandú Jacket",
+]
+
+
+def legacy_create_slug(text: str) -> str:
+    """create_slug trước khi có slugify (để so sánh)"""
+    slug = text.lower().replace(' ', '-')
+    slug = re.sub(r'[^a-z0-9\-]', '', slug)
+    slug = re.sub(r'-+', '-', slug)
+    return slug.strip('-')
+
+
+def calls_per_sec(func: Callable[[str], str], names: List[str], number: int) -> float:
+    start = time.perf_counter()
+    for i in range(number):
+        func(names[i % len(names)])
+    return number / (time.perf_counter() - start)
+
+
+def slug_quality(func: Callable[[str], str], names: List[str]) -> Dict[str, Any]:
+    slugs = {name: func(name) for name in names}
+    # Slug mất chữ: ít chữ cái hơn tên gốc (ký tự có dấu bị xoá thay vì bỏ dấu)
+    lost = [name for name, slug in slugs.items()
+            if sum(c.isalnum() for c in slug) < sum(c.isalnum() for c in name)]
+    return {"empty": sum(1 for slug in slugs.values() if not slug), "lost_characters": len(lost),
+            "examples": {name: slugs[name] for name in EXTRA_NAMES[:3]}}
+
+
+def run_allocation(threads: int, tasks: int, use_allocator: bool) -> Dict[str, Any]:
+    """Mỗi task giữ tên từ lúc cấp tới lúc "upload xong"; tên trùng với tên task khác đang giữ = collision"""
+    allocator = OutputNameAllocator()
+    live: Dict[str, str] = {}
+    collisions = [0]
+    lock = threading.Lock()
+    slug = slugify(EXTRA_NAMES[0])
+    with tempfile.TemporaryDirectory(prefix="bench_naming_") as export_folder:
+        def run(thread_index: int) -> None:
+            for task_index in range(tasks):
+                task_id = f"t{thread_index}-{task_index}"
+                held = []
+                for psd_filename in MOCKUP_FILENAMES:
+                    base_name = generate_image_filename(psd_filename, slug, LABELS)
+                    if use_allocator:
+                        name = allocator.allocate(export_folder, base_name, owner=task_id, key=psd_filename)
+                    else:
+                        name = base_name
+                    with lock:
+                        if name in live:
+                            collisions[0] += 1
+                        live[name] = task_id
+                    held.append(name)
+                time.sleep(0)  # Nhường thread khác trong lúc "render/upload"
+                with lock:
+                    for name in held:
+                        if live.get(name) == task_id:
+                            del live[name]
+                if use_allocator:
+                    allocator.release(task_id)
+
+        workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+    allocations = threads * tasks * len(MOCKUP_FILENAMES)
+    return {"allocator": use_allocator, "allocations": allocations, "collisions": collisions[0],
+            "allocations_per_sec": round(allocations / elapsed, 1)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Slug and output-name throughput / collisions")
+    parser.add_argument("--number", type=int, default=200000, help="Số lần gọi slug mỗi mode")
+    parser.add_argument("--threads", type=int, default=8, help="Số task chạy song song")
+    parser.add_argument("--tasks", type=int, default=200, help="Số task mỗi thread")
+    args = parser.parse_args(argv)
+
+    names = PRODUCT_NAMES + EXTRA_NAMES
+    uncached = slugify.__wrapped__
+    slugify.cache_clear()
+    result: Dict[str, Any] = {
+        "slug_calls_per_sec": {
+            "legacy": round(calls_per_sec(legacy_create_slug, names, args.number), 1),
+            "slugify_uncached": round(calls_per_sec(uncached, names, args.number), 1),
+            "slugify_cached": round(calls_per_sec(slugify, names, args.number), 1),
+        },
+        "slug_quality": {"legacy": slug_quality(legacy_create_slug, names), "slugify": slug_quality(uncached, names)},
+        "allocate": [run_allocation(args.threads, args.tasks, False), run_allocation(args.threads, args.tasks, True)],
+    }
+    print(json.dumps(result, ensure_ascii=False))
+    rates = result["slug_calls_per_sec"]
+    print(f"Slug: legacy {rates['legacy']:,.0f}/s, uncached {rates['slugify_uncached']:,.0f}/s, "
+          f"cached {rates['slugify_cached']:,.0f}/s")
+    quality = result["slug_quality"]
+    print(f"Slugs losing characters: {quality['legacy']['lost_characters']} -> {quality['slugify']['lost_characters']} "
+          f"of {len(names)}")
+    legacy_alloc, allocator = result["allocate"]
+    print(f"Output name collisions: {legacy_alloc['collisions']} -> {allocator['collisions']} "
+          f"({allocator['allocations_per_sec']:,.0f} allocations/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# benchmarks/bench_response.py - So sánh các đường serialize response của utils/response_util
+"""
+Payload: list N task dạng dict (datetime, list log lồng nhau, None) như danh sách task / dump log.
+
+Modes:
+- legacy: APIResponseSchema.model_dump + duyệt đệ quy đổi datetime + JSONResponse (cách cũ)
+- fast: success_response (encode một lần, datetime qua json_default)
+- stream: stream_json_response, tính cả thời gian tiêu thụ hết body
+
+Số liệu: ms mỗi response (median), items/s, peak memory Python (tracemalloc) trong lúc dựng body.
+
+Ví dụ:
+    python -m benchmarks.bench_response --items 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+
+from schemas.api_response import APIResponseSchema
+from utils.response_util import stream_json_response, success_response
+
+
+def make_payload(items: int) -> List[Dict[str, Any]]:
+    start = datetime(2025, 1, 1, 8, 0, 0)
+    payload = []
+    for i in range(items):
+        created = start + timedelta(seconds=i * 37)
+        payload.append({
+            "id": f"task-{i:06d}",
+            "product_name": f"Áo thun mẫu {i}",
+            "product_type": "T-Shirt" if i % 3 else "Hoodie",
+            "store": f"store-{i % 7}",
+            "status": "completed" if i % 5 else "failed",
+            "priority": ("low", "normal", "high", "urgent")[i % 4],
+            "created_at": created,
+            "updated_at": created + timedelta(seconds=95),
+            "message": None if i % 5 else "Photoshop timeout",
+            "images": [f"statics/uploads/task-{i:06d}/Mockup-MK-{k}.webp" for k in range(1, 4)],
+            "logs": [{"timestamp": created + timedelta(seconds=k), "level": "INFO",
+                      "message": f"🔧 Step {k} done"} for k in range(3)],
+        })
+    return payload
+
+
+def _convert_datetime_to_isoformat(obj: Any) -> Any:
+    """Bản sao helper cũ đã bỏ khỏi utils.response_util, giữ lại để đo đường legacy"""
+    if isinstance(obj, dict):
+        return {k: _convert_datetime_to_isoformat(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_convert_datetime_to_isoformat(item) for item in obj]
+    elif isinstance(obj, datetime):
+        return obj.isoformat()
+    else:
+        return obj
+
+
+def legacy_success_response(data: Any, message: str = "Operation successful") -> JSONResponse:
+    response_data = APIResponseSchema(success=True, message=message, data=data).model_dump(exclude_none=True)
+    return JSONResponse(status_code=200, content=_convert_datetime_to_isoformat(response_data))
+
+
+def _consume_stream(response) -> bytes:
+    async def collect() -> bytes:
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+
+def run_mode(mode: str, payload: List[Dict[str, Any]]) -> bytes:
+    if mode == "legacy":
+        return legacy_success_response(payload).body
+    if mode == "fast":
+        return success_response(payload).body
+    return _consume_stream(stream_json_response(payload))
+
+
+def measure(mode: str, payload: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = run_mode(mode, payload)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run_mode(mode, payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    median = statistics.median(timings)
+    return {
+        "mode": mode,
+        "items": len(payload),
+        "median_ms": round(median * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2),
+        "items_per_sec": round(len(payload) / median, 1),
+        "peak_mb": round(peak / (1024 * 1024), 2),
+        "body_bytes": len(body),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Response serialization: legacy vs single-pass vs streaming")
+    parser.add_argument("--items", type=int, default=10000, help="Số item trong data")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần đo mỗi mode")
+    args = parser.parse_args(argv)
+
+    payload = make_payload(args.items)
+    bodies = {mode: json.loads(run_mode(mode, payload)) for mode in ("legacy", "fast", "stream")}
+    # Cùng nội dung (stream đặt "data" sau "meta" nhưng so sánh theo giá trị)
+    if not bodies["legacy"] == bodies["fast"] == bodies["stream"]:
+        print("❌ Response bodies differ between modes")
+        return 1
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for mode in ("legacy", "fast", "stream"):
+        results[mode] = measure(mode, payload, args.repeat)
+        print(json.dumps(results[mode]))
+
+    legacy = results["legacy"]
+    for mode in ("fast", "stream"):
+        result = results[mode]
+        print(f"{mode}: {legacy['median_ms']:.1f} -> {result['median_ms']:.1f} ms "
+              f"({legacy['median_ms'] / result['median_ms']:.2f}x), "
+              f"peak {legacy['peak_mb']:.1f} -> {result['peak_mb']:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# benchmarks/bench_task_model.py - Bộ nhớ mỗi 100k task và tốc độ decode của models.task
+"""
+So sánh Base_task cũ (dataclass thường, from_dict 8 lần .get) với Base_task slotted + decode_tasks.
+
+Số liệu:
+- memory: byte/task còn giữ sau khi decode N dòng JSONL (instance + list/tuple + string, dict trung gian đã giải phóng)
+- decode: task/s cho list dict v2 (đường nhanh), dict cũ không có schema_version (đường validate đầy đủ)
+  và JSONL (gồm json.loads)
+
+Ví dụ:
+    python -m benchmarks.bench_task_model --tasks 100000
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from models.task import decode_task, decode_tasks, decode_tasks_jsonl
+
+
+@dataclass
+class LegacyTask:
+    """Base_task trước khi thêm __slots__ (để so sánh)"""
+    id: str
+    product_name: str
+    product_type: str
+    final_image: List[str]
+    status: str
+    store: str
+    downloaded_image_path: str
+    message: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LegacyTask':
+        return cls(
+            id=data.get("id", ""),
+            product_name=data.get("product_name", ""),
+            product_type=data.get("product_type", ""),
+            final_image=data.get("final_image", []),
+            status=data.get("status", "pending"),
+            store=data.get("store", ""),
+            downloaded_image_path=data.get("downloaded_image_path", ""),
+            message=data.get("message", "")
+        )
+
+
+def make_dicts(count: int) -> List[Dict[str, Any]]:
+    return [decode_task({
+        "id": f"task-{i:07d}",
+        "product_name": f"Áo thun {i % 500}",
+        "product_type": "T-Shirt",
+        "final_image": [f"output/task-{i:07d}-MK-1.webp"],
+        "status": "completed",
+        "store": f"store-{i % 7}",
+        "downloaded_image_path": f"downloads/task-{i:07d}.png",
+        "message": "ok",
+    }).to_dict() for i in range(count)]
+
+
+def measure_memory(decode: Callable[[List[str]], list], lines: List[str]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = decode(lines)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tasks
+    return (after - before) / len(lines)
+
+
+def measure_rate(decode: Callable[[Any], list], source: Any, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(source)
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Task model: memory per task and decode throughput")
+    parser.add_argument("--tasks", type=int, default=100000, help="Số task")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo tốc độ (lấy lần nhanh nhất)")
+    args = parser.parse_args(argv)
+
+    dicts = make_dicts(args.tasks)
+    legacy_dicts = [{key: value for key, value in item.items() if key != "schema_version"} for item in dicts]
+    lines = [json.dumps(item, ensure_ascii=False) for item in dicts]
+
+    legacy_decode = lambda items: [LegacyTask.from_dict(item) for item in items]  # noqa: E731
+    legacy_jsonl = lambda source: legacy_decode([json.loads(line) for line in source])  # noqa: E731
+    memory = {
+        "legacy_bytes_per_task": round(measure_memory(legacy_jsonl, lines), 1),
+        "slotted_bytes_per_task": round(measure_memory(decode_tasks_jsonl, lines), 1),
+    }
+    memory["legacy_mb_per_100k"] = round(memory["legacy_bytes_per_task"] * 100000 / 1048576, 2)
+    memory["slotted_mb_per_100k"] = round(memory["slotted_bytes_per_task"] * 100000 / 1048576, 2)
+
+    rates = {
+        "legacy_from_dict": measure_rate(legacy_decode, dicts, args.tasks, args.repeat),
+        "decode_tasks_v2": measure_rate(decode_tasks, dicts, args.tasks, args.repeat),
+        "decode_tasks_unversioned": measure_rate(decode_tasks, legacy_dicts, args.tasks, args.repeat),
+        "legacy_jsonl": measure_rate(legacy_jsonl, lines, args.tasks, args.repeat),
+        "decode_tasks_jsonl": measure_rate(decode_tasks_jsonl, lines, args.tasks, args.repeat),
+    }
+    result = {"tasks": args.tasks, "python": sys.version.split()[0], "memory": memory,
+              "tasks_per_sec": {name: round(rate, 1) for name, rate in rates.items()}}
+    print(json.dumps(result))
+    print(f"Memory: {memory['legacy_mb_per_100k']:.1f} -> {memory['slotted_mb_per_100k']:.1f} MB per 100k tasks")
+    print(f"Decode: {rates['legacy_from_dict']:,.0f} -> {rates['decode_tasks_v2']:,.0f} tasks/s "
+          f"(unversioned {rates['decode_tasks_unversioned']:,.0f}, "
+          f"JSONL {rates['legacy_jsonl']:,.0f} -> {rates['decode_tasks_jsonl']:,.0f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
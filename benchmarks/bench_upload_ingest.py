@@ -0,0 +1,187 @@
+# benchmarks/bench_upload_ingest.py - Upload đồng thời: handler cũ (read cả file + ghi sync) vs UploadIngestor
+"""
+Mỗi mode chạy server trong một process riêng (uvicorn, một route PATCH /{client}/update-task/),
+process cha bắn upload đồng thời và đo:
+- throughput (MB/s), latency p50/p95 mỗi request
+- latency của GET /ping chạy song song: event loop bị chặn bởi ghi file sync thì ping chậm theo
+- peak RSS của server so với lúc khởi động
+
+Ví dụ:
+    python -m benchmarks.bench_upload_ingest --requests 40 --concurrency 8 --size-mb 8
+    python -m benchmarks.bench_upload_ingest --files 3 --size-mb 2 --duplicate
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_conversion_memory import peak_rss_bytes
+
+MODES = ("legacy", "streaming")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def build_app(mode: str, root: str):
+    from typing import List as TList, Optional as TOptional
+
+    from fastapi import FastAPI, File, Form, UploadFile
+
+    from core.upload_ingest import UploadIngestor
+
+    app = FastAPI()
+    ingestor = UploadIngestor(root=root)
+    baseline_rss = peak_rss_bytes()
+
+    if mode == "legacy":
+        @app.patch("/{client_name}/update-task/")
+        async def update_task(client_name: str, id: str = Form(...), status: str = Form(...),
+                              images: TOptional[TList[UploadFile]] = File(None)):
+            # Giống handler cũ của server.py: đọc cả file vào RAM, ghi sync trong event loop
+            saved = []
+            for img in images or []:
+                save_path = os.path.join(root, f"{uuid.uuid4().hex}_{img.filename}")
+                with open(save_path, "wb") as f:
+                    f.write(await img.read())
+                saved.append(save_path)
+            return {"id": id, "images": len(saved)}
+    else:
+        @app.patch("/{client_name}/update-task/")
+        async def update_task(client_name: str, id: str = Form(...), status: str = Form(...),
+                              images: TOptional[TList[UploadFile]] = File(None)):
+            ingested = await ingestor.ingest(id, images)
+            return {"id": id, "images": len(ingested)}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/stats")
+    def stats():
+        return {"peak_rss_delta_mb": round((peak_rss_bytes() - baseline_rss) / 1048576, 1),
+                "ingest": ingestor.get_stats()}
+
+    return app
+
+
+def run_child(mode: str, port: int, root: str) -> None:
+    import uvicorn
+    uvicorn.run(build_app(mode, root), host="127.0.0.1", port=port, log_level="warning")
+
+
+def measure(mode: str, args: argparse.Namespace, payloads: List[bytes]) -> Dict[str, Any]:
+    import requests
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="bench_upload_") as root:
+        child = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_upload_ingest", "--child", mode,
+                                  "--port", str(port), "--root", root])
+        try:
+            deadline = time.time() + 15
+            while True:
+                try:
+                    requests.get(f"{base}/ping", timeout=1)
+                    break
+                except requests.exceptions.RequestException:
+                    if time.time() > deadline or child.poll() is not None:
+                        raise RuntimeError(f"{mode} server failed to start")
+                    time.sleep(0.1)
+
+            stop = threading.Event()
+            ping_latencies: List[float] = []
+
+            def pinger():
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    requests.get(f"{base}/ping", timeout=30)
+                    ping_latencies.append(time.perf_counter() - start)
+                    time.sleep(0.01)
+
+            def upload(index: int) -> float:
+                files = [("images", (f"image_{i}.webp", payloads[(index + i) % len(payloads)], "image/webp"))
+                         for i in range(args.files)]
+                start = time.perf_counter()
+                response = requests.patch(f"{base}/bench/update-task/", data={"id": f"t{index}", "status": "completed"},
+                                          files=files, timeout=120)
+                response.raise_for_status()
+                return time.perf_counter() - start
+
+            ping_thread = threading.Thread(target=pinger, daemon=True)
+            ping_thread.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                latencies = list(pool.map(upload, range(args.requests)))
+            wall = time.perf_counter() - started
+            stop.set()
+            ping_thread.join(30)
+            server_stats = requests.get(f"{base}/stats", timeout=10).json()
+        finally:
+            child.terminate()
+            child.wait(10)
+
+    total_mb = args.requests * args.files * args.size_mb
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_mb_s": round(total_mb / wall, 1),
+        "latency_p50": round(statistics.median(latencies), 4),
+        "latency_p95": round(_percentile(latencies, 95), 4),
+        "ping_p95_ms": round(_percentile(ping_latencies, 95) * 1000, 2),
+        "ping_max_ms": round(max(ping_latencies) * 1000, 2) if ping_latencies else 0.0,
+        **server_stats,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent upload ingestion: legacy handler vs streaming")
+    parser.add_argument("--requests", type=int, default=40, help="Tổng số request upload")
+    parser.add_argument("--concurrency", type=int, default=8, help="Số request chạy song song")
+    parser.add_argument("--files", type=int, default=2, help="Số ảnh mỗi request")
+    parser.add_argument("--size-mb", type=float, default=4, help="Kích thước mỗi ảnh (MB)")
+    parser.add_argument("--duplicate", action="store_true", help="Mọi request gửi cùng nội dung (test dedupe)")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child, args.port, args.root)
+        return 0
+
+    size = int(args.size_mb * 1024 * 1024)
+    payloads = [os.urandom(size)] if args.duplicate else [os.urandom(size) for _ in range(4)]
+    results = [measure(mode, args, payloads) for mode in MODES]
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    legacy, streaming = results
+    print(f"Throughput {streaming['throughput_mb_s']} vs {legacy['throughput_mb_s']} MB/s | "
+          f"ping p95 {streaming['ping_p95_ms']} vs {legacy['ping_p95_ms']} ms | "
+          f"peak RSS +{streaming['peak_rss_delta_mb']} vs +{legacy['peak_rss_delta_mb']} MB (streaming vs legacy)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
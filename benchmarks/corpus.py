@@ -0,0 +1,54 @@
+# benchmarks/corpus.py - Tạo bộ ảnh tổng hợp cho benchmark (kích thước, alpha, PNG/JPEG)
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+DEFAULT_SIZES = (512, 2048, 4096)
+QUICK_SIZES = (512, 1024)
+# JPEG không có alpha nên chỉ có biến thể RGB
+VARIANTS: Tuple[Tuple[str, bool], ...] = (("png", True), ("png", False), ("jpeg", False))
+
+
+def generate_source_image(path: str, size: int, fmt: str, alpha: bool) -> None:
+    """Tạo ảnh nguồn tổng hợp kích thước size x size"""
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize((size, size))
+    bands = [gradient, gradient.transpose(Image.Transpose.ROTATE_90), gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM)]
+    if alpha and fmt == "png":
+        bands.append(gradient.transpose(Image.Transpose.ROTATE_270))
+        img = Image.merge("RGBA", bands)
+    else:
+        img = Image.merge("RGB", bands)
+    if fmt == "jpeg":
+        img.save(path, format="JPEG", quality=90)
+    else:
+        img.save(path, format="PNG", compress_level=1)
+
+
+def corpus_name(size: int, fmt: str, alpha: bool) -> str:
+    return f"{fmt}_{'rgba' if alpha else 'rgb'}_{size}"
+
+
+def generate_corpus(directory: str, sizes: Iterable[int] = DEFAULT_SIZES,
+                    variants: Iterable[Tuple[str, bool]] = VARIANTS) -> List[Dict[str, Any]]:
+    """
+    Tạo (hoặc dùng lại nếu đã có) một ảnh cho mỗi tổ hợp size x variant.
+    Ảnh là deterministic nên có thể giữ thư mục corpus giữa các lần chạy.
+    """
+    os.makedirs(directory, exist_ok=True)
+    corpus = []
+    for size in sizes:
+        for fmt, alpha in variants:
+            name = corpus_name(size, fmt, alpha)
+            path = os.path.join(directory, f"{name}.{'jpg' if fmt == 'jpeg' else 'png'}")
+            if not os.path.exists(path):
+                generate_source_image(path, size, fmt, alpha)
+            corpus.append({
+                "name": name,
+                "path": path,
+                "size": size,
+                "format": fmt,
+                "alpha": alpha,
+                "bytes": os.path.getsize(path),
+            })
+    return corpus
@@ -0,0 +1,240 @@
+# benchmarks/load_test.py - Chạy K worker thread với server.py giả lập, đo throughput end-to-end
+"""
+Driver:
+1. Tạo workspace tạm (config.json trỏ server_url về server local, mockup giả cho từng store)
+2. Chạy server.py bằng uvicorn trong thread, seed N task, cấu hình latency/lỗi/băng thông
+3. K worker thread cùng chạy get_task -> process_task -> update_task (Photoshop là stand-in)
+   cho tới khi hết task
+4. Báo tasks/s, p50/p95/p99 end-to-end (phía worker và phía server) và breakdown theo stage
+   lấy từ utils.metrics
+
+Ví dụ:
+    python -m benchmarks.load_test --tasks 50 --workers 4
+    python -m benchmarks.load_test --tasks 100 --workers 8 --latency-ms 50 --error-rate 0.02 \\
+        --bandwidth-kbps 20000 --output load_test.json
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.suite import PROJECT_ROOT, setup_workspace
+
+STORES = ["store-a", "store-b", "store-c"]
+PRODUCT_TYPE = "shirt"
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))]
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int):
+    """Chạy server.app bằng uvicorn trong daemon thread, chờ tới khi nhận request"""
+    import uvicorn
+    import server
+
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning")
+    uvicorn_server = uvicorn.Server(config)
+    thread = threading.Thread(target=uvicorn_server.run, name="loadtest-server", daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not uvicorn_server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("Load test server failed to start")
+        time.sleep(0.05)
+    return uvicorn_server, thread
+
+
+def worker_thread(index: int, results: List[Dict[str, Any]], results_lock: threading.Lock) -> None:
+    """Một worker: giống worker_loop nhưng dừng khi server hết task và không sleep giữa các task"""
+    import worker
+    from core.load_test import load_test_state
+    from image_procesing import process_task
+    from models.task import Base_task
+    from utils.deadline import TaskTimeoutError
+    from utils.mockup_naming import output_names
+
+    while True:
+        started = time.perf_counter()
+        task = worker.get_task()
+        polled = time.perf_counter()
+        if not task:
+            if load_test_state.pending:
+                continue  # get_task lỗi do inject, server vẫn còn task
+            break
+
+        task_id = task.get("id", "unknown")
+        deadline = task.pop("_deadline")
+        if task.get("downloaded_image_path"):
+            # process_task resolve path tương đối theo thư mục code, không theo cwd
+            task["downloaded_image_path"] = os.path.abspath(task["downloaded_image_path"])
+
+        final_images: List[str] = []
+        log_data = None
+        try:
+            final_images, log_data = process_task(Base_task.from_dict(task), deadline=deadline)
+            task["status"] = "completed"
+            task["message"] = "Completed by load test driver"
+        except TaskTimeoutError as e:
+            task["status"] = "timeout"
+            task["message"] = str(e)
+        except Exception as e:
+            task["status"] = "failed"
+            task["message"] = str(e)
+        processed = time.perf_counter()
+
+        if log_data:
+            worker.log_shipper.submit(task_id, log_data)
+        check = worker.update_task(task, final_images, log_message_summary=f"worker-{index}")
+        output_names.release(str(task_id))
+        finished = time.perf_counter()
+
+        with results_lock:
+            results.append({
+                "task_id": task_id,
+                "worker": index,
+                "status": task["status"],
+                "updated": bool(check),
+                "images": len(final_images),
+                "get_task": polled - started,
+                "process_task": processed - polled,
+                "update_task": finished - processed,
+                "end_to_end": finished - started,
+            })
+
+
+def summarize(results: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    latencies = sorted(r["end_to_end"] for r in results)
+    done = [r for r in results if r["updated"]]
+
+    def stage(name: str) -> Dict[str, float]:
+        values = sorted(r[name] for r in results)
+        return {
+            "avg": round(sum(values) / len(values), 4) if values else 0.0,
+            "p50": round(_percentile(values, 50), 4),
+            "p95": round(_percentile(values, 95), 4),
+        }
+
+    return {
+        "tasks": len(results),
+        "updated": len(done),
+        "by_status": {status: sum(1 for r in results if r["status"] == status)
+                      for status in sorted({r["status"] for r in results})},
+        "wall_seconds": round(wall_seconds, 3),
+        "tasks_per_second": round(len(done) / wall_seconds, 3) if wall_seconds else 0.0,
+        "end_to_end_seconds": {
+            "p50": round(_percentile(latencies, 50), 4),
+            "p95": round(_percentile(latencies, 95), 4),
+            "p99": round(_percentile(latencies, 99), 4),
+            "max": round(latencies[-1], 4) if latencies else 0.0,
+        },
+        "worker_calls": {name: stage(name) for name in ("get_task", "process_task", "update_task")},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end load test: K worker với task server giả lập")
+    parser.add_argument("--tasks", type=int, default=50, help="Số task seed trên server")
+    parser.add_argument("--workers", type=int, default=4, help="Số worker thread")
+    parser.add_argument("--psd-count", type=int, default=4, help="Số PSD giả mỗi store")
+    parser.add_argument("--image-size", type=int, default=1024, help="Kích thước ảnh download")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency inject cho mọi route")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Jitter ngẫu nhiên thêm vào latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="Tỉ lệ request trả 503")
+    parser.add_argument("--bandwidth-kbps", type=float, default=None, help="Giới hạn băng thông download ảnh")
+    parser.add_argument("--upload-bandwidth-kbps", type=float, default=None, help="Giới hạn băng thông upload")
+    parser.add_argument("--output", default=None, help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args(argv)
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    original_cwd = os.getcwd()
+    port = _free_port()
+
+    with tempfile.TemporaryDirectory(prefix="mockup_loadtest_") as workspace:
+        setup_workspace(
+            workspace, args.psd_count,
+            folders=[f"{store}-{PRODUCT_TYPE}" for store in STORES],
+            app_overrides={
+                "server_url": f"http://127.0.0.1:{port}",
+                "client_name": "loadtest",
+                "metrics": {},
+                "log_shipping": {"enabled": True, "flush_interval": 1},
+            },
+        )
+        os.makedirs(os.path.join(workspace, "statics", "uploads"), exist_ok=True)
+        sys.path.insert(0, PROJECT_ROOT)
+        os.chdir(workspace)
+        try:
+            from benchmarks import standin
+            standin.install()
+            from core.load_test import FaultConfig, load_test_state
+            import worker
+            from utils.metrics import STAGE_SECONDS, STAGE_TOTAL
+
+            logging.getLogger().setLevel(logging.WARNING)
+            load_test_state.seed(args.tasks, image_size=args.image_size, stores=STORES,
+                                 product_types=[PRODUCT_TYPE])
+            load_test_state.faults = FaultConfig(
+                latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                bandwidth_kbps=args.bandwidth_kbps,
+                routes={"update-task": {"bandwidth_kbps": args.upload_bandwidth_kbps}},
+            )
+            uvicorn_server, server_thread = start_server(port)
+            worker.log_shipper.start()
+
+            results: List[Dict[str, Any]] = []
+            results_lock = threading.Lock()
+            threads = [threading.Thread(target=worker_thread, args=(i, results, results_lock),
+                                        name=f"loadtest-worker-{i}") for i in range(args.workers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall_seconds = time.perf_counter() - start
+
+            worker.log_shipper.stop()
+            report = summarize(results, wall_seconds)
+            report["config"] = vars(args)
+            report["server"] = load_test_state.stats()
+            report["stages"] = {group[0]: summary for group, summary in STAGE_SECONDS.summary(("stage",)).items()}
+            errors: Dict[str, float] = {}
+            for item in STAGE_TOTAL.snapshot():
+                if item["labels"]["outcome"] == "error":
+                    errors[item["labels"]["stage"]] = errors.get(item["labels"]["stage"], 0) + item["value"]
+            report["stage_errors"] = errors
+            report["log_shipping"] = worker.log_shipper.get_stats()
+
+            uvicorn_server.should_exit = True
+            server_thread.join(5)
+        finally:
+            os.chdir(original_cwd)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Throughput: {report['tasks_per_second']} tasks/s with {args.workers} workers | "
+          f"end-to-end p50/p95/p99: {report['end_to_end_seconds']['p50']}/"
+          f"{report['end_to_end_seconds']['p95']}/{report['end_to_end_seconds']['p99']}s")
+    for name, summary in report["stages"].items():
+        print(f"  {name:<14} n={summary['count']:<5} avg {summary['avg']:.4f}s  p95 {summary['p95']:.4f}s")
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
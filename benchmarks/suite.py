@@ -0,0 +1,267 @@
+# benchmarks/suite.py - Benchmark các hot path của pipeline ảnh, so với baseline đã lưu
+"""
+Chạy trong một workspace tạm (cwd) có config.json riêng: settings lấy từ config.json của repo,
+mockup_folder/output_folder trỏ vào workspace, Photoshop được thay bằng stand-in.
+
+Case:
+- convert[<format>_<rgb|rgba>_<size>]: convert_image_with_alpha trên corpus tổng hợp (ms/ảnh)
+- create_slug, generate_image_filename, normalize_path, task_log_emit: micro benchmark (us/call)
+- process_task[<n>psd]: process_task đầy đủ qua stand-in renderer (ms/task)
+
+Kết quả ghi ra JSON và so median từng case với baseline, exit 1 khi chậm hơn quá threshold.
+Baseline phụ thuộc máy nên không commit: chưa có file baseline thì exit 2 ngay (trừ khi
+--save-baseline để tạo, hoặc --no-compare để chỉ đo).
+
+Ví dụ:
+    python -m benchmarks.suite --quick --no-compare
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite --output bench_results.json --threshold 0.15
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from benchmarks.corpus import DEFAULT_SIZES, QUICK_SIZES, generate_corpus
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, "benchmarks", "baseline.json")
+
+PRODUCT_NAMES = [
+    "Detroit Tigers Vintage Tee",
+    "Áo thun Đội tuyển Việt Nam 2024",
+    "Hoodie -- Limited   Edition!!",
+    "Men's Jacket (Navy/Blue) #42",
+    "Mũ lưỡi trai thêu chữ Sài Gòn",
+]
+MOCKUP_FILENAMES = ["Jacket-MK-1.psd", "Jacket-MK-3.psd", "Copy-MK-7.psd", "Shirt.psd", "Hoodie-MK-12.psd"]
+RAW_PATHS = [
+    r"D:\dev\sple\make-mockup-client/downloads\1234_Detroit%20Tigers_20250616_153513.png",
+    "downloads/../downloads/image.png",
+    "/tmp/mockups/store-shirt/Jacket-MK-3.psd",
+    "statics\\output\\ao-thun\\ao-thun-main.png",
+]
+
+
+def _summary(samples: List[float], unit: str) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "unit": unit,
+        "runs": len(ordered),
+        "median": round(statistics.median(ordered), 4),
+        "p95": round(ordered[p95_index], 4),
+        "min": round(ordered[0], 4),
+    }
+
+
+def time_each(func: Callable[[], Any], repeat: int, unit_scale: float = 1000.0) -> List[float]:
+    """Đo từng lần gọi (mặc định ms)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * unit_scale)
+    return samples
+
+
+def time_loop(func: Callable[[Any], Any], inputs: List[Any], number: int, repeat: int) -> List[float]:
+    """Micro benchmark: mỗi run gọi func `number` lần qua inputs, trả về us/call của từng run"""
+    samples = []
+    count = len(inputs)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(number):
+            func(inputs[i % count])
+        samples.append((time.perf_counter() - start) * 1e6 / number)
+    return samples
+
+
+def setup_workspace(workspace: str, psd_count: int, folders: Iterable[str] = ("bench-shirt",),
+                    app_overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    config.json + thư mục mockup giả cho mỗi <store>-<product_type> trong folders
+    (stand-in không đọc PSD nên file rỗng là đủ). Trả về config đã ghi.
+    """
+    with open(os.path.join(PROJECT_ROOT, "config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    mockup_root = os.path.join(workspace, "mockups")
+    for folder in folders:
+        mockup_folder = os.path.join(mockup_root, folder)
+        os.makedirs(mockup_folder, exist_ok=True)
+        for i in range(1, psd_count + 1):
+            open(os.path.join(mockup_folder, f"Jacket-MK-{i}.psd"), "wb").close()
+
+    app = config.setdefault("app", {})
+    app["mockup_folder"] = mockup_root
+    app["output_folder"] = os.path.join(workspace, "output")
+    app.setdefault("tracing", {})["enabled"] = False
+    app.update(app_overrides or {})
+    with open(os.path.join(workspace, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return config
+
+
+def run_suite(corpus_dir: str, quick: bool, repeat: int, psd_count: int) -> Dict[str, Dict[str, Any]]:
+    # Import sau khi chdir: logger manager và ConfigLoader dùng cwd
+    from benchmarks import standin
+    standin.install()
+    from image_procesing import convert_image_with_alpha, process_task
+    from models.task import Base_task
+    from utils.enhanced_logger_manager import TaskLogHandler
+    from utils.mockup_naming import LABELS, generate_image_filename, output_names
+    from utils.path_utils import normalize_path
+    from utils.response_util import create_slug
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results: Dict[str, Dict[str, Any]] = {}
+    micro_number = 2000 if quick else 20000
+
+    # --- Conversion ---
+    corpus = generate_corpus(corpus_dir, QUICK_SIZES if quick else DEFAULT_SIZES)
+    convert_dir = os.path.join(os.getcwd(), "convert")
+    os.makedirs(convert_dir, exist_ok=True)
+    for item in corpus:
+        output_path = os.path.join(convert_dir, f"{item['name']}.webp")
+        samples = time_each(lambda: convert_image_with_alpha(item["path"], output_path), repeat)
+        results[f"convert[{item['name']}]"] = _summary(samples, "ms")
+
+    # --- Micro benchmarks ---
+    results["create_slug"] = _summary(time_loop(create_slug, PRODUCT_NAMES, micro_number, repeat), "us")
+    slugs = [create_slug(name) for name in PRODUCT_NAMES]
+    pairs = [(mockup, slug) for mockup in MOCKUP_FILENAMES for slug in slugs]
+    results["generate_image_filename"] = _summary(
+        time_loop(lambda pair: generate_image_filename(pair[0], pair[1], LABELS), pairs, micro_number, repeat), "us")
+    results["normalize_path"] = _summary(time_loop(normalize_path, RAW_PATHS, micro_number, repeat), "us")
+
+    handler = TaskLogHandler("bench")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    records = [logging.LogRecord("task_bench", logging.INFO, __file__, i, f"🔧 PSD Processing | File {i}/8: "
+                                 f"'Jacket-MK-{i}.psd'", None, None) for i in range(8)]
+    results["task_log_emit"] = _summary(time_loop(handler.emit, records, micro_number, repeat), "us")
+    handler.close()
+
+    # --- process_task qua stand-in ---
+    input_image = os.path.join(os.getcwd(), "input.png")
+    shutil.copyfile(next(item["path"] for item in corpus
+                         if item["format"] == "png" and item["alpha"] and item["size"] == 512), input_image)
+    counter = iter(range(1, 1000000))
+
+    def run_task():
+        task_id = f"bench-{next(counter)}"
+        task = Base_task.from_dict({
+            "id": task_id,
+            "product_name": PRODUCT_NAMES[1],
+            "product_type": "shirt",
+            "store": "bench",
+            "downloaded_image_path": input_image,
+        })
+        process_task(task)
+        output_names.release(task_id)
+
+    run_task()  # Warm-up: import lazy, tạo thư mục output
+    results[f"process_task[{psd_count}psd]"] = _summary(time_each(run_task, repeat), "ms")
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[Dict[str, Any]]:
+    """So median với baseline, trả về các case chậm hơn quá threshold"""
+    regressions = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if not base or not base.get("median"):
+            print(f"  {name:<40} {current['median']:>10} {current['unit']}  (no baseline)")
+            continue
+        ratio = current["median"] / base["median"]
+        marker = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"  {name:<40} {current['median']:>10} {current['unit']}  "
+              f"baseline {base['median']:>10}  x{ratio:.2f} {marker}")
+        if marker:
+            regressions.append({"case": name, "median": current["median"], "baseline": base["median"],
+                                "ratio": round(ratio, 3)})
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark suite cho pipeline ảnh")
+    parser.add_argument("--quick", action="store_true", help="Corpus nhỏ và ít vòng lặp hơn")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần đo mỗi case")
+    parser.add_argument("--psd-count", type=int, default=4, help="Số PSD giả cho process_task")
+    parser.add_argument("--corpus-dir", default=None, help="Thư mục giữ corpus giữa các lần chạy")
+    parser.add_argument("--output", default="bench_results.json", help="File JSON kết quả")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="File baseline để so sánh")
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả lần này làm baseline")
+    parser.add_argument("--no-compare", action="store_true", help="Chỉ đo, không so với baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Ngưỡng regression (0.2 = chậm hơn 20%%)")
+    args = parser.parse_args(argv)
+
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    original_cwd = os.getcwd()
+    compare_baseline = not args.save_baseline and not args.no_compare
+    if compare_baseline and not os.path.exists(baseline_path):
+        # Không im lặng bỏ qua so sánh: CI tưởng pass trong khi không có gì để so
+        print(f"❌ Baseline not found: {baseline_path}\n"
+              f"   Run with --save-baseline on the reference machine first, or pass --no-compare.")
+        return 2
+
+    with tempfile.TemporaryDirectory(prefix="mockup_bench_") as workspace:
+        setup_workspace(workspace, args.psd_count)
+        corpus_dir = os.path.abspath(args.corpus_dir) if args.corpus_dir else os.path.join(workspace, "corpus")
+        sys.path.insert(0, PROJECT_ROOT)
+        os.chdir(workspace)
+        try:
+            results = run_suite(corpus_dir, args.quick, max(1, args.repeat), args.psd_count)
+        finally:
+            os.chdir(original_cwd)
+
+    from PIL import __version__ as pillow_version
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pillow": pillow_version,
+            "quick": args.quick,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    regressions: List[Dict[str, Any]] = []
+    if compare_baseline:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("quick") != args.quick:
+            print("⚠️ Baseline was recorded with a different --quick setting")
+        print(f"Comparing against {baseline_path} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        report["regressions"] = regressions
+    else:
+        compare(results, {}, args.threshold)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {output_path}")
+
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+
+    if regressions:
+        print(f"❌ {len(regressions)} case(s) regressed beyond {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
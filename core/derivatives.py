@@ -0,0 +1,260 @@
+# core/derivatives.py - Sinh thumbnail / định dạng phụ cho ảnh upload trong process pool nền, idempotent theo sha256
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_DERIVATIVE_ROOT = os.path.join("statics", "uploads")
+DERIVATIVES_DIR = "_derivatives"
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 64
+MAX_FINISHED_JOBS = 2000
+# name -> {width (0 = giữ kích thước gốc), format, quality}
+DEFAULT_SPECS: Dict[str, Dict[str, Any]] = {
+    "thumb": {"width": 256, "format": "webp", "quality": 80},
+    "preview": {"width": 1024, "format": "webp", "quality": 85},
+    "full_jpeg": {"width": 0, "format": "jpeg", "quality": 90},
+}
+FORMAT_EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg", "jpg": ".jpg", "png": ".png"}
+PIL_SAVE_FORMATS = {".webp": "WEBP", ".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+SOURCE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# (đường dẫn đích, width, extension, quality)
+OutputSpec = Tuple[str, int, str, int]
+
+
+def render_derivatives(source_path: str, outputs: List[OutputSpec]) -> List[Dict[str, Any]]:
+    """
+    Chạy trong process con: decode ảnh nguồn một lần, ghi từng output (tmp + os.replace).
+    Output đã tồn tại được bỏ qua, nên chạy lại một job là an toàn.
+    """
+    from PIL import Image
+    try:
+        lanczos = Image.Resampling.LANCZOS
+    except AttributeError:
+        lanczos = Image.LANCZOS
+
+    results = []
+    pending = [output for output in outputs if not os.path.exists(output[0])]
+    if not pending:
+        return results
+    with Image.open(source_path) as img:
+        max_width = max((width for _, width, _, _ in pending), default=0)
+        if max_width and all(width for _, width, _, _ in pending):
+            img.draft(img.mode, (max_width, max(1, max_width * img.height // img.width)))  # JPEG: decode thu nhỏ
+        img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        # Lớn trước: ảnh nhỏ hơn resize từ ảnh gốc, không resize chồng nhiều lần
+        for target, width, ext, quality in sorted(pending, key=lambda output: -(output[1] or img.width)):
+            if width and width < img.width:
+                work = img.resize((width, max(1, round(img.height * width / img.width))), lanczos,
+                                  reducing_gap=3.0)
+            else:
+                work = img
+            if PIL_SAVE_FORMATS[ext] == "JPEG" and work.mode == "RGBA":
+                # JPEG không có alpha: nền trắng
+                flattened = Image.new("RGB", work.size, (255, 255, 255))
+                flattened.paste(work, mask=work.getchannel("A"))
+                work = flattened
+            save_kwargs: Dict[str, Any] = {"quality": quality}
+            if ext == ".webp":
+                save_kwargs["method"] = 4
+            elif ext == ".png":
+                save_kwargs = {"compress_level": 6}
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = os.path.join(os.path.dirname(target), f".{uuid.uuid4().hex}{ext}")
+            try:
+                work.save(tmp_path, format=PIL_SAVE_FORMATS[ext], **save_kwargs)
+                os.replace(tmp_path, target)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            results.append({"path": target, "width": work.width, "height": work.height,
+                            "bytes": os.path.getsize(target)})
+    return results
+
+
+class DerivativePipeline:
+    """
+    Hàng đợi sinh derivative cho ảnh upload, chạy ngoài request handler:
+
+    - submit() chỉ kiểm tra file đích và đưa job vào ProcessPoolExecutor (spawn), không decode ảnh
+    - idempotent theo (sha256, output): output đã có trên đĩa -> "done" ngay; job cùng key đang chờ/chạy
+      -> trả về job đó, không submit trùng
+    - giới hạn queue_size job chưa xong; đầy thì "rejected" (gọi lại sau, vd lần upload/request tiếp theo)
+    - output của spec upload: <root>/_derivatives/<sha[:2]>/<sha>/<name><ext>
+    """
+
+    def __init__(self, root: str = DEFAULT_DERIVATIVE_ROOT, specs: Optional[Dict[str, Dict[str, Any]]] = None,
+                 workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE, enabled: bool = True):
+        self.root = root
+        self.derivatives_dir = os.path.join(root, DERIVATIVES_DIR)
+        self.specs = dict(DEFAULT_SPECS if specs is None else specs)
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "already_done": 0,
+                      "coalesced": 0, "outputs": 0, "output_bytes": 0, "render_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls) -> 'DerivativePipeline':
+        specs = None
+        if os.environ.get("DERIVATIVE_SPECS"):
+            # JSON: {"thumb": {"width": 256, "format": "webp", "quality": 80}, ...}
+            specs = json.loads(os.environ["DERIVATIVE_SPECS"])
+        return cls(
+            root=os.environ.get("UPLOAD_ROOT", DEFAULT_DERIVATIVE_ROOT),
+            specs=specs,
+            workers=int(os.environ.get("DERIVATIVE_WORKERS", DEFAULT_WORKERS)),
+            queue_size=int(os.environ.get("DERIVATIVE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+            enabled=os.environ.get("DERIVATIVES_ENABLED", "1").lower() not in ("0", "false", "no"),
+        )
+
+    # --- paths ---
+
+    def output_dir(self, digest: str) -> str:
+        return os.path.join(self.derivatives_dir, digest[:2], digest)
+
+    def upload_outputs(self, digest: str) -> Dict[str, OutputSpec]:
+        outputs = {}
+        for name, spec in self.specs.items():
+            ext = FORMAT_EXTENSIONS.get(str(spec.get("format", "webp")).lower(), ".webp")
+            target = os.path.join(self.output_dir(digest), f"{name}{ext}")
+            outputs[name] = (target, int(spec.get("width") or 0), ext, int(spec.get("quality", 85)))
+        return outputs
+
+    # --- jobs ---
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn: không fork process đang có thread của uvicorn/threadpool
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def _unfinished(self) -> int:
+        return sum(1 for job in self.jobs.values() if job["state"] in ("queued", "running"))
+
+    def _prune(self) -> None:
+        finished = [key for key, job in self.jobs.items() if job["state"] not in ("queued", "running")]
+        for key in finished[:max(0, len(self.jobs) - MAX_FINISHED_JOBS)]:
+            del self.jobs[key]
+
+    def submit(self, source_path: str, digest: str, outputs: Optional[List[OutputSpec]] = None,
+               key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Đưa job vào hàng đợi, không chặn. outputs mặc định là các spec upload của digest.
+
+        Returns:
+            Bản sao job: {"key", "digest", "state": done | queued | running | rejected | disabled, ...}
+        """
+        if outputs is None:
+            outputs = list(self.upload_outputs(digest).values())
+        key = key or digest
+        if not self.enabled:
+            return {"key": key, "digest": digest, "state": "disabled"}
+        if os.path.splitext(source_path)[1].lower() not in SOURCE_EXTENSIONS:
+            return {"key": key, "digest": digest, "state": "skipped"}
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job["state"] in ("queued", "running"):
+                self.stats["coalesced"] += 1
+                return self._describe(job)
+            if all(os.path.exists(output[0]) for output in outputs):
+                self.stats["already_done"] += 1
+                return {"key": key, "digest": digest, "state": "done"}
+            if self._unfinished() >= self.queue_size:
+                self.stats["rejected"] += 1
+                return {"key": key, "digest": digest, "state": "rejected"}
+            job = {"key": key, "digest": digest, "source": source_path, "state": "queued",
+                   "submitted_at": time.time(), "outputs": [output[0] for output in outputs]}
+            try:
+                future = self._get_executor().submit(render_derivatives, source_path, outputs)
+            except (BrokenProcessPool, RuntimeError):
+                # Process con chết (OOM...): tạo pool mới cho job sau
+                self.executor = None
+                future = self._get_executor().submit(render_derivatives, source_path, outputs)
+            job["future"] = future
+            self.jobs[key] = job
+            self.jobs.move_to_end(key)
+            self.stats["submitted"] += 1
+            self._prune()
+        future.add_done_callback(lambda done, key=key: self._finish(key, done))
+        return self._describe(job)
+
+    def pending_future(self, key: str) -> Optional[Future]:
+        """Future của job đang chờ/chạy (để request chờ có giới hạn), None nếu job không còn chạy"""
+        with self.lock:
+            job = self.jobs.get(key)
+            return job.get("future") if job is not None and job["state"] in ("queued", "running") else None
+
+    def _finish(self, key: str, future: Future) -> None:
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None:
+                return
+            job["finished_at"] = time.time()
+            self.stats["render_seconds"] += job["finished_at"] - job["submitted_at"]
+            try:
+                results = future.result()
+            except Exception as e:
+                job["state"] = "failed"
+                job["error"] = f"{type(e).__name__}: {e}"
+                self.stats["failed"] += 1
+            else:
+                job["state"] = "done"
+                self.stats["completed"] += 1
+                self.stats["outputs"] += len(results)
+                self.stats["output_bytes"] += sum(result["bytes"] for result in results)
+            job.pop("future", None)
+
+    def _describe(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        described = {name: value for name, value in job.items() if name not in ("future", "source")}
+        future = job.get("future")
+        if job["state"] == "queued" and future is not None and future.running():
+            described["state"] = "running"
+        return described
+
+    def status(self, digest: str) -> Dict[str, Any]:
+        """Trạng thái derivative của một ảnh: job gần nhất và các output spec đang có trên đĩa"""
+        with self.lock:
+            job = self.jobs.get(digest)
+            described = self._describe(job) if job is not None else None
+        outputs = {}
+        for name, (target, _, _, _) in self.upload_outputs(digest).items():
+            exists = os.path.exists(target)
+            outputs[name] = {
+                "path": os.path.relpath(target, self.root).replace("\\", "/"),
+                "ready": exists,
+                "bytes": os.path.getsize(target) if exists else None,
+            }
+        if described is not None:
+            state = described["state"]
+        else:
+            state = "done" if all(output["ready"] for output in outputs.values()) else "missing"
+        return {"digest": digest, "state": state, "job": described, "outputs": outputs}
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            states: Dict[str, int] = {}
+            for job in self.jobs.values():
+                state = self._describe(job)["state"]
+                states[state] = states.get(state, 0) + 1
+            return {**self.stats, "render_seconds": round(self.stats["render_seconds"], 3), "jobs": states,
+                    "queue_size": self.queue_size, "workers": self.workers, "enabled": self.enabled}
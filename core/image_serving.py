@@ -0,0 +1,224 @@
+# core/image_serving.py - Phục vụ ảnh tĩnh: ETag theo content hash, 304, Range, biến thể thu nhỏ ?w=&h=
+import asyncio
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Iterable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+from core.derivatives import DerivativePipeline
+from core.upload_ingest import OBJECTS_DIR, TMP_DIR
+
+DEFAULT_IMAGE_ROOT = os.path.join("statics", "uploads")
+VARIANTS_DIR = "_variants"
+DEFAULT_VARIANT_WIDTHS = (256, 512, 1024, 1536, 2048, 3072, 4096)
+DEFAULT_VARIANT_WAIT = 10.0
+HASH_CHUNK_SIZE = 1024 * 1024
+MEDIA_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+PIL_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP"}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match: danh sách ETag (có thể có W/) hoặc *"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class ImageServer:
+    """
+    GET /images/<path>[?w=<width>[&h=<height>]]
+
+    - ETag mạnh = sha256 nội dung (file trong _objects đã mang sẵn hash trong tên), cache theo
+      (path, size, mtime_ns) nên mỗi file chỉ hash một lần
+    - If-None-Match khớp -> 304 không body
+    - Range / If-Range do FileResponse xử lý (206, 416), để worker tải tiếp file dở
+    - ?w=N[&h=M]: chọn width nhỏ nhất trong widths mà >= N và đủ cao >= M theo tỉ lệ ảnh gốc
+      (không phóng to quá ảnh gốc); biến thể được resize một lần rồi lưu ở
+      _variants/<sha256>_w<width><ext>, lần sau phục vụ như file tĩnh
+    - có derivatives: biến thể chưa có thì đưa vào process pool, request chờ job tối đa variant_wait giây
+      (không resize trong handler); hết thời gian hoặc pool từ chối thì trả ảnh gốc
+    """
+
+    def __init__(self, root: str = DEFAULT_IMAGE_ROOT, widths: Iterable[int] = DEFAULT_VARIANT_WIDTHS,
+                 cache_control: str = "no-cache", derivatives: Optional[DerivativePipeline] = None,
+                 variant_wait: float = DEFAULT_VARIANT_WAIT):
+        self.root = root
+        self.derivatives = derivatives
+        self.variant_wait = variant_wait
+        self.variants_dir = os.path.join(root, VARIANTS_DIR)
+        self.widths = tuple(sorted(set(int(w) for w in widths)))
+        self.cache_control = cache_control
+        self.lock = threading.Lock()
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._sizes: Dict[str, Tuple[int, int]] = {}
+        self._variant_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"served": 0, "not_modified": 0, "variants_generated": 0, "variants_served": 0,
+                      "variants_awaited": 0, "variants_deferred": 0}
+
+    def _count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] += 1
+
+    def resolve(self, rel_path: str) -> Optional[str]:
+        """Đường dẫn file trong root, None nếu không tồn tại hoặc thoát ra ngoài root"""
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(os.path.join(root, rel_path))
+        if not path.startswith(root + os.sep):
+            return None
+        first_part = os.path.relpath(path, root).split(os.sep)[0]
+        if first_part in (TMP_DIR, VARIANTS_DIR):
+            return None
+        return path if os.path.isfile(path) else None
+
+    def content_hash(self, path: str) -> str:
+        if os.path.basename(os.path.dirname(os.path.dirname(path))) == OBJECTS_DIR:
+            # _objects/<sha[:2]>/<sha><ext> do UploadIngestor ghi
+            return os.path.splitext(os.path.basename(path))[0]
+        stat = os.stat(path)
+        with self.lock:
+            cached = self._hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        with self.lock:
+            self._hashes[path] = (stat.st_size, stat.st_mtime_ns, value)
+        return value
+
+    def image_size(self, path: str, digest: str) -> Tuple[int, int]:
+        with self.lock:
+            size = self._sizes.get(digest)
+        if size is None:
+            from PIL import Image
+            with Image.open(path) as img:  # Chỉ đọc header
+                size = img.size
+            with self.lock:
+                self._sizes[digest] = size
+        return size
+
+    def variant_width(self, requested: int, original_width: int, requested_height: Optional[int] = None,
+                      original_height: Optional[int] = None) -> Optional[int]:
+        """Width biến thể sẽ phục vụ (phủ cả requested_height, biến thể giữ tỉ lệ), None = dùng ảnh gốc"""
+        if requested <= 0:
+            return None
+        if requested_height and original_height:
+            # Width cần để chiều cao biến thể >= requested_height
+            requested = max(requested, -(-requested_height * original_width // original_height))
+        for width in self.widths:
+            if width >= requested:
+                return width if width < original_width else None
+        return None
+
+    def variant_target(self, path: str, digest: str, width: int) -> str:
+        return os.path.join(self.variants_dir, f"{digest}_w{width}{os.path.splitext(path)[1].lower()}")
+
+    def variant_path(self, path: str, digest: str, width: int) -> str:
+        """Tạo biến thể nếu chưa có (lock theo key để hai request không resize trùng)"""
+        ext = os.path.splitext(path)[1].lower()
+        target = self.variant_target(path, digest, width)
+        if os.path.exists(target):
+            return target
+        with self.lock:
+            key_lock = self._variant_locks.setdefault(target, threading.Lock())
+        with key_lock:
+            if os.path.exists(target):
+                return target
+            from PIL import Image
+
+            os.makedirs(self.variants_dir, exist_ok=True)
+            tmp_path = os.path.join(self.variants_dir, f".{uuid.uuid4().hex}{ext}")
+            try:
+                with Image.open(path) as img:
+                    img.draft(img.mode, (width, width * img.height // img.width))  # JPEG: decode thu nhỏ
+                    height = max(1, round(img.height * width / img.width))
+                    variant = img.resize((width, height), Image.Resampling.LANCZOS)
+                    save_kwargs = {"compress_level": 6} if ext == ".png" else {"quality": 90}
+                    variant.save(tmp_path, format=PIL_FORMATS.get(ext, "PNG"), **save_kwargs)
+                os.replace(tmp_path, target)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._count("variants_generated")
+        with self.lock:
+            self._variant_locks.pop(target, None)
+        return target
+
+    def _prepare(self, rel_path: str, width: Optional[int], height: Optional[int] = None
+                 ) -> Optional[Tuple[str, str, Optional[int], Optional[Tuple[Future, str, str]]]]:
+        """
+        (file cần gửi, etag, width biến thể, job đang chờ) - chạy trong threadpool vì có hash/resize.
+        Job đang chờ = (future, file gốc, etag gốc): serve() chờ future rồi mới gửi biến thể.
+        """
+        path = self.resolve(rel_path)
+        if path is None:
+            return None
+        digest = self.content_hash(path)
+        chosen = None
+        if width and os.path.splitext(path)[1].lower() in PIL_FORMATS:
+            original_width, original_height = self.image_size(path, digest)
+            chosen = self.variant_width(width, original_width, height, original_height)
+        if chosen is None:
+            return path, f'"{digest}"', None, None
+        if self.derivatives is not None and self.derivatives.enabled:
+            target = self.variant_target(path, digest, chosen)
+            if not os.path.exists(target):
+                ext = os.path.splitext(path)[1].lower()
+                job = self.derivatives.submit(path, digest, [(target, chosen, ext, 90)], key=f"{digest}:w{chosen}")
+                future = self.derivatives.pending_future(job["key"])
+                if future is None and not os.path.exists(target):
+                    # Pool từ chối (đầy) hoặc job lỗi: trả ảnh gốc
+                    self._count("variants_deferred")
+                    return path, f'"{digest}"', None, None
+                if future is not None:
+                    return target, f'"{digest}-w{chosen}"', chosen, (future, path, f'"{digest}"')
+            return target, f'"{digest}-w{chosen}"', chosen, None
+        return self.variant_path(path, digest, chosen), f'"{digest}-w{chosen}"', chosen, None
+
+    async def _await_variant(self, future: Future) -> bool:
+        """Chờ job biến thể tối đa variant_wait giây, không huỷ job khi hết thời gian"""
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.variant_wait)
+        except Exception:
+            # Hết thời gian (asyncio.TimeoutError) hoặc render lỗi
+            return False
+        return True
+
+    async def serve(self, request: Request, rel_path: str, width: Optional[int] = None,
+                    height: Optional[int] = None) -> Response:
+        prepared = await run_in_threadpool(self._prepare, rel_path, width, height)
+        if prepared is None:
+            return Response(status_code=404, content="Image not found")
+        file_path, etag, chosen, pending = prepared
+        if pending is not None:
+            future, original_path, original_etag = pending
+            if await self._await_variant(future) and os.path.exists(file_path):
+                self._count("variants_awaited")
+            else:
+                self._count("variants_deferred")
+                file_path, etag, chosen = original_path, original_etag, None
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if chosen is not None:
+            headers["X-Image-Width"] = str(chosen)
+            self._count("variants_served")
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self._count("not_modified")
+            return Response(status_code=304, headers=headers)
+        self._count("served")
+        media_type = MEDIA_TYPES.get(os.path.splitext(file_path)[1].lower())
+        return FileResponse(file_path, media_type=media_type, headers=headers)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
@@ -0,0 +1,226 @@
+# core/load_test.py - State cho server.py khi chạy làm task server giả lập (load test)
+import asyncio
+import io
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+ROUTES = ("pending-longest", "image", "update-task", "task-logs")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))]
+
+
+def generate_png_bytes(size: int, alpha: bool = True, seed: int = 0) -> bytes:
+    """Ảnh PNG tổng hợp (gradient + noise) để worker download"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 24 + rng.randint(0, 16))
+    bands = [gradient, noise, gradient.transpose(Image.Transpose.ROTATE_90)]
+    if alpha:
+        bands.append(gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM))
+    img = Image.merge("RGBA" if alpha else "RGB", bands)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class FaultConfig:
+    """Latency/lỗi/băng thông inject vào các route, có thể override theo route"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 bandwidth_kbps: Optional[float] = None, routes: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.bandwidth_kbps = bandwidth_kbps
+        self.routes = routes or {}
+
+    def for_route(self, route: str) -> Dict[str, Any]:
+        values = {
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "error_rate": self.error_rate,
+            "bandwidth_kbps": self.bandwidth_kbps,
+        }
+        values.update(self.routes.get(route, {}))
+        return values
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.for_route(""), "routes": self.routes}
+
+
+class LoadTestState:
+    """
+    Hàng đợi task tổng hợp + thống kê phía server.
+
+    Latency end-to-end của một task = từ lúc worker claim (pending-longest) tới lúc
+    update-task của task đó về tới server.
+    """
+
+    def __init__(self, rng_seed: Optional[int] = None):
+        self.lock = threading.Lock()
+        self.rng = random.Random(rng_seed)
+        self.faults = FaultConfig()
+        self.seeded = False
+        self.pending: List[Dict[str, Any]] = []
+        self.images: Dict[str, bytes] = {}
+        self.claimed_at: Dict[str, float] = {}
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.counters = {
+            "claimed": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeout": 0,
+            "empty_polls": 0,
+            "injected_errors": 0,
+            "bytes_downloaded": 0,
+            "bytes_uploaded": 0,
+            "log_posts": 0,
+        }
+
+    # --- Seeding ---
+
+    def seed(self, count: int, image_size: int = 1024, alpha: bool = True, stores: Optional[List[str]] = None,
+             product_types: Optional[List[str]] = None, image_variants: int = 4) -> List[str]:
+        """Thêm count task pending, mỗi task có image_url riêng (cùng vài ảnh nguồn)"""
+        stores = stores or ["store-a", "store-b", "store-c"]
+        product_types = product_types or ["shirt"]
+        variant_keys = []
+        for variant in range(max(1, image_variants)):
+            key = f"{image_size}_{'rgba' if alpha else 'rgb'}_{variant}"
+            if key not in self.images:
+                self.images[key] = generate_png_bytes(image_size, alpha, seed=variant)
+            variant_keys.append(key)
+
+        task_ids = []
+        with self.lock:
+            for i in range(count):
+                task_id = uuid.uuid4().hex[:12]
+                self.pending.append({
+                    "id": task_id,
+                    "product_name": f"Load Test Product {task_id}",
+                    "product_type": self.rng.choice(product_types),
+                    "store": self.rng.choice(stores),
+                    "status": "pending",
+                    "priority": "normal",
+                    "image_url": f"/loadtest/images/{variant_keys[i % len(variant_keys)]}/{task_id}.png",
+                })
+                task_ids.append(task_id)
+            self.seeded = True
+        return task_ids
+
+    def reset(self) -> None:
+        with self.lock:
+            self.pending.clear()
+            self.claimed_at.clear()
+            self.completed.clear()
+            self.started_at = None
+            self.seeded = False
+            for key in self.counters:
+                self.counters[key] = 0
+
+    # --- Routes ---
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            if not self.pending:
+                self.counters["empty_polls"] += 1
+                return None
+            task = self.pending.pop(0)
+            now = time.time()
+            if self.started_at is None:
+                self.started_at = now
+            self.claimed_at[task["id"]] = now
+            self.counters["claimed"] += 1
+            return dict(task)
+
+    def image_bytes(self, key: str) -> Optional[bytes]:
+        data = self.images.get(key)
+        if data is not None:
+            with self.lock:
+                self.counters["bytes_downloaded"] += len(data)
+        return data
+
+    def complete(self, task_id: str, status: str, image_count: int, uploaded_bytes: int) -> None:
+        now = time.time()
+        with self.lock:
+            claimed = self.claimed_at.get(task_id)
+            self.completed[task_id] = {
+                "status": status,
+                "images": image_count,
+                "latency": (now - claimed) if claimed is not None else None,
+                "finished_at": now,
+            }
+            self.counters["bytes_uploaded"] += uploaded_bytes
+            key = status if status in ("completed", "failed", "timeout") else "failed"
+            self.counters[key] += 1
+
+    def record_log(self) -> None:
+        with self.lock:
+            self.counters["log_posts"] += 1
+
+    # --- Fault injection ---
+
+    async def inject(self, route: str) -> bool:
+        """Sleep theo latency cấu hình; trả về True nếu route này phải trả lỗi"""
+        faults = self.faults.for_route(route)
+        delay = faults["latency_ms"] + (self.rng.uniform(0, faults["jitter_ms"]) if faults["jitter_ms"] else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+        if faults["error_rate"] and self.rng.random() < faults["error_rate"]:
+            with self.lock:
+                self.counters["injected_errors"] += 1
+            return True
+        return False
+
+    def bandwidth_delay(self, route: str, nbytes: int) -> float:
+        kbps = self.faults.for_route(route)["bandwidth_kbps"]
+        if not kbps:
+            return 0.0
+        return nbytes * 8 / (kbps * 1000.0)
+
+    async def throttled_chunks(self, route: str, data: bytes):
+        """Stream data theo băng thông giới hạn của route"""
+        for start in range(0, len(data), STREAM_CHUNK_SIZE):
+            chunk = data[start:start + STREAM_CHUNK_SIZE]
+            delay = self.bandwidth_delay(route, len(chunk))
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+    # --- Stats ---
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            latencies = sorted(c["latency"] for c in self.completed.values() if c["latency"] is not None)
+            finished = [c["finished_at"] for c in self.completed.values()]
+            counters = dict(self.counters)
+            pending = len(self.pending)
+            started_at = self.started_at
+        elapsed = (max(finished) - started_at) if finished and started_at else 0.0
+        return {
+            **counters,
+            "pending": pending,
+            "elapsed_seconds": round(elapsed, 3),
+            "tasks_per_second": round(len(finished) / elapsed, 3) if elapsed else 0.0,
+            "latency_seconds": {
+                "p50": round(_percentile(latencies, 50), 3),
+                "p95": round(_percentile(latencies, 95), 3),
+                "p99": round(_percentile(latencies, 99), 3),
+                "max": round(latencies[-1], 3) if latencies else 0.0,
+            },
+            "faults": self.faults.to_dict(),
+        }
+
+
+load_test_state = LoadTestState()
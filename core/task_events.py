@@ -0,0 +1,97 @@
+# core/task_events.py - Đẩy thông báo có task mới tới worker qua Server-Sent Events, theo client_name
+import asyncio
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+KEEPALIVE_SECONDS = 15.0
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class TaskEventBroker:
+    """
+    Mỗi worker subscribe một asyncio.Queue theo client_name. publish() gọi được từ cả event loop
+    lẫn threadpool (route sync, reaper) nhờ call_soon_threadsafe.
+
+    Queue của subscriber có giới hạn: worker chậm chỉ cần biết "có task", nên khi đầy thì bỏ event cũ
+    thay vì chặn publish.
+    """
+
+    def __init__(self, keepalive_seconds: float = KEEPALIVE_SECONDS):
+        self.keepalive_seconds = keepalive_seconds
+        self.lock = threading.Lock()
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "connections": 0}
+
+    def subscriber_count(self, client_name: Optional[str] = None) -> int:
+        with self.lock:
+            if client_name is not None:
+                return len(self.subscribers.get(client_name, ()))
+            return sum(len(queues) for queues in self.subscribers.values())
+
+    def clients(self) -> List[str]:
+        with self.lock:
+            return list(self.subscribers)
+
+    def _deliver(self, client_name: str, message: str) -> None:
+        with self.lock:
+            queues = list(self.subscribers.get(client_name, ()))
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+                self.stats["dropped"] += 1
+            queue.put_nowait(message)
+            self.stats["delivered"] += 1
+
+    def publish(self, client_name: str, event: str = "available", **data) -> None:
+        """Thông báo cho mọi worker của client_name; không có subscriber thì bỏ qua"""
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.subscriber_count(client_name):
+            return
+        message = format_sse(event, {"client_name": client_name, "time": time.time(), **data})
+        self.stats["published"] += 1
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(client_name, message)
+        else:
+            loop.call_soon_threadsafe(self._deliver, client_name, message)
+
+    async def stream(self, client_name: str, initial: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Generator cho StreamingResponse: event ban đầu (nếu có), các event publish và keepalive"""
+        self.loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.setdefault(client_name, set()).add(queue)
+            self.stats["connections"] += 1
+        try:
+            # retry: thời gian EventSource chờ trước khi kết nối lại
+            yield f"retry: {int(self.keepalive_seconds * 1000)}\n"
+            yield format_sse("hello", {"client_name": client_name, "keepalive": self.keepalive_seconds})
+            if initial:
+                yield format_sse("available", {"client_name": client_name, **initial})
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            with self.lock:
+                queues = self.subscribers.get(client_name)
+                if queues is not None:
+                    queues.discard(queue)
+                    if not queues:
+                        del self.subscribers[client_name]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            clients = {client: len(queues) for client, queues in self.subscribers.items()}
+        return {**self.stats, "subscribers": clients}
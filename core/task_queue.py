@@ -0,0 +1,347 @@
+# core/task_queue.py - Hàng đợi task SQLite có lease cho server.py (server tham chiếu khi không có API production)
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_DB_PATH = os.path.join("statics", "task_queue.sqlite3")
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+# pending -> leased -> completed | failed | timeout
+# leased quá hạn -> pending (còn lượt) hoặc dead (hết max_attempts)
+PENDING = "pending"
+LEASED = "leased"
+DEAD = "dead"
+RESULT_STATUSES = ("completed", "failed", "timeout")
+TERMINAL_STATUSES = RESULT_STATUSES + (DEAD,)
+TASK_FIELDS = ("id", "product_name", "product_type", "store", "priority", "image_url")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    client_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    store TEXT NOT NULL DEFAULT '',
+    priority TEXT NOT NULL DEFAULT 'normal',
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_token TEXT,
+    lease_owner TEXT,
+    lease_expires REAL,
+    message TEXT NOT NULL DEFAULT '',
+    images TEXT NOT NULL DEFAULT '[]',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    completed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_pending ON tasks (client_name, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_lease ON tasks (status, lease_expires);
+"""
+
+
+class LeaseLostError(Exception):
+    """Lease của worker đã hết hạn và task đã được giao cho worker khác"""
+
+
+class SQLiteTaskQueue:
+    """
+    Task có trạng thái và lease (visibility timeout):
+    - claim(): lấy task pending lâu nhất, đánh dấu leased kèm lease_token và hạn lease
+    - heartbeat(): worker gia hạn lease khi task chạy lâu
+    - complete(): idempotent, gửi lại kết quả cho task đã xong trả về bản ghi cũ (duplicate=True)
+    - report_progress(): status trung gian (processing, ...) chỉ ghi message, task vẫn giữ lease
+    - lease hết hạn (worker crash) được trả về pending khi claim/reap, quá max_attempts thì dead
+
+    Một connection dùng chung + lock; SQLite ở chế độ WAL nên dữ liệu còn nguyên sau khi server restart.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.counters = {"claimed": 0, "empty_claims": 0, "requeued": 0, "dead": 0,
+                         "completed": 0, "duplicate_completions": 0, "heartbeats": 0, "lease_lost": 0,
+                         "progress_updates": 0}
+
+    @classmethod
+    def from_env(cls) -> 'SQLiteTaskQueue':
+        return cls(
+            path=os.environ.get("TASK_QUEUE_DB", DEFAULT_DB_PATH),
+            lease_seconds=float(os.environ.get("TASK_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)),
+            max_attempts=int(os.environ.get("TASK_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    # --- Helpers ---
+
+    def _transaction(self):
+        """BEGIN IMMEDIATE: giữ write lock ngay từ đầu để claim không bị race giữa các process"""
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def _to_task(row: sqlite3.Row) -> Dict[str, Any]:
+        task = json.loads(row["payload"])
+        task.update({
+            "id": row["id"],
+            "status": row["status"],
+            "store": row["store"],
+            "priority": row["priority"],
+            "attempts": row["attempts"],
+            "message": row["message"],
+        })
+        if row["status"] == LEASED:
+            task["lease_token"] = row["lease_token"]
+            task["lease_expires_at"] = row["lease_expires"]
+        if row["status"] in TERMINAL_STATUSES:
+            task["images"] = json.loads(row["images"])
+            task["completed_at"] = row["completed_at"]
+        return task
+
+    def _reap(self, now: float) -> int:
+        """Trả các lease quá hạn về pending hoặc dead (gọi trong transaction)"""
+        dead = self.conn.execute(
+            "UPDATE tasks SET status = ?, lease_token = NULL, lease_owner = NULL, lease_expires = NULL, "
+            "message = 'Lease expired after max attempts', updated_at = ? "
+            "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+            (DEAD, now, LEASED, now)).rowcount
+        requeued = self.conn.execute(
+            "UPDATE tasks SET status = ?, lease_token = NULL, lease_owner = NULL, lease_expires = NULL, "
+            "updated_at = ? WHERE status = ? AND lease_expires < ?",
+            (PENDING, now, LEASED, now)).rowcount
+        self.counters["dead"] += dead
+        self.counters["requeued"] += requeued
+        return dead + requeued
+
+    # --- Producer ---
+
+    def enqueue(self, client_name: str, tasks: Iterable[Dict[str, Any]]) -> List[str]:
+        """Thêm task pending; task đã tồn tại (cùng id) được bỏ qua"""
+        now = time.time()
+        rows = []
+        for i, task in enumerate(tasks):
+            task_id = str(task.get("id") or uuid.uuid4().hex[:12])
+            payload = {key: task.get(key, "") for key in TASK_FIELDS if key not in ("id", "store", "priority")}
+            payload.update({key: value for key, value in task.items()
+                            if key not in TASK_FIELDS and key not in ("status", "attempts")})
+            # created_at tăng dần để pending-longest giữ đúng thứ tự enqueue trong cùng batch
+            rows.append((task_id, client_name, PENDING, task.get("store", ""), task.get("priority") or "normal",
+                         json.dumps(payload, ensure_ascii=False), self.max_attempts, now + i * 1e-6, now))
+        with self.lock:
+            self._transaction()
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO tasks (id, client_name, status, store, priority, payload, max_attempts, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [row[0] for row in rows]
+
+    # --- Worker routes ---
+
+    def claim(self, client_name: str, worker_id: str = "", store: Optional[str] = None,
+              priority: Optional[str] = None, lease_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Lease task pending lâu nhất của client (lọc theo store/priority nếu có)"""
+        now = time.time()
+        lease_seconds = lease_seconds or self.lease_seconds
+        query = "SELECT * FROM tasks WHERE client_name = ? AND status = ?"
+        params: List[Any] = [client_name, PENDING]
+        if store:
+            query += " AND store = ?"
+            params.append(store)
+        if priority:
+            query += " AND priority = ?"
+            params.append(priority)
+        query += " ORDER BY created_at LIMIT 1"
+
+        with self.lock:
+            self._transaction()
+            try:
+                self._reap(now)
+                row = self.conn.execute(query, params).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    self.counters["empty_claims"] += 1
+                    return None
+                token = uuid.uuid4().hex
+                self.conn.execute(
+                    "UPDATE tasks SET status = ?, lease_token = ?, lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (LEASED, token, worker_id, now + lease_seconds, now, row["id"]))
+                row = self.conn.execute("SELECT * FROM tasks WHERE id = ?", (row["id"],)).fetchone()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.counters["claimed"] += 1
+        task = self._to_task(row)
+        # Worker xử lý task như task mới nhận
+        task["status"] = PENDING
+        return task
+
+    def heartbeat(self, task_id: str, lease_token: str, extend_seconds: Optional[float] = None) -> float:
+        """Gia hạn lease; trả về hạn mới, LeaseLostError nếu lease không còn thuộc token này"""
+        now = time.time()
+        expires = now + (extend_seconds or self.lease_seconds)
+        with self.lock:
+            updated = self.conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_token = ?",
+                (expires, now, task_id, LEASED, lease_token)).rowcount
+            if not updated:
+                self.counters["lease_lost"] += 1
+                raise LeaseLostError(f"Task {task_id} is not leased with this token")
+            self.counters["heartbeats"] += 1
+        return expires
+
+    def report_progress(self, task_id: str, status: str, message: str = "",
+                        lease_token: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Cập nhật không kết thúc (route /update_task cũ gửi cả status trung gian).
+        Chỉ ghi message + updated_at, trạng thái lease và lượt thử giữ nguyên.
+        Task đã có kết quả -> trả về bản ghi cũ (duplicate=True); lease của token khác -> LeaseLostError.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                raise KeyError(task_id)
+            if row["completed_at"] is not None:
+                return {**self._to_task(row), "duplicate": True, "final": False}
+            if lease_token and row["status"] == LEASED and row["lease_token"] != lease_token:
+                self.counters["lease_lost"] += 1
+                raise LeaseLostError(f"Task {task_id} was re-leased to another worker")
+            self.conn.execute("UPDATE tasks SET message = ?, updated_at = ? WHERE id = ? AND completed_at IS NULL",
+                              (message or status, now, task_id))
+            row = self.conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            self.counters["progress_updates"] += 1
+        return {**self._to_task(row), "reported_status": status, "duplicate": False, "final": False}
+
+    def complete(self, task_id: str, status: str, message: str = "", images: Optional[List[str]] = None,
+                 lease_token: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Ghi kết quả cuối. Idempotent: task đã có kết quả thì giữ nguyên và trả về duplicate=True.
+        Task dead (hết lượt lease) vẫn nhận kết quả muộn của worker.
+        Có lease_token mà task đang được lease bởi token khác -> LeaseLostError.
+        Không có lease_token (worker cũ) thì chấp nhận như trước.
+        Status không phải kết quả cuối -> ValueError; dùng report_progress cho status trung gian.
+        """
+        if status not in RESULT_STATUSES:
+            raise ValueError(f"Unknown final status: {status}")
+        now = time.time()
+        with self.lock:
+            self._transaction()
+            try:
+                row = self.conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    raise KeyError(task_id)
+                if row["completed_at"] is not None:
+                    self.conn.execute("COMMIT")
+                    self.counters["duplicate_completions"] += 1
+                    return {**self._to_task(row), "duplicate": True}
+                if lease_token and row["status"] == LEASED and row["lease_token"] != lease_token:
+                    self.conn.execute("COMMIT")
+                    self.counters["lease_lost"] += 1
+                    raise LeaseLostError(f"Task {task_id} was re-leased to another worker")
+                self.conn.execute(
+                    "UPDATE tasks SET status = ?, message = ?, images = ?, lease_token = NULL, lease_owner = NULL, "
+                    "lease_expires = NULL, updated_at = ?, completed_at = ? WHERE id = ?",
+                    (status, message, json.dumps(images or []), now, now, task_id))
+                row = self.conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                self.conn.execute("COMMIT")
+            except (KeyError, LeaseLostError):
+                raise
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.counters["completed"] += 1
+        return {**self._to_task(row), "duplicate": False}
+
+    # --- Inspect ---
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._to_task(row) if row is not None else None
+
+    def iter_tasks(self, client_name: str, status: Optional[str] = None,
+                   batch_size: int = 500) -> Iterable[Dict[str, Any]]:
+        """Duyệt task của client theo created_at, đọc từng batch (keyset) nên không giữ lock suốt lúc stream"""
+        last_created, last_id = -1.0, ""
+        query = ("SELECT * FROM tasks WHERE client_name = ? AND (created_at > ? OR (created_at = ? AND id > ?))"
+                 + (" AND status = ?" if status else "") + " ORDER BY created_at, id LIMIT ?")
+        while True:
+            params: List[Any] = [client_name, last_created, last_created, last_id]
+            if status:
+                params.append(status)
+            params.append(batch_size)
+            with self.lock:
+                rows = self.conn.execute(query, params).fetchall()
+            for row in rows:
+                task = self._to_task(row)
+                task.pop("lease_token", None)
+                yield task
+            if len(rows) < batch_size:
+                return
+            last_created, last_id = rows[-1]["created_at"], rows[-1]["id"]
+
+    def reap(self) -> int:
+        with self.lock:
+            self._transaction()
+            try:
+                count = self._reap(time.time())
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def pending_counts(self) -> Dict[str, int]:
+        """Số task pending theo client_name"""
+        with self.lock:
+            return {row["client_name"]: row["count"] for row in self.conn.execute(
+                "SELECT client_name, COUNT(*) AS count FROM tasks WHERE status = ? GROUP BY client_name",
+                (PENDING,))}
+
+    def is_empty(self, ignore_prefix: Optional[str] = None) -> bool:
+        """Chưa có task nào; ignore_prefix: bỏ qua task có id bắt đầu bằng prefix (task tổng hợp của server)"""
+        with self.lock:
+            if ignore_prefix:
+                return self.conn.execute("SELECT 1 FROM tasks WHERE substr(id, 1, ?) != ? LIMIT 1",
+                                         (len(ignore_prefix), ignore_prefix)).fetchone() is None
+            return self.conn.execute("SELECT 1 FROM tasks LIMIT 1").fetchone() is None
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            by_status = {row["status"]: row["count"] for row in self.conn.execute(
+                "SELECT status, COUNT(*) AS count FROM tasks GROUP BY status")}
+            oldest = self.conn.execute(
+                "SELECT MIN(created_at) AS created_at FROM tasks WHERE status = ?", (PENDING,)).fetchone()
+            counters = dict(self.counters)
+        return {
+            "path": self.path,
+            "lease_seconds": self.lease_seconds,
+            "max_attempts": self.max_attempts,
+            "by_status": by_status,
+            "oldest_pending_seconds": round(time.time() - oldest["created_at"], 3) if oldest["created_at"] else 0.0,
+            **counters,
+        }
@@ -0,0 +1,137 @@
+# core/upload_ingest.py - Nhận ảnh upload theo stream: copy theo chunk ngoài event loop, dedupe sha256, ghi atomic
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+DEFAULT_UPLOAD_ROOT = os.path.join("statics", "uploads")
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_FILE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_REQUEST_BYTES = 256 * 1024 * 1024
+OBJECTS_DIR = "_objects"
+TMP_DIR = "_tmp"
+
+
+class UploadTooLargeError(Exception):
+    """File hoặc tổng request vượt giới hạn kích thước"""
+
+
+class UploadIngestor:
+    """
+    Ghi ảnh upload vào <root>/<task_id>/<file_name>:
+    - đọc UploadFile.file (starlette đã spool ra đĩa) theo chunk trong threadpool, không chặn event loop
+      và không đọc cả file vào bộ nhớ
+    - tính sha256 trong lúc copy; nội dung lưu một lần ở <root>/_objects/<sha[:2]>/<sha><ext>,
+      file của task là hard link tới object (copy nếu filesystem không hỗ trợ link)
+    - ghi vào _tmp rồi os.replace nên không bao giờ thấy file ghi dở
+    - vượt max_file_bytes / max_request_bytes -> UploadTooLargeError, file tạm bị xóa
+    """
+
+    def __init__(self, root: str = DEFAULT_UPLOAD_ROOT, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_file_bytes: int = DEFAULT_MAX_FILE_BYTES, max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.lock = threading.Lock()
+        self.stats = {"files": 0, "bytes": 0, "deduplicated": 0, "deduplicated_bytes": 0, "rejected": 0}
+
+    @classmethod
+    def from_env(cls) -> 'UploadIngestor':
+        return cls(
+            root=os.environ.get("UPLOAD_ROOT", DEFAULT_UPLOAD_ROOT),
+            max_file_bytes=int(os.environ.get("UPLOAD_MAX_FILE_MB", DEFAULT_MAX_FILE_BYTES // 1048576)) * 1048576,
+            max_request_bytes=int(os.environ.get("UPLOAD_MAX_REQUEST_MB",
+                                                 DEFAULT_MAX_REQUEST_BYTES // 1048576)) * 1048576,
+        )
+
+    def check_content_length(self, content_length: Optional[str]) -> None:
+        """Từ chối sớm theo header Content-Length, trước khi starlette parse multipart"""
+        if content_length and content_length.isdigit() and int(content_length) > self.max_request_bytes:
+            self._count("rejected", 1)
+            raise UploadTooLargeError(
+                f"Request body {int(content_length):,} bytes exceeds limit {self.max_request_bytes:,} bytes")
+
+    def _count(self, key: str, amount: int) -> None:
+        with self.lock:
+            self.stats[key] += amount
+
+    def object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, OBJECTS_DIR, digest[:2], digest + ext)
+
+    def ingest_file(self, source, task_id: str, file_name: str, budget: int) -> Dict[str, Any]:
+        """Copy đồng bộ từ file object source (chạy trong threadpool), budget = số byte request còn được nhận"""
+        tmp_dir = os.path.join(self.root, TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        limit = min(self.max_file_bytes, budget)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as out:
+                while True:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > limit:
+                        raise UploadTooLargeError(
+                            f"Upload '{file_name}' exceeds limit {limit:,} bytes "
+                            f"({'file' if limit == self.max_file_bytes else 'request'} limit)")
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            sha256 = digest.hexdigest()
+            ext = os.path.splitext(file_name)[1].lower()
+            object_path = self.object_path(sha256, ext)
+            deduplicated = os.path.exists(object_path)
+            if deduplicated:
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                os.replace(tmp_path, object_path)
+
+            task_dir = os.path.join(self.root, os.path.basename(task_id))
+            os.makedirs(task_dir, exist_ok=True)
+            final_path = os.path.join(task_dir, file_name)
+            link_tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+            try:
+                os.link(object_path, link_tmp)
+            except OSError:
+                shutil.copyfile(object_path, link_tmp)
+            os.replace(link_tmp, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._count("files", 1)
+        self._count("bytes", size)
+        if deduplicated:
+            self._count("deduplicated", 1)
+            self._count("deduplicated_bytes", size)
+        return {"path": final_path, "file_name": file_name, "size": size, "sha256": sha256,
+                "deduplicated": deduplicated}
+
+    async def ingest(self, task_id: str, uploads: Optional[List[Any]]) -> List[Dict[str, Any]]:
+        """Nhận tất cả UploadFile của một request, áp giới hạn tổng max_request_bytes"""
+        results: List[Dict[str, Any]] = []
+        remaining = self.max_request_bytes
+        for upload in uploads or []:
+            file_name = os.path.basename(upload.filename or "") or f"{uuid.uuid4().hex}.bin"
+            try:
+                result = await run_in_threadpool(self.ingest_file, upload.file, task_id, file_name, remaining)
+            except UploadTooLargeError:
+                self._count("rejected", 1)
+                raise
+            remaining -= result["size"]
+            results.append(result)
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats)
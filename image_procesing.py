@@ -7,8 +7,13 @@ from utils.enhanced_logger_manager import get_task_logger, enhanced_logger_manag
 from typing import Dict, Any, Optional, Tuple, List
 import os
 import logging
-import re
 from utils.path_utils import normalize_path
+from utils.mockup_naming import LABELS, generate_image_filename, output_names
+from utils.image_convert import convert_image_bounded
+from utils.scratch_space import get_scratch_space
+from utils.deadline import TaskDeadline, TaskTimeoutError
+from utils.metrics import track_stage
+from utils.tracing import tracer
 from PIL import Image
 import time
 import traceback
@@ -17,37 +22,47 @@ from lib.photoshop_automation import PhotoshopAutomation
 # Main logger for this module (if needed for setup issues, though task_logger is preferred)
 module_logger = logging.getLogger(__name__)
 
-LABELS = [
-    "best-selling",
-    "fashion-forward",
-    "high-quality",
-    "latest-model",
-    "new-arrival",
-    "premium-grade",
-    "top-rated",
-    "trendy"
-]
-
 try:
     LANCZOS = Image.Resampling.LANCZOS
 except AttributeError:
     LANCZOS = Image.LANCZOS
 
-def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
+def _attach_failure_logs(error: BaseException, task_id: str, start_time: float, status: str) -> None:
+    """Gắn log_data vào exception (đọc trước khi cleanup logger) để worker gửi log của task failed/timeout"""
+    try:
+        error.log_data = {
+            'task_id': task_id,
+            'processing_time': time.time() - start_time,
+            'status': status,
+            'error': str(error),
+            'logs': enhanced_logger_manager.get_task_logs(task_id),
+            'log_string': enhanced_logger_manager.get_task_logs_string(task_id),
+        }
+    except AttributeError:
+        pass
+
+def process_task(task: Base_task, deadline: Optional[TaskDeadline] = None) -> Tuple[List[str], Dict[str, Any]]:
     """
     Process task và trả về kết quả cùng với logs.
     Args:
         task (Base_task): The task object to process.
+        deadline (Optional[TaskDeadline]): Deadline của task, được check trước mỗi PSD và mỗi conversion.
     Returns:
         Tuple[list, Dict[str, Any]]: A tuple containing (output_images_paths, log_data_dict).
                                      output_images_paths is a list of paths to the generated images.
                                      log_data_dict contains detailed logs for the task.
     Raises:
+        TaskTimeoutError: If the deadline expires (not retried).
         Exception: If processing fails after all retries.
     """
     task_id = str(task.id)
+    if deadline is None:
+        deadline = TaskDeadline(None, task_id)
     # Obtain the dedicated logger for this specific task
     task_logger = get_task_logger(task_id)
+    # PNG export và file convert nằm trong thư mục tạm của task, chỉ output cuối cùng được chuyển ra export folder
+    scratch = get_scratch_space()
+    work_dir = scratch.task_dir(task_id)
     max_retries = 3
     retry_delay = 5  # seconds
     output_images: List[str] = [] # Explicitly type the list
@@ -62,6 +77,7 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
         task_logger.info(f"🔁 Processing Attempt #{attempt}/{max_retries} for task {task_id}")
 
         try:
+            deadline.check("render")
             # --- Setup and Configuration ---
             mockup_folder_base = ConfigLoader().get_config_value("app.mockup_folder", "")
             mockup_folder = os.path.join(mockup_folder_base, f"{task.store}-{task.product_type}")
@@ -87,22 +103,27 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
             task_logger.info(f"📄 PSD Files Found | Count: {len(psd_files)}, Files: {psd_files}")
 
             # --- Photoshop Processing Loop ---
-            with PhotoshopAutomation(task_logger) as photoshop:
+            with tracer.traced(PhotoshopAutomation(task_logger), "photoshop", task_id=task_id) as photoshop:
                 task_logger.info("🎨 Establishing connection with Photoshop application...")
                 # Assuming PhotoshopAutomation logs its own connection status internally
 
                 processed_psd_count = 0
+                # Slug và export folder giống nhau cho mọi PSD của task; tên không dấu được thì dùng task id
+                slug_name = create_slug(task.product_name) or f"product-{create_slug(str(task_id))}"
+                export_folder = normalize_path(os.path.join(ConfigLoader().get_config_value("app.output_folder", ""), slug_name))
+                os.makedirs(export_folder, exist_ok=True)
                 for i, psd_filename in enumerate(psd_files, 1):
+                    deadline.check(f"render {psd_filename}")
                     task_logger.info(f"🔧 PSD Processing | File {i}/{len(psd_files)}: '{psd_filename}'")
                     psd_path = normalize_path(os.path.join(mockup_folder, psd_filename))
-                    slug_name = create_slug(task.product_name)
-                    image_name = generate_image_filename(psd_filename, slug_name, LABELS)
+                    # Tên không trùng với task khác đang ghi vào cùng export folder (giữ tới khi worker upload xong)
+                    image_name = output_names.allocate(export_folder, generate_image_filename(psd_filename, slug_name, LABELS),
+                                                       owner=str(task_id), key=psd_filename)
                     # Ensure task.downloaded_image_path is absolute or relative to the correct base
                     image_files_input = normalize_path(os.path.join(current_path, task.downloaded_image_path))
-                    export_folder = normalize_path(os.path.join(ConfigLoader().get_config_value("app.output_folder", ""), slug_name))
 
                     task_logger.debug(f"   📥 Input Image Path: {image_files_input}")
-                    task_logger.debug(f"   📤 Export Destination: {export_folder}")
+                    task_logger.debug(f"   📤 Export Destination: {export_folder} (work dir: {work_dir})")
                     task_logger.debug(f"   🏷️ Generated Output Name: {image_name}")
 
                     # Validate input image
@@ -112,20 +133,22 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
                         # Continue to next PSD file instead of failing the whole task
                         continue
 
-                    # Ensure export folder exists
-                    os.makedirs(export_folder, exist_ok=True)
-                    task_logger.debug(f"   ✅ Verified export folder exists: {export_folder}")
+                    # Ensure work dir exists
+                    os.makedirs(work_dir, exist_ok=True)
+                    task_logger.debug(f"   ✅ Verified work dir exists: {work_dir}")
 
                     # Execute Photoshop action
                     task_logger.info(f"   🎨 Executing Photoshop Automation for '{psd_filename}'...")
                     try:
                         # Assuming make_mockup_image returns a list of generated file paths
-                        generated_image_paths = photoshop.make_mockup_image(
-                            psd_file=psd_path,
-                            image_files=[image_files_input], # Ensure list format if required
-                            export_folder=export_folder,
-                            output_names=[image_name]
-                        )
+                        with track_stage("render", task.store, task.product_type), \
+                                tracer.span("make_mockup_image", task_id=task_id, psd=psd_filename):
+                            generated_image_paths = photoshop.make_mockup_image(
+                                psd_file=psd_path,
+                                image_files=[image_files_input], # Ensure list format if required
+                                export_folder=work_dir,
+                                output_names=[image_name]
+                            )
                         processed_psd_count += 1
 
                         if generated_image_paths:
@@ -151,13 +174,28 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
             task_logger.info(f"✅ Core Processing Completed | Attempt #{attempt} successful")
             break # Exit retry loop on success
 
+        except TaskTimeoutError as e:
+            # Deadline hết: không retry, giải phóng slot ngay
+            task_logger.error(f"⏰ Deadline Exceeded | {e}")
+            _attach_failure_logs(e, task_id, start_time, 'timeout')
+            enhanced_logger_manager.cleanup_task_logger(task_id)
+            scratch.release(task_id)
+            raise
+
         except Exception as e:
             error_msg = str(e)
             # Log the full traceback for debugging within the task log
             task_logger.error(f"❌ Attempt #{attempt} Failed | Error: {error_msg}", exc_info=True)
             if attempt < max_retries:
                 task_logger.warning(f"⏳ Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                try:
+                    deadline.sleep(retry_delay, stage="retry")
+                except TaskTimeoutError as timeout_error:
+                    task_logger.error(f"⏰ Deadline Exceeded | {timeout_error}")
+                    _attach_failure_logs(timeout_error, task_id, start_time, 'timeout')
+                    enhanced_logger_manager.cleanup_task_logger(task_id)
+                    scratch.release(task_id)
+                    raise
             else:
                 task_logger.error(f"💥 All {max_retries} attempts failed. Aborting task {task_id}.")
                 # Prepare log data indicating failure
@@ -172,7 +210,11 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
                 }
                 # Ensure cleanup happens even on final failure
                 enhanced_logger_manager.cleanup_task_logger(task_id)
-                raise Exception(f"Max retries reached for task {task_id}. Final error: {error_msg}") from e
+                scratch.release(task_id)
+                failure = Exception(f"Max retries reached for task {task_id}. Final error: {error_msg}")
+                # Worker gửi log của task failed qua log shipper
+                failure.log_data = log_data_failure
+                raise failure from e
 
     # --- Image Conversion (WebP) ---
     task_logger.info("-" * 30)
@@ -185,6 +227,14 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
     for i, original_image_path in enumerate(output_images, 1):
         original_image_path = normalize_path(original_image_path) # Normalize again for safety
         filename = os.path.basename(original_image_path)
+        try:
+            deadline.check(f"convert {filename}")
+        except TaskTimeoutError as timeout_error:
+            task_logger.error(f"⏰ Deadline Exceeded | {timeout_error}")
+            _attach_failure_logs(timeout_error, task_id, start_time, 'timeout')
+            enhanced_logger_manager.cleanup_task_logger(task_id)
+            scratch.release(task_id)
+            raise
         task_logger.info(f"🖼️ Converting Image {i}/{len(output_images)}: '{filename}'")
 
         if original_image_path.lower().endswith(".webp"):
@@ -199,14 +249,12 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
 
         try:
             task_logger.info(f"   🔄 Initiating Conversion | '{filename}' -> '{os.path.basename(webp_output_path)}'")
-            convert_image_with_alpha(original_image_path, webp_output_path, task_logger=task_logger)
+            with track_stage("convert", task.store, task.product_type), \
+                    tracer.span("convert_image_with_alpha", task_id=task_id, file=filename):
+                convert_image_with_alpha(original_image_path, webp_output_path, task_logger=task_logger)
             converted_images.append(webp_output_path)
             conversion_success_count += 1
-
-            # Remove original file after successful conversion
-            if os.path.exists(original_image_path) and original_image_path != webp_output_path:
-                os.remove(original_image_path)
-                task_logger.debug(f"   🗑️ Deleted Original File: '{filename}'")
+            # File gốc nằm trong work dir, xoá cùng cả thư mục khi release
 
         except Exception as conversion_error:
              conversion_error_count += 1
@@ -215,6 +263,12 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
              # Keep the original file if conversion fails
              converted_images.append(original_image_path)
 
+    # --- Promote final outputs ---
+    try:
+        converted_images = scratch.promote(task_id, converted_images, export_folder)
+        task_logger.info(f"📦 Moved {len(converted_images)} final image(s) to '{export_folder}'")
+    finally:
+        scratch.release(task_id)
 
     # --- Finalization ---
     processing_time = time.time() - start_time
@@ -255,35 +309,7 @@ def process_task(task: Base_task) -> Tuple[List[str], Dict[str, Any]]:
 
 # --- Helper Functions (Logging improvements minor) ---
 
-def get_index_from_filename(mockup_filename: str) -> Optional[int]:
-    """
-    Tìm số thứ tự (1-2-3...) trong tên file mockup, ví dụ JacketWow-MK-3.psd -> 3
-    """
-    match = re.search(r'-MK-(\d+)', mockup_filename, re.IGNORECASE)
-    if match:
-        index = int(match.group(1))
-        # module_logger.debug(f"Extracted index {index} from filename '{mockup_filename}'")
-        return index
-    # module_logger.debug(f"No index found in filename '{mockup_filename}'")
-    return None
-
-def generate_image_filename(mockup_filename: str, image_filename: str, labels: list, default_label: str = "main") -> str:
-    """
-    Sinh tên file ảnh mới dựa vào tên mockup, tên file ảnh và danh sách label.
-    """
-    idx = get_index_from_filename(mockup_filename)
-    if idx is not None and 1 <= idx <= len(labels):
-        label = labels[idx-1]
-        # module_logger.debug(f"Label '{label}' selected for index {idx} from filename '{mockup_filename}'")
-    else:
-        label = default_label
-        # module_logger.debug(f"Default label '{default_label}' used for filename '{mockup_filename}' (index: {idx})")
-    slug = label
-    generated_name = f"{image_filename}-{slug}"
-    # module_logger.debug(f"Generated filename: '{generated_name}' from mockup '{mockup_filename}', base '{image_filename}'")
-    return generated_name
-
-def convert_image_with_alpha(input_path: str, output_path: str, resize_to: Tuple[int, int] = (1024, 1024), quality: int = 85, task_logger: Optional[logging.Logger] = None):
+def convert_image_with_alpha(input_path: str, output_path: str, resize_to: Tuple[int, int] = (1024, 1024), quality: int = 85, task_logger: Optional[logging.Logger] = None, low_memory: Optional[bool] = None):
     """
     Convert image to WebP với alpha channel và logging chi tiết.
     Args:
@@ -292,17 +318,33 @@ def convert_image_with_alpha(input_path: str, output_path: str, resize_to: Tuple
         resize_to (Tuple[int, int]): Kích thước mục tiêu (width, height). Mặc định (1024, 1024).
         quality (int): Chất lượng WebP (0-100). Mặc định 85.
         task_logger (Optional[logging.Logger]): Logger cụ thể cho task. Nếu None, dùng logger module.
+        low_memory (Optional[bool]): Dùng conversion giới hạn bộ nhớ (utils.image_convert).
+                                     Nếu None, đọc từ config settings.low_memory_conversion.
     Raises:
         Exception: Nếu có lỗi trong quá trình mở, xử lý hoặc lưu ảnh.
     """
     if task_logger is None:
         task_logger = module_logger # Fallback to module logger if task logger not provided
+    if low_memory is None:
+        low_memory = bool(ConfigLoader().get_config_value("settings.low_memory_conversion", False))
 
     input_filename = os.path.basename(input_path)
     output_filename = os.path.basename(output_path)
     task_logger.info(f"🔄 WebP Conversion | '{input_filename}' -> '{output_filename}'")
     task_logger.debug(f"   📏 Resize Target: {resize_to[0]}x{resize_to[1]}px, Quality: {quality}")
 
+    if low_memory:
+        try:
+            convert_image_bounded(input_path, output_path, resize_to=resize_to, quality=quality, task_logger=task_logger)
+            return
+        except FileNotFoundError as fnf_error:
+            task_logger.error(f"   ❌ File Not Found Error | {fnf_error}")
+            raise
+        except Exception as e:
+            error_msg = f"Error during conversion of '{input_filename}': {e}"
+            task_logger.error(f"   💥 Conversion Failed | {error_msg}", exc_info=True)
+            raise Exception(error_msg) from e
+
     try:
         task_logger.debug(f"   🖼️ Opening source image: '{input_filename}'")
         img = Image.open(input_path).convert("RGBA")
@@ -1,47 +1,220 @@
 import json
-from typing import Dict, Any, Optional, List
+import math
+from typing import Dict, Any, Optional, List, Iterable, Tuple
 from pathlib import Path
-from dataclasses import dataclass
-from pydantic import BaseModel
+from dataclasses import dataclass, replace
+from operator import itemgetter
+
+# Version của dict task do to_dict ghi ra (file task, task store).
+# 1: dict cũ không có "schema_version" (final_image có thể là một chuỗi)
+TASK_SCHEMA_VERSION = 2
+
+# Schema dùng chung cho worker (Base_task) và server (validate task khi enqueue):
+# name -> (kiểu hợp lệ, giá trị mặc định). Field không có trong dict được điền mặc định.
+TASK_FIELD_SCHEMA: Dict[str, Tuple[tuple, Any]] = {
+    "id": ((str, int), ""),
+    "product_name": ((str,), ""),
+    "product_type": ((str,), ""),
+    "final_image": ((list, tuple), ()),
+    "status": ((str,), "pending"),
+    "store": ((str,), ""),
+    "downloaded_image_path": ((str,), ""),
+    "message": ((str,), ""),
+    "priority": ((str, int, float), "normal"),
+    "image_url": ((str,), ""),
+}
+# Priority dạng tên hoặc số (số lớn hơn = ưu tiên hơn), dùng chung với utils.task_scheduler
+PRIORITY_NAMES = {
+    "low": 0,
+    "normal": 5,
+    "high": 10,
+    "urgent": 20,
+}
+PRIORITY_RANGE = (0, 100)
+BASE_TASK_FIELDS = ("id", "product_name", "product_type", "final_image", "status", "store",
+                    "downloaded_image_path", "message")
+
+
+class TaskValidationError(ValueError):
+    """Dict task sai kiểu field hoặc có schema_version mới hơn code đang chạy"""
+
+
+def _priority_error(value: Any) -> Optional[str]:
+    """Lỗi của priority: tên trong PRIORITY_NAMES hoặc số (kể cả chuỗi số) trong PRIORITY_RANGE"""
+    if isinstance(value, bool):
+        return "expected str/int/float, got bool"
+    if isinstance(value, str):
+        if value.strip().lower() in PRIORITY_NAMES or not value.strip():
+            return None
+        try:
+            value = float(value)
+        except ValueError:
+            return f"unknown priority {value!r} (expected {'/'.join(PRIORITY_NAMES)} or a number)"
+    low, high = PRIORITY_RANGE
+    if not math.isfinite(value) or not low <= value <= high:
+        return f"{value!r} out of range [{low}, {high}]"
+    return None
+
+
+def validate_task_dict(data: Any, fields: Iterable[str] = tuple(TASK_FIELD_SCHEMA)) -> None:
+    """Kiểm tra kiểu các field có mặt (None coi như thiếu). Raises TaskValidationError kèm danh sách lỗi."""
+    if not isinstance(data, dict):
+        raise TaskValidationError(f"Task must be an object, got {type(data).__name__}")
+    errors = []
+    for name in fields:
+        value = data.get(name)
+        types = TASK_FIELD_SCHEMA[name][0]
+        if value is not None and not isinstance(value, types):
+            errors.append(f"{name}: expected {'/'.join(t.__name__ for t in types)}, got {type(value).__name__}")
+        elif name == "final_image" and value is not None and not all(isinstance(item, str) for item in value):
+            errors.append("final_image: expected list of str")
+        elif name == "priority" and value is not None:
+            error = _priority_error(value)
+            if error:
+                errors.append(f"priority: {error}")
+    version = data.get("schema_version", 1)
+    if not isinstance(version, int) or version > TASK_SCHEMA_VERSION:
+        errors.append(f"schema_version: unsupported {version!r} (current {TASK_SCHEMA_VERSION})")
+    if errors:
+        raise TaskValidationError("; ".join(errors))
+
+
+def _upgrade_v1(data: Dict[str, Any]) -> Dict[str, Any]:
+    """v1 -> v2: final_image dạng chuỗi đơn -> list"""
+    if isinstance(data.get("final_image"), str):
+        data = {**data, "final_image": [data["final_image"]] if data["final_image"] else []}
+    return data
+
+
+# version -> hàm nâng dict lên version kế tiếp
+_UPGRADES = {1: _upgrade_v1}
+
+
+def upgrade_task_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Nâng dict task về TASK_SCHEMA_VERSION (không sửa dict gốc)"""
+    version = data.get("schema_version", 1)
+    while isinstance(version, int) and version < TASK_SCHEMA_VERSION:
+        data = _UPGRADES[version](data)
+        version += 1
+    return data
+
 
 @dataclass
 class Base_task():
+    """
+    Task của worker. __slots__: không có __dict__ mỗi instance, không thêm được attribute lạ.
+    final_image là tuple; to_dict() trả về list như trước. Không dùng frozen vì __init__ của dataclass
+    frozen (object.__setattr__ từng field) chậm gấp ~3 lần; đổi giá trị nên dùng with_changes().
+    """
+    __slots__ = BASE_TASK_FIELDS
+
     id: str
     product_name: str
     product_type: str
-    final_image: List [str] 
+    final_image: Tuple[str, ...]
     status: str
     store: str
     downloaded_image_path: str
     message: str
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert the task to a dictionary."""
         return {
             "id": self.id,
             "product_name": self.product_name,
             "product_type": self.product_type,
-            "final_image": self.final_image,
+            "final_image": list(self.final_image),
             "status": self.status,
             "store": self.store,
             "downloaded_image_path": self.downloaded_image_path,
-            "message": self.message
+            "message": self.message,
+            "schema_version": TASK_SCHEMA_VERSION,
         }
+
+    def with_changes(self, **changes) -> 'Base_task':
+        """Bản sao với các field thay đổi, không sửa instance đang được dùng chung"""
+        if "final_image" in changes:
+            changes["final_image"] = tuple(changes["final_image"])
+        return replace(self, **changes)
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Base_task':
-        """Create a task from a dictionary."""
-        return cls(
-            id=data.get("id", ""),
-            product_name=data.get("product_name", ""),
-            product_type=data.get("product_type", ""),
-            final_image=data.get("final_image", []),
-            status=data.get("status", "pending"),
-            store=data.get("store", ""),
-            downloaded_image_path=data.get("downloaded_image_path", ""),
-            message=data.get("message", "")
-        )
-
-class TaskCreate(BaseModel):
-    id: str
-    product_name: str
-    product_type: str
-    webhook_url: str = ""
\ No newline at end of file
+        """Create a task from a dictionary (validate theo TASK_FIELD_SCHEMA, field thừa được bỏ qua)."""
+        return decode_task(data)
+
+
+_GET_FIELDS = itemgetter(*BASE_TASK_FIELDS)
+_DEFAULTS = tuple(TASK_FIELD_SCHEMA[name][1] for name in BASE_TASK_FIELDS)
+
+
+def decode_task(data: Dict[str, Any]) -> Base_task:
+    """
+    Dict -> Base_task. Đường nhanh khi dict đủ field và đúng kiểu (một itemgetter, kiểm tra type trực tiếp);
+    thiếu field / dict version cũ / sai kiểu thì qua đường đầy đủ: upgrade, validate, điền mặc định.
+
+    Raises:
+        TaskValidationError: Nếu field sai kiểu hoặc schema_version mới hơn TASK_SCHEMA_VERSION.
+    """
+    if type(data) is not dict:
+        validate_task_dict(data)
+    if data.get("schema_version") == TASK_SCHEMA_VERSION:
+        try:
+            values = _GET_FIELDS(data)
+        except KeyError:
+            values = None
+        if values is not None:
+            task_id, product_name, product_type, final_image, status, store, downloaded_image_path, message = values
+            if (type(task_id) is str and type(product_name) is str and type(product_type) is str
+                    and type(status) is str and type(store) is str and type(downloaded_image_path) is str
+                    and type(message) is str and type(final_image) in (list, tuple)
+                    and all(type(item) is str for item in final_image)):
+                return Base_task(task_id, product_name, product_type, tuple(final_image), status, store,
+                                 downloaded_image_path, message)
+
+    data = upgrade_task_dict(data)
+    validate_task_dict(data, BASE_TASK_FIELDS)
+    values = tuple(default if data.get(name) is None else data[name]
+                   for name, default in zip(BASE_TASK_FIELDS, _DEFAULTS))
+    return Base_task(str(values[0]), values[1], values[2], tuple(values[3]), *values[4:])
+
+
+def decode_tasks(items: Iterable[Dict[str, Any]], skip_invalid: bool = False,
+                 errors: Optional[List[str]] = None) -> List[Base_task]:
+    """
+    Decode cả list (response batch claim, file task). skip_invalid=True: bỏ qua item lỗi
+    (ghi lý do vào errors nếu truyền vào) thay vì raise ở item đầu tiên.
+    """
+    if not skip_invalid:
+        return [decode_task(item) for item in items]
+    tasks = []
+    for index, item in enumerate(items):
+        try:
+            tasks.append(decode_task(item))
+        except TaskValidationError as e:
+            if errors is not None:
+                errors.append(f"#{index}: {e}")
+    return tasks
+
+
+def decode_tasks_jsonl(lines: Iterable[str], skip_invalid: bool = False,
+                       errors: Optional[List[str]] = None) -> List[Base_task]:
+    """Decode JSONL (mỗi dòng một task dict); dòng trống được bỏ qua"""
+    loads = json.loads
+    items = []
+    for index, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            items.append(loads(line))
+        except ValueError as e:
+            if not skip_invalid:
+                raise TaskValidationError(f"line {index + 1}: invalid JSON ({e})")
+            if errors is not None:
+                errors.append(f"line {index + 1}: invalid JSON")
+    return decode_tasks(items, skip_invalid=skip_invalid, errors=errors)
+
+
+def load_tasks_jsonl(path: Path, skip_invalid: bool = True) -> List[Base_task]:
+    """Đọc file JSONL task"""
+    with open(path, "r", encoding="utf-8") as f:
+        return decode_tasks_jsonl(f, skip_invalid=skip_invalid)
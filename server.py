@@ -1,24 +1,137 @@
-from fastapi import FastAPI , UploadFile, File, Form
-from fastapi.staticfiles import StaticFiles
-from typing import List, Optional
+from fastapi import FastAPI , UploadFile, File, Form, Request, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional
+from core.load_test import ROUTES, load_test_state
+from core.task_queue import LEASED, RESULT_STATUSES, LeaseLostError, SQLiteTaskQueue
+from core.upload_ingest import UploadIngestor, UploadTooLargeError
+from core.image_serving import ImageServer
+from core.task_events import TaskEventBroker
+from core.derivatives import DerivativePipeline
+from utils.response_util import stream_json_response
+from utils.log_shipper import rebuild_log_string
+from models.task import TaskValidationError, validate_task_dict
 app = FastAPI()
 import uuid
 import os
+import random
+import gzip
+import json
+import asyncio
+import logging
 
-# Cho phép truy cập file tĩnh trong thư mục uploads
-app.mount("/images", StaticFiles(directory="statics/uploads"), name="images")
+logger = logging.getLogger(__name__)
+
+# Thumbnail / định dạng phụ sinh nền trong process pool (DERIVATIVE_SPECS, DERIVATIVE_WORKERS, DERIVATIVE_QUEUE_SIZE)
+derivative_pipeline = DerivativePipeline.from_env()
+# Ảnh trong statics/uploads: ETag theo content hash, 304, Range, biến thể ?w=&h= (resize qua derivative_pipeline)
+# Biến thể chưa có: chờ job trong pool tối đa IMAGE_VARIANT_WAIT giây rồi mới trả ảnh gốc
+image_server = ImageServer(derivatives=derivative_pipeline,
+                           variant_wait=float(os.environ.get("IMAGE_VARIANT_WAIT", "10")))
+
+@app.api_route("/images/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_image(file_path: str, request: Request, w: Optional[int] = None, h: Optional[int] = None):
+    return await image_server.serve(request, file_path, w, h)
+
+SYNTHETIC_STORES = ["store-a", "store-b", "store-c"]
+SYNTHETIC_PRIORITIES = ["low", "normal", "normal", "high", "urgent"]
+SYNTHETIC_ID_PREFIX = "synthetic-"
+
+# Hàng đợi task có lease (SQLite), cấu hình qua TASK_QUEUE_DB / TASK_LEASE_SECONDS / TASK_MAX_ATTEMPTS
+task_queue = SQLiteTaskQueue.from_env()
+# Ảnh upload: stream theo chunk, dedupe sha256, giới hạn UPLOAD_MAX_FILE_MB / UPLOAD_MAX_REQUEST_MB
+upload_ingestor = UploadIngestor.from_env()
+# Thông báo có task qua SSE để worker không phải poll liên tục
+task_events = TaskEventBroker()
+TASK_REAP_INTERVAL = float(os.environ.get("TASK_REAP_INTERVAL", "10"))
+UPLOAD_ROUTE_SUFFIXES = ("/update-task/", "/update_task")
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Từ chối body quá lớn trước khi starlette spool multipart ra đĩa
+    if request.method in ("PATCH", "POST") and request.url.path.endswith(UPLOAD_ROUTE_SUFFIXES):
+        try:
+            upload_ingestor.check_content_length(request.headers.get("content-length"))
+        except UploadTooLargeError as e:
+            return JSONResponse(status_code=413, content={"detail": str(e)})
+    return await call_next(request)
+
+def injected_error() -> JSONResponse:
+    return JSONResponse(status_code=503, content={"detail": "Injected error"})
 
 @app.get("/get_task/{client_name}")
-def get_product(client_name: str):
-    # Dữ liệu này có thể lấy từ DB, file hoặc hard-code như ví dụ này
-    return {
-        "id": "1234",
+async def get_product(client_name: str, priority: Optional[str] = None):
+    # Route cũ, giữ để tương thích: dùng chung hàng đợi với pending-longest
+    return await pending_longest(client_name, priority=priority)
+
+@app.get("/{client_name}/pending-longest/")
+async def pending_longest(client_name: str, priority: Optional[str] = None, store: Optional[str] = None,
+                          worker_id: str = ""):
+    if await load_test_state.inject("pending-longest"):
+        return injected_error()
+    if load_test_state.seeded:
+        # Load test: phát lần lượt các task đã seed, hết thì 404 như server thật
+        task = load_test_state.claim()
+        if task is None:
+            return JSONResponse(status_code=404, content={"detail": "No pending tasks"})
+        return task
+    task = await run_in_threadpool(task_queue.claim, client_name, worker_id, store, priority)
+    if task is not None:
+        return task
+    if not await run_in_threadpool(task_queue.is_empty, SYNTHETIC_ID_PREFIX):
+        return JSONResponse(status_code=404, content={"detail": "No pending tasks"})
+    # Hàng đợi chưa có task thật: task tổng hợp với priority/store ngẫu nhiên để test scheduler của worker
+    # Enqueue rồi claim để task có lease, update-task của worker tìm thấy task như task thật
+    synthetic = {
+        "id": SYNTHETIC_ID_PREFIX + uuid.uuid4().hex[:12],
         "product_name": "test",
         "product_type": "test",
-        "store": "test",
-        "status": "pending",
-        "image_url": f"http://localhost:8000/images/image.png"
+        "store": store or random.choice(SYNTHETIC_STORES),
+        "priority": priority or random.choice(SYNTHETIC_PRIORITIES),
+        "image_url": "/images/image.png"
+    }
+    await run_in_threadpool(task_queue.enqueue, client_name, [synthetic])
+    task = await run_in_threadpool(task_queue.claim, client_name, worker_id, store, priority)
+    if task is None:
+        return JSONResponse(status_code=404, content={"detail": "No pending tasks"})
+    return task
+
+async def complete_queued_task(task_id: str, status: str, message: str, images: Optional[List[UploadFile]],
+                               lease_token: Optional[str]) -> JSONResponse:
+    existing = await run_in_threadpool(task_queue.get, task_id)
+    if existing is None:
+        return JSONResponse(status_code=404, content={"detail": f"Task {task_id} not found"})
+    if status not in RESULT_STATUSES:
+        # Status trung gian (processing, ...): không kết thúc task, không lưu ảnh kèm theo
+        try:
+            record = await run_in_threadpool(task_queue.report_progress, task_id, status, message, lease_token)
+        except LeaseLostError as e:
+            return JSONResponse(status_code=409, content={"detail": str(e)})
+        return JSONResponse(content=record)
+    if existing.get("completed_at") is not None:
+        # Worker gửi lại (retry sau timeout): trả kết quả cũ, không ghi đè ảnh
+        return JSONResponse(content={**existing, "duplicate": True})
+    if lease_token and existing["status"] == LEASED and existing.get("lease_token") != lease_token:
+        # Worker cũ mất lease: từ chối trước khi ghi ảnh, không ghi đè file của worker đang giữ task
+        return JSONResponse(status_code=409, content={"detail": f"Task {task_id} was re-leased to another worker"})
+    try:
+        ingested = await upload_ingestor.ingest(task_id, images)
+    except UploadTooLargeError as e:
+        return JSONResponse(status_code=413, content={"detail": str(e)})
+    saved_images = [item["path"] for item in ingested]
+    try:
+        record = await run_in_threadpool(task_queue.complete, task_id, status, message, saved_images, lease_token)
+    except LeaseLostError as e:
+        return JSONResponse(status_code=409, content={"detail": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    # Chỉ đưa vào hàng đợi, không xử lý ảnh trong request
+    record["derivatives"] = {
+        item["file_name"]: {"sha256": item["sha256"],
+                            "state": derivative_pipeline.submit(item["path"], item["sha256"])["state"]}
+        for item in ingested
     }
+    return JSONResponse(content=record)
 
 @app.post("/update_task")
 async def update_task(
@@ -27,23 +140,199 @@ async def update_task(
     updated_at: str = Form(...),
     images: Optional[List[UploadFile]] = File(None)
 ):
-    # Xử lý data: id, status, updated_at
-    # Xử lý ảnh: images là list UploadFile (nếu có)
-    saved_images = []
-    if images:
-        for img in images:
-            filename = f"{uuid.uuid4().hex}_{img.filename}"
-            save_path = os.path.join("statics/uploads", filename)
-            with open(save_path, "wb") as f:
-                f.write(await img.read())
-            saved_images.append(save_path)
-    return {
-        "id": id,
-        "status": status,
-        "updated_at": updated_at,
-        "image_paths": saved_images
-    }
+    # Route cũ, giữ để tương thích: ghi kết quả vào hàng đợi như update-task
+    return await complete_queued_task(id, status, f"Updated at {updated_at}", images, None)
+
+@app.get("/loadtest/images/{image_key}/{file_name}")
+async def loadtest_image(image_key: str, file_name: str):
+    if await load_test_state.inject("image"):
+        return injected_error()
+    data = load_test_state.image_bytes(image_key)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return StreamingResponse(load_test_state.throttled_chunks("image", data), media_type="image/png",
+                             headers={"Content-Length": str(len(data))})
+
+@app.patch("/{client_name}/update-task/")
+async def update_task_patch(
+    client_name: str,
+    id: str = Form(...),
+    status: str = Form(...),
+    message: str = Form(""),
+    lease_token: Optional[str] = Form(None),
+    images: Optional[List[UploadFile]] = File(None)
+):
+    if await load_test_state.inject("update-task"):
+        return injected_error()
+    if not load_test_state.seeded:
+        return await complete_queued_task(id, status, message, images, lease_token)
+    uploaded_bytes = 0
+    for img in images or []:
+        # Đọc theo chunk để áp giới hạn băng thông upload; load test không lưu ảnh
+        while True:
+            chunk = await img.read(64 * 1024)
+            if not chunk:
+                break
+            uploaded_bytes += len(chunk)
+            delay = load_test_state.bandwidth_delay("update-task", len(chunk))
+            if delay:
+                await asyncio.sleep(delay)
+    load_test_state.complete(id, status, len(images or []), uploaded_bytes)
+    return {"id": id, "status": status, "message": message, "images": len(images or []),
+            "uploaded_bytes": uploaded_bytes}
+
+@app.post("/{client_name}/task-logs/")
+async def receive_task_logs(client_name: str, request: Request):
+    # Route cũ của send_logs_to_server: một task mỗi request
+    if await load_test_state.inject("task-logs"):
+        return injected_error()
+    payload = await request.json()
+    load_test_state.record_log()
+    return {"client_name": client_name, "task_id": payload.get("task_id"), "received": True}
+
+@app.post("/{client_name}/tasks/")
+def enqueue_tasks(client_name: str, tasks: List[Dict[str, Any]]):
+    # Thêm task vào hàng đợi: [{"product_name": ..., "product_type": ..., "store": ..., "image_url": ...}]
+    # Validate theo schema dùng chung với worker (models.task) trước khi ghi
+    errors = []
+    for index, task in enumerate(tasks):
+        try:
+            validate_task_dict(task)
+        except TaskValidationError as e:
+            errors.append(f"#{index}: {e}")
+    if errors:
+        return JSONResponse(status_code=422, content={"detail": errors})
+    task_ids = task_queue.enqueue(client_name, tasks)
+    task_events.publish(client_name, pending=task_queue.pending_counts().get(client_name, 0), reason="enqueued")
+    return {"client_name": client_name, "enqueued": len(task_ids), "task_ids": task_ids}
+
+@app.post("/{client_name}/tasks/{task_id}/heartbeat/")
+def heartbeat_task(client_name: str, task_id: str, payload: Dict[str, Any]):
+    # {"lease_token": ..., "extend_seconds": 300}; 409 nếu lease đã mất (hết hạn và giao cho worker khác)
+    try:
+        expires = task_queue.heartbeat(task_id, str(payload.get("lease_token", "")), payload.get("extend_seconds"))
+    except LeaseLostError as e:
+        return JSONResponse(status_code=409, content={"detail": str(e)})
+    return {"id": task_id, "lease_expires_at": expires}
+
+@app.get("/{client_name}/task-events/")
+async def stream_task_events(client_name: str):
+    # SSE: "available" khi có task mới hoặc task được trả lại hàng đợi, keepalive mỗi 15s
+    if load_test_state.seeded:
+        pending = len(load_test_state.pending)
+    else:
+        pending = (await run_in_threadpool(task_queue.pending_counts)).get(client_name, 0)
+    return StreamingResponse(task_events.stream(client_name, {"pending": pending} if pending else None),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def reap_expired_leases():
+    # Lease hết hạn (worker crash) -> task về pending, báo cho worker đang chờ
+    while True:
+        await asyncio.sleep(TASK_REAP_INTERVAL)
+        try:
+            if await run_in_threadpool(task_queue.reap):
+                for client, count in (await run_in_threadpool(task_queue.pending_counts)).items():
+                    task_events.publish(client, pending=count, reason="requeued")
+        except Exception as e:
+            logger.error(f"❌ Error reaping expired leases: {e}")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    asyncio.get_running_loop().create_task(reap_expired_leases())
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    derivative_pipeline.shutdown()
+
+@app.get("/derivatives/{sha256}")
+def derivative_status(sha256: str):
+    # Trạng thái thumbnail / định dạng phụ của một ảnh upload (sha256 trả về trong update-task)
+    if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+        raise HTTPException(status_code=400, detail="Invalid sha256")
+    return derivative_pipeline.status(sha256)
+
+@app.get("/{client_name}/tasks/")
+def list_queued_tasks(client_name: str, status: Optional[str] = None):
+    # Danh sách task có thể rất lớn: stream JSON theo batch thay vì dựng cả list
+    return stream_json_response(task_queue.iter_tasks(client_name, status), message="Tasks retrieved",
+                                meta={"client_name": client_name, "status": status})
+
+@app.get("/{client_name}/tasks/{task_id}/")
+def get_queued_task(client_name: str, task_id: str):
+    task = task_queue.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    task.pop("lease_token", None)
+    return task
+
+@app.get("/queue/stats")
+def queue_stats():
+    return {**task_queue.stats(), "uploads": upload_ingestor.get_stats(), "images": image_server.get_stats(),
+            "events": task_events.get_stats(), "derivatives": derivative_pipeline.get_stats()}
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "seeded": load_test_state.seeded, "pending": len(load_test_state.pending),
+            "queue": task_queue.stats()["by_status"]}
+
+@app.post("/loadtest/seed")
+def loadtest_seed(count: int = 100, image_size: int = 1024, alpha: bool = True, reset: bool = False):
+    if reset:
+        load_test_state.reset()
+    task_ids = load_test_state.seed(count, image_size=image_size, alpha=alpha)
+    for client in task_events.clients():
+        task_events.publish(client, pending=len(load_test_state.pending), reason="seeded")
+    return {"seeded": len(task_ids), "pending": len(load_test_state.pending)}
+
+@app.post("/loadtest/faults")
+def loadtest_faults(faults: Dict[str, Any]):
+    # {"latency_ms": 50, "jitter_ms": 20, "error_rate": 0.01, "bandwidth_kbps": 8000,
+    #  "routes": {"update-task": {"bandwidth_kbps": 2000}}}
+    unknown_routes = set(faults.get("routes", {})) - set(ROUTES)
+    if unknown_routes:
+        raise HTTPException(status_code=400, detail=f"Unknown routes: {sorted(unknown_routes)}")
+    for key in ("latency_ms", "jitter_ms", "error_rate", "bandwidth_kbps", "routes"):
+        if key in faults:
+            setattr(load_test_state.faults, key, faults[key])
+    return load_test_state.faults.to_dict()
+
+@app.get("/loadtest/stats")
+def loadtest_stats():
+    return load_test_state.stats()
+
+@app.post("/{client_name}/task-logs/batch/")
+async def receive_task_logs_batch(client_name: str, request: Request):
+    # Nhận batch log từ LogShipper của worker (body JSON, có thể nén gzip)
+    if await load_test_state.inject("task-logs"):
+        return injected_error()
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            body = gzip.decompress(body)
+        except OSError:
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+    log_dir = os.path.join("statics", "task_logs", client_name)
+    os.makedirs(log_dir, exist_ok=True)
+    saved = []
+    for entry in payload.get("entries", []):
+        task_id = str(entry.get("task_id", "unknown"))
+        # Worker bỏ log_string khi đã có logs: dựng lại để lưu giống định dạng cũ (kèm traceback)
+        if entry.get("logs") and "log_string" not in entry:
+            entry["log_string"] = rebuild_log_string(entry["logs"])
+        with open(os.path.join(log_dir, f"{os.path.basename(task_id)}.json"), "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        saved.append(task_id)
+    return {"client_name": client_name, "received": len(saved), "task_ids": saved}
 
 if __name__ == "__main__":
     import uvicorn
+    seed_count = int(os.environ.get("LOADTEST_TASKS", "0"))
+    if seed_count:
+        load_test_state.seed(seed_count, image_size=int(os.environ.get("LOADTEST_IMAGE_SIZE", "1024")))
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,58 @@
+# tests/test_image_convert.py - Peak memory của convert_image_bounded đo qua MemoryBudget
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from utils.image_convert import convert_image_bounded, estimate_conversion_bytes
+from utils.memory_budget import MemoryBudget
+
+SOURCE_SIZE = (4096, 4096)
+RESIZE_TO = (512, 512)
+FULL_FRAME_RGBA = SOURCE_SIZE[0] * SOURCE_SIZE[1] * 4
+
+
+@pytest.fixture
+def budget():
+    return MemoryBudget(FULL_FRAME_RGBA * 4)
+
+
+def _convert(tmp_path, source, budget):
+    output = tmp_path / "out.webp"
+    convert_image_bounded(str(source), str(output), resize_to=RESIZE_TO, budget=budget)
+    with Image.open(output) as result:
+        assert result.size == RESIZE_TO
+    return budget.get_stats()
+
+
+def test_jpeg_peak_bounded_by_draft(tmp_path, budget):
+    source = tmp_path / "big.jpg"
+    Image.new("RGB", SOURCE_SIZE, (200, 30, 30)).save(source, quality=80)
+
+    stats = _convert(tmp_path, source, budget)
+
+    # draft() decode JPEG ở 1/8 (4096 -> 512) nên peak chỉ còn cỡ canvas, không phụ thuộc ảnh gốc
+    assert stats["peak_bytes"] == estimate_conversion_bytes(RESIZE_TO, "RGB", RESIZE_TO)
+    assert stats["peak_bytes"] < FULL_FRAME_RGBA // 8
+    assert stats["used_bytes"] == 0 and stats["active"] == 0
+
+
+def test_png_decodes_full_frame(tmp_path, budget):
+    # PNG không hỗ trợ draft: estimate (và peak) tỉ lệ với ảnh gốc, như docstring ghi rõ
+    source = tmp_path / "big.png"
+    Image.new("RGBA", SOURCE_SIZE, (30, 200, 30, 128)).save(source, compress_level=1)
+
+    stats = _convert(tmp_path, source, budget)
+
+    assert stats["peak_bytes"] == estimate_conversion_bytes(SOURCE_SIZE, "RGBA", RESIZE_TO)
+    assert stats["peak_bytes"] > FULL_FRAME_RGBA
+
+
+def test_budget_serializes_conversions_over_capacity(tmp_path):
+    source = tmp_path / "big.png"
+    Image.new("RGB", SOURCE_SIZE).save(source, compress_level=1)
+    small = MemoryBudget(1024 * 1024)
+
+    stats = _convert(tmp_path, source, small)
+
+    # Request lớn hơn capacity bị clamp: chạy một mình, peak không vượt capacity
+    assert stats["peak_bytes"] == small.capacity_bytes
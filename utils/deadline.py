@@ -0,0 +1,117 @@
+# utils/deadline.py - Deadline cho từng task, kiểm tra cooperative giữa các stage
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from utils.load_config import ConfigLoader
+
+# Timeout tối thiểu cho một request HTTP khi deadline sắp hết
+MIN_REQUEST_TIMEOUT = 1.0
+
+
+class TaskTimeoutError(Exception):
+    """Task đã vượt deadline tại một stage"""
+
+    def __init__(self, task_id: str, stage: str, overdue: float = 0.0):
+        self.task_id = task_id
+        self.stage = stage
+        self.overdue = overdue
+        super().__init__(f"Task {task_id} exceeded its deadline at stage '{stage}' (overdue {overdue:.1f}s)")
+
+
+def _parse_deadline(value: Any) -> Optional[float]:
+    """Parse deadline tuyệt đối (epoch seconds hoặc ISO 8601) thành epoch seconds"""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class TaskDeadline:
+    """
+    Deadline của một task, tính bằng time.monotonic().
+
+    timeout_seconds=None nghĩa là không giới hạn: mọi check đều pass.
+    """
+
+    def __init__(self, timeout_seconds: Optional[float] = None, task_id: str = ""):
+        self.task_id = task_id
+        self.timeout_seconds = timeout_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = None if timeout_seconds is None else self.started_at + timeout_seconds
+
+    @classmethod
+    def from_task(cls, task: Dict[str, Any], config_loader: Optional[ConfigLoader] = None) -> 'TaskDeadline':
+        """
+        Tạo deadline cho task.
+
+        Thứ tự ưu tiên:
+            1. task["deadline"]: thời điểm tuyệt đối (epoch hoặc ISO 8601)
+            2. task["timeout_seconds"]
+            3. config app.task_timeouts.<product_type>, rồi app.task_timeouts.default
+        Giá trị <= 0 hoặc không cấu hình nghĩa là không giới hạn.
+        """
+        task_id = str(task.get("id", "unknown"))
+
+        absolute = _parse_deadline(task.get("deadline"))
+        if absolute is not None:
+            return cls(absolute - time.time(), task_id)
+
+        timeout = task.get("timeout_seconds")
+        if timeout in (None, ""):
+            loader = config_loader or ConfigLoader()
+            timeouts = loader.get_config_value("app.task_timeouts", {}) or {}
+            timeout = timeouts.get(task.get("product_type", ""), timeouts.get("default"))
+
+        try:
+            timeout = float(timeout) if timeout is not None else None
+        except (TypeError, ValueError):
+            timeout = None
+        if timeout is not None and timeout <= 0:
+            timeout = None
+        return cls(timeout, task_id)
+
+    @property
+    def enabled(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> Optional[float]:
+        """Số giây còn lại (có thể âm), None nếu không giới hạn"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def check(self, stage: str) -> None:
+        """Raise TaskTimeoutError nếu deadline đã qua"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise TaskTimeoutError(self.task_id, stage, -remaining)
+
+    def bound_timeout(self, default: float) -> float:
+        """Timeout cho một call blocking: min(default, thời gian còn lại), tối thiểu MIN_REQUEST_TIMEOUT"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return max(MIN_REQUEST_TIMEOUT, min(default, remaining))
+
+    def sleep(self, seconds: float, stage: str = "sleep") -> None:
+        """Sleep nhưng không vượt deadline, sau đó check"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = max(0.0, min(seconds, remaining))
+        time.sleep(seconds)
+        self.check(stage)
@@ -1,27 +1,61 @@
 # utils/enhanced_logger_manager.py - Phiên bản cải thiện
+import copy
 import logging
 import os
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 import json
-from io import StringIO
 import threading
 import time
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler
+import queue
 import gzip
 import shutil
 import signal
 import atexit
-import photoshop
+from utils.load_config import ConfigLoader
+from utils.task_log_store import SegmentedTaskLogStore, TaskLogStoreHandler
+from utils.log_retention import LogRetentionService, DEFAULT_MAX_AGE_DAYS
+
+DEFAULT_TASK_LOG_CAPACITY = 5000
+
+
+class _TaskLogEntry:
+    """Một log record đã thu gọn, chưa format (timestamp/dòng log chỉ render khi cần)"""
+    __slots__ = ('created', 'levelno', 'levelname', 'message', 'module', 'funcName', 'lineno', 'exc_text')
+
+    def __init__(self, record: logging.LogRecord, exc_text: Optional[str]):
+        self.created = record.created
+        self.levelno = record.levelno
+        self.levelname = record.levelname
+        self.message = record.getMessage()
+        self.module = getattr(record, 'module', 'unknown')
+        self.funcName = getattr(record, 'funcName', 'unknown')
+        self.lineno = getattr(record, 'lineno', 0)
+        self.exc_text = exc_text
+
 
 class TaskLogHandler(logging.Handler):
-    """Custom log handler để thu thập logs cho từng task"""
+    """
+    Custom log handler để thu thập logs cho từng task.
+
+    Logs nằm trong ring buffer cố định `capacity` entry: khi đầy, entry cũ nhất bị ghi đè
+    và được đếm vào `dropped`, nên bộ nhớ mỗi task không tăng theo số log.
+    Format (timestamp ISO, dòng log) chỉ thực hiện khi gọi get_logs/get_logs_as_string.
+    """
     
-    def __init__(self, task_id: str):
+    def __init__(self, task_id: str, capacity: int = DEFAULT_TASK_LOG_CAPACITY):
         super().__init__()
         self.task_id = task_id
-        self.log_buffer = StringIO()
-        self.task_logs = []
+        self.capacity = max(1, int(capacity))
+        self._entries: List[Optional[_TaskLogEntry]] = [None] * self.capacity
+        self._head = 0  # Vị trí ghi tiếp theo
+        self._count = 0
+        self.dropped = 0
+        self.total = 0
+        self.level_counts: Dict[str, int] = {}
+        self.created_at = time.time()
+        self.last_activity = self.created_at
         self.lock = threading.RLock()  # Sử dụng RLock thay vì Lock
         self.closed = False
         
@@ -30,26 +64,50 @@ class TaskLogHandler(logging.Handler):
             return
             
         try:
+            exc_text = None
+            if record.exc_info:
+                # Traceback giữ reference tới frames, chỉ lưu dạng text
+                if not record.exc_text:
+                    record.exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+                exc_text = record.exc_text
+            entry = _TaskLogEntry(record, exc_text)
+
             with self.lock:
                 if self.closed:  # Double check
                     return
-                    
-                log_entry = self.format(record)
-                self.log_buffer.write(log_entry + '\n')
-                
-                # Lưu log với metadata
-                self.task_logs.append({
-                    'timestamp': datetime.fromtimestamp(record.created).isoformat(),
-                    'level': record.levelname,
-                    'message': record.getMessage(),
-                    'module': getattr(record, 'module', 'unknown'),
-                    'funcName': getattr(record, 'funcName', 'unknown'),
-                    'lineno': getattr(record, 'lineno', 0),
-                    'task_id': self.task_id
-                })
+                if self._count == self.capacity:
+                    self.dropped += 1
+                else:
+                    self._count += 1
+                self._entries[self._head] = entry
+                self._head = (self._head + 1) % self.capacity
+                self.total += 1
+                self.level_counts[entry.levelname] = self.level_counts.get(entry.levelname, 0) + 1
+                self.last_activity = entry.created
         except Exception as e:
             # Tránh infinite loop nếu logging bị lỗi
             print(f"Error in TaskLogHandler.emit: {e}")
+
+    def _snapshot(self) -> List[_TaskLogEntry]:
+        """Các entry hiện có theo thứ tự thời gian (gọi khi đang giữ lock)"""
+        if self._count < self.capacity:
+            return self._entries[:self._count]
+        return self._entries[self._head:] + self._entries[:self._head]
+
+    def _to_record(self, entry: _TaskLogEntry) -> logging.LogRecord:
+        record = logging.makeLogRecord({
+            'name': f"task_{self.task_id}",
+            'msg': entry.message,
+            'levelno': entry.levelno,
+            'levelname': entry.levelname,
+            'module': entry.module,
+            'funcName': entry.funcName,
+            'lineno': entry.lineno,
+            'exc_text': entry.exc_text,
+        })
+        record.created = entry.created
+        record.msecs = (entry.created - int(entry.created)) * 1000
+        return record
     
     def get_logs(self) -> List[Dict[str, Any]]:
         """Lấy tất cả logs của task hiện tại"""
@@ -57,7 +115,17 @@ class TaskLogHandler(logging.Handler):
             return []
         try:
             with self.lock:
-                return self.task_logs.copy()
+                entries = self._snapshot()
+            return [{
+                'timestamp': datetime.fromtimestamp(entry.created).isoformat(),
+                'level': entry.levelname,
+                'message': entry.message,
+                'module': entry.module,
+                'funcName': entry.funcName,
+                'lineno': entry.lineno,
+                'exc_text': entry.exc_text,
+                'task_id': self.task_id
+            } for entry in entries]
         except:
             return []
     
@@ -67,27 +135,46 @@ class TaskLogHandler(logging.Handler):
             return ""
         try:
             with self.lock:
-                return self.log_buffer.getvalue()
+                entries = self._snapshot()
+                dropped = self.dropped
+            lines = []
+            if dropped:
+                lines.append(f"... {dropped} earlier log records dropped (buffer capacity {self.capacity})")
+            lines.extend(self.format(self._to_record(entry)) for entry in entries)
+            return "".join(line + '\n' for line in lines)
         except:
             return ""
+
+    def get_buffer_stats(self) -> Dict[str, Any]:
+        """Thống kê ring buffer"""
+        with self.lock:
+            return {
+                'capacity': self.capacity,
+                'buffered': self._count,
+                'total': self.total,
+                'dropped': self.dropped,
+                'last_activity': self.last_activity,
+            }
     
     def get_summary_message(self) -> str:
         """Tạo summary message để gửi lên server"""
-        if self.closed or not self.task_logs:
+        if self.closed or not self._count:
             return f"Task {self.task_id} completed"
             
         try:
             with self.lock:
-                if not self.task_logs:
+                if not self._count:
                     return f"Task {self.task_id} completed"
                 
                 summary_parts = []
-                error_count = sum(1 for log in self.task_logs if log['level'] == 'ERROR')
-                warning_count = sum(1 for log in self.task_logs if log['level'] == 'WARNING')
-                info_count = sum(1 for log in self.task_logs if log['level'] == 'INFO')
+                error_count = self.level_counts.get('ERROR', 0)
+                warning_count = self.level_counts.get('WARNING', 0)
+                info_count = self.level_counts.get('INFO', 0)
                 
                 # Thêm thống kê
-                summary_parts.append(f"📊 Logs: {len(self.task_logs)} entries")
+                summary_parts.append(f"📊 Logs: {self.total} entries")
+                if self.dropped > 0:
+                    summary_parts.append(f"🗑️ Dropped: {self.dropped}")
                 if error_count > 0:
                     summary_parts.append(f"❌ Errors: {error_count}")
                 if warning_count > 0:
@@ -96,9 +183,9 @@ class TaskLogHandler(logging.Handler):
                     summary_parts.append(f"ℹ️ Info: {info_count}")
                 
                 # Thêm log cuối cùng
-                last_log = self.task_logs[-1]
-                last_message = last_log['message'][:100]
-                if len(last_log['message']) > 100:
+                last_log = self._entries[(self._head - 1) % self.capacity]
+                last_message = last_log.message[:100]
+                if len(last_log.message) > 100:
                     last_message += "..."
                 summary_parts.append(f"📝 Last: {last_message}")
                 
@@ -112,9 +199,12 @@ class TaskLogHandler(logging.Handler):
             return
         try:
             with self.lock:
-                self.log_buffer.truncate(0)
-                self.log_buffer.seek(0)
-                self.task_logs.clear()
+                self._entries = [None] * self.capacity
+                self._head = 0
+                self._count = 0
+                self.dropped = 0
+                self.total = 0
+                self.level_counts = {}
         except:
             pass
     
@@ -123,8 +213,8 @@ class TaskLogHandler(logging.Handler):
         try:
             with self.lock:
                 self.closed = True
-                if hasattr(self.log_buffer, 'close'):
-                    self.log_buffer.close()
+                self._entries = []
+                self._count = 0
         except:
             pass
         super().close()
@@ -133,7 +223,9 @@ class SafeTimedRotatingFileHandler(TimedRotatingFileHandler):
     """Safe rotating handler với error handling tốt hơn"""
     
     def __init__(self, filename, when='midnight', interval=1, backupCount=30, 
-                 encoding=None, delay=False, utc=False, atTime=None):
+                 encoding=None, delay=False, utc=False, atTime=None,
+                 retention: Optional[LogRetentionService] = None,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
         # Tạo thư mục nếu chưa tồn tại
         log_dir = os.path.dirname(filename)
         if log_dir and not os.path.exists(log_dir):
@@ -141,7 +233,30 @@ class SafeTimedRotatingFileHandler(TimedRotatingFileHandler):
             
         super().__init__(filename, when, interval, backupCount, encoding, delay, utc, atTime)
         self.suffix = "%Y-%m-%d"
+        # Khi chạy sau BatchingQueueListener, flush do listener quyết định thay vì mỗi record
+        self.defer_flush = False
+        # Có retention service: file rotate được catalog lại, nén/xóa ở worker dùng chung,
+        # không listdir thư mục mỗi lần rollover (kể cả getFilesToDelete của backupCount)
+        self.retention = retention
+        self.max_age_days = max_age_days
+        if retention is not None:
+            self.backupCount = 0
+            retention.scan_existing(self.baseFilename, max_age_days)
+
+    def flush(self):
+        if self.defer_flush:
+            return
+        super().flush()
+
+    def force_flush(self):
+        """Flush thật sự, bỏ qua defer_flush"""
+        super().flush()
         
+    def rotate(self, source, dest):
+        super().rotate(source, dest)
+        if self.retention is not None:
+            self.retention.register_rotated(dest, self.max_age_days)
+
     def doRollover(self):
         """Override với error handling tốt hơn"""
         try:
@@ -153,8 +268,9 @@ class SafeTimedRotatingFileHandler(TimedRotatingFileHandler):
             # Gọi rollover gốc
             super().doRollover()
             
-            # Compress và cleanup trong thread riêng để tránh block
-            threading.Thread(target=self._safe_maintenance, daemon=True).start()
+            # Không có retention service: compress và cleanup trong thread riêng để tránh block
+            if self.retention is None:
+                threading.Thread(target=self._safe_maintenance, daemon=True).start()
             
         except Exception as e:
             # Log error nhưng không làm crash ứng dụng
@@ -229,19 +345,237 @@ class SafeTimedRotatingFileHandler(TimedRotatingFileHandler):
         except Exception as e:
             print(f"Error in cleanup_old_files: {e}")
 
+_EXC_FORMATTER = logging.Formatter()
+
+
+class _AddRoute:
+    """Lệnh cho listener: đăng ký route, áp dụng đúng thứ tự với records và _CloseRoute trong queue"""
+    __slots__ = ("name", "handlers")
+
+    def __init__(self, name: str, handlers: List[logging.Handler]):
+        self.name = name
+        self.handlers = handlers
+
+
+class _CloseRoute:
+    """Lệnh cho listener: đóng handlers của một route sau khi đã ghi hết records trước đó"""
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class BatchingQueueListener:
+    """
+    Listener chạy trong thread riêng, nhận records từ queue và ghi ra handlers theo batch.
+
+    - Records được route theo tên logger: route đã đăng ký (vd: task logger) hoặc route mặc định (root).
+    - File handlers đặt defer_flush=True và chỉ flush sau flush_interval giây,
+      hoặc ngay khi batch có record từ ERROR trở lên.
+    """
+
+    _STOP = object()
+
+    def __init__(self, handlers: List[logging.Handler], batch_size: int = 256, flush_interval: float = 1.0):
+        self.queue = queue.SimpleQueue()
+        self.default_handlers = list(handlers)
+        self.routes: Dict[str, List[logging.Handler]] = {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records_processed = 0
+        self.batches_processed = 0
+        self._routes_lock = threading.Lock()
+        self._thread = None
+        self._last_flush = time.monotonic()
+        for handler in self.default_handlers:
+            self._defer(handler)
+
+    @staticmethod
+    def _defer(handler: logging.Handler) -> None:
+        if hasattr(handler, 'defer_flush'):
+            handler.defer_flush = True
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="log-queue-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Ghi hết records còn trong queue rồi dừng thread"""
+        if not self.running:
+            return
+        self.queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        self._flush_all()
+
+    def add_route(self, name: str, handlers: List[logging.Handler]) -> None:
+        """
+        Đăng ký route qua queue (như close_route): close của route cũ cùng tên còn trong queue
+        (vd task retry tạo lại logger) được xử lý trước, không gỡ mất route mới.
+        """
+        for handler in handlers:
+            self._defer(handler)
+        if self.running:
+            self.queue.put(_AddRoute(name, list(handlers)))
+        else:
+            self._add_route_now(name, list(handlers))
+
+    def _add_route_now(self, name: str, handlers: List[logging.Handler]) -> None:
+        with self._routes_lock:
+            self.routes[name] = handlers
+
+    def close_route(self, name: str) -> None:
+        """Đóng handlers của route sau khi các records đã enqueue trước đó được ghi xong"""
+        if self.running:
+            self.queue.put(_CloseRoute(name))
+        else:
+            self._close_route_now(name)
+
+    def _close_route_now(self, name: str) -> None:
+        with self._routes_lock:
+            handlers = self.routes.pop(name, [])
+        for handler in handlers:
+            try:
+                if hasattr(handler, 'force_flush'):
+                    handler.force_flush()
+                handler.close()
+            except Exception as e:
+                print(f"Error closing log route {name}: {e}")
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.running:
+            self.queue.put(record)
+        else:
+            # Listener đã dừng (shutdown): ghi đồng bộ để không mất log
+            self.dispatch(record)
+            self._flush_all()
+
+    def dispatch(self, record: logging.LogRecord) -> None:
+        with self._routes_lock:
+            handlers = self.routes.get(record.name, self.default_handlers)
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _flush_all(self) -> None:
+        with self._routes_lock:
+            handler_groups = [self.default_handlers] + list(self.routes.values())
+        for handlers in handler_groups:
+            for handler in handlers:
+                try:
+                    if hasattr(handler, 'force_flush'):
+                        handler.force_flush()
+                    else:
+                        handler.flush()
+                except Exception:
+                    pass
+        self._last_flush = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush_all()
+                continue
+
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            urgent = False
+            for item in batch:
+                if item is self._STOP:
+                    stop = True
+                elif isinstance(item, _AddRoute):
+                    self._add_route_now(item.name, item.handlers)
+                elif isinstance(item, _CloseRoute):
+                    self._close_route_now(item.name)
+                else:
+                    try:
+                        self.dispatch(item)
+                    except Exception as e:
+                        print(f"Error in log queue listener: {e}")
+                    self.records_processed += 1
+                    if item.levelno >= logging.ERROR:
+                        urgent = True
+            self.batches_processed += 1
+
+            if urgent or stop or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_all()
+            if stop:
+                break
+
+
+class LogQueueHandler(QueueHandler):
+    """QueueHandler gửi record sang BatchingQueueListener (ghi đồng bộ nếu listener đã dừng)"""
+
+    def __init__(self, listener: BatchingQueueListener):
+        super().__init__(listener.queue)
+        self.listener = listener
+
+    def prepare(self, record):
+        """
+        Nhẹ hơn QueueHandler.prepare: không format cả record trên thread gọi logger,
+        chỉ render message và traceback (traceback giữ reference tới frames nên không đưa qua queue).
+        Sửa trên bản copy nông như stdlib, để các handler khác của logger vẫn thấy record gốc.
+        """
+        msg = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record):
+        self.listener.enqueue(record)
+
+
 class EnhancedLoggerManager:
     """Quản lý logging nâng cao với rotation theo ngày"""
     
-    def __init__(self, log_dir: str = "logs"):
+    def __init__(self, log_dir: str = "logs", use_queue: Optional[bool] = None,
+                 task_log_capacity: Optional[int] = None):
         self.log_dir = log_dir
         self.task_handlers = {}
         self.task_loggers = {}
         self.lock = threading.RLock()
         self.shutdown_event = threading.Event()
+        if use_queue is None:
+            use_queue = bool(ConfigLoader().get_config_value("settings.queue_logging", True))
+        self.use_queue = use_queue
+        if task_log_capacity is None:
+            task_log_capacity = int(ConfigLoader().get_config_value(
+                "settings.task_log_capacity", DEFAULT_TASK_LOG_CAPACITY))
+        self.task_log_capacity = task_log_capacity
+        self.listener: Optional[BatchingQueueListener] = None
+        self.retention = LogRetentionService.from_config()
         self._setup_directories()
         self._setup_main_logger()
+
+        # Log file của mọi task ghi vào một store segment dùng chung (logs/tasks/segment_*.log)
+        segment_mb = float(ConfigLoader().get_config_value("settings.task_log_segment_mb", 64))
+        self.task_log_store = SegmentedTaskLogStore(
+            os.path.join(self.log_dir, "tasks"),
+            segment_max_bytes=int(segment_mb * 1024 * 1024)
+        )
         
         # Start cleanup thread
+        self.retention.start()
         self._start_cleanup_thread()
         
         # Register cleanup on exit
@@ -266,6 +600,12 @@ class EnhancedLoggerManager:
                     self.cleanup_task_logger(task_id)
                 except:
                     pass
+
+        # Ghi hết log còn trong queue
+        if self.listener is not None:
+            self.listener.stop()
+        self.task_log_store.close()
+        self.retention.stop()
     
     def _setup_directories(self):
         """Tạo thư mục logs với cấu trúc rõ ràng"""
@@ -292,7 +632,8 @@ class EnhancedLoggerManager:
                 when='midnight',
                 interval=1,
                 backupCount=30,
-                encoding='utf-8'
+                encoding='utf-8',
+                retention=self.retention
             )
             main_handler.setLevel(logging.INFO)
             
@@ -302,7 +643,8 @@ class EnhancedLoggerManager:
                 when='midnight',
                 interval=1,
                 backupCount=60,  # Giữ error logs lâu hơn
-                encoding='utf-8'
+                encoding='utf-8',
+                retention=self.retention
             )
             error_handler.setLevel(logging.ERROR)
             
@@ -331,9 +673,15 @@ class EnhancedLoggerManager:
             for handler in root_logger.handlers[:]:
                 root_logger.removeHandler(handler)
             
-            root_logger.addHandler(main_handler)
-            root_logger.addHandler(error_handler)
-            root_logger.addHandler(console_handler)
+            handlers = [main_handler, error_handler, console_handler]
+            if self.use_queue:
+                # Thread gọi logger chỉ enqueue, I/O file/console chạy ở listener thread
+                self.listener = BatchingQueueListener(handlers)
+                self.listener.start()
+                root_logger.addHandler(LogQueueHandler(self.listener))
+            else:
+                for handler in handlers:
+                    root_logger.addHandler(handler)
             
             # Prevent propagation to avoid duplication
             root_logger.propagate = False
@@ -356,25 +704,22 @@ class EnhancedLoggerManager:
                 task_logger.propagate = False  # Không propagate lên root logger
                 
                 # Tạo custom handler cho task
-                task_handler = TaskLogHandler(task_id)
+                task_handler = TaskLogHandler(task_id, capacity=self.task_log_capacity)
                 task_formatter = logging.Formatter(
                     '%(asctime)s - %(levelname)s - %(message)s'
                 )
                 task_handler.setFormatter(task_formatter)
                 
-                # File handler cho task với daily rotation
-                today = datetime.now().strftime("%Y-%m-%d")
-                task_file_handler = SafeTimedRotatingFileHandler(
-                    filename=os.path.join(self.log_dir, "tasks", f"task_{task_id}_{today}.log"),
-                    when='midnight',
-                    interval=1,
-                    backupCount=7,  # Giữ task logs 7 ngày
-                    encoding='utf-8'
-                )
+                # File log của task: append vào segment store dùng chung, không mở file riêng
+                task_file_handler = TaskLogStoreHandler(self.task_log_store, task_id)
                 task_file_handler.setFormatter(task_formatter)
                 
                 task_logger.addHandler(task_handler)
-                task_logger.addHandler(task_file_handler)
+                if self.listener is not None:
+                    self.listener.add_route(logger_name, [task_file_handler])
+                    task_logger.addHandler(LogQueueHandler(self.listener))
+                else:
+                    task_logger.addHandler(task_file_handler)
                 
                 # Lưu references
                 self.task_handlers[task_id] = task_handler
@@ -405,6 +750,10 @@ class EnhancedLoggerManager:
             return self.task_handlers[task_id].get_summary_message()
         return f"Task {task_id} completed"
     
+    def get_task_log_file_content(self, task_id: str) -> str:
+        """Đọc log đã ghi xuống segment store của task (kể cả task đã cleanup)"""
+        return self.task_log_store.read_task(task_id)
+    
     def clear_task_logs(self, task_id: str):
         """Xóa logs của task"""
         if task_id in self.task_handlers:
@@ -423,6 +772,10 @@ class EnhancedLoggerManager:
                     for handler in task_logger.handlers[:]:
                         handler.close()
                         task_logger.removeHandler(handler)
+
+                    # File handler nằm sau queue: đóng sau khi ghi hết records của task
+                    if self.listener is not None:
+                        self.listener.close_route(logger_name)
                     
                     # Xóa từ dictionaries
                     del self.task_loggers[task_id]
@@ -459,28 +812,21 @@ class EnhancedLoggerManager:
                 to_remove = []
                 
                 for task_id, handler in self.task_handlers.items():
-                    try:
-                        # Kiểm tra thời gian log cuối cùng
-                        logs = handler.get_logs()
-                        if logs:
-                            last_log_time = datetime.fromisoformat(logs[-1]['timestamp']).timestamp()
-                            if current_time - last_log_time > 3600:  # 1 giờ
-                                to_remove.append(task_id)
-                        else:
-                            # Không có logs, có thể là task cũ
-                            to_remove.append(task_id)
-                    except Exception as e:
-                        print(f"Error checking task {task_id} for cleanup: {e}")
+                    # last_activity = thời điểm log cuối, hoặc lúc tạo handler nếu chưa có log
+                    if current_time - handler.last_activity > 3600:  # 1 giờ
                         to_remove.append(task_id)
                 
                 for task_id in to_remove:
                     self.cleanup_task_logger(task_id)
+
+            # Compact + nén segment cũ hơn 1 ngày, xóa segment quá 7 ngày
+            self.task_log_store.maintain(compress_after_days=1, retention_days=7)
                     
         except Exception as e:
             print(f"Error in periodic cleanup: {e}")
     
     def get_log_statistics(self) -> Dict[str, Any]:
-        """Lấy thống kê logging"""
+        """Lấy thống kê logging (từ counters, không walk thư mục logs)"""
         stats = {
             'active_tasks': len(self.task_handlers),
             'log_directories': [],
@@ -488,26 +834,10 @@ class EnhancedLoggerManager:
         }
         
         try:
-            # Thống kê thư mục
-            for root, dirs, files in os.walk(self.log_dir):
-                for dir_name in dirs:
-                    dir_path = os.path.join(root, dir_name)
-                    try:
-                        if os.path.exists(dir_path):
-                            file_count = len([f for f in os.listdir(dir_path) 
-                                            if os.path.isfile(os.path.join(dir_path, f))])
-                            total_size = sum(os.path.getsize(os.path.join(dir_path, f)) 
-                                           for f in os.listdir(dir_path) 
-                                           if os.path.isfile(os.path.join(dir_path, f)))
-                            
-                            stats['log_directories'].append({
-                                'name': dir_name,
-                                'path': dir_path,
-                                'file_count': file_count,
-                                'total_size_mb': round(total_size / (1024 * 1024), 2)
-                            })
-                    except Exception as e:
-                        print(f"Error getting stats for {dir_path}: {e}")
+            retention_stats = self.retention.get_statistics()
+            stats['log_directories'] = retention_stats['log_directories']
+            stats['disk_usage'] = retention_stats['retention']
+            stats['task_log_store'] = self.task_log_store.get_stats()
         except Exception as e:
             print(f"Error getting log statistics: {e}")
         
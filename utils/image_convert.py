@@ -0,0 +1,106 @@
+# utils/image_convert.py - Conversion WebP giới hạn bộ nhớ cho ảnh export rất lớn
+import logging
+import os
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from utils.memory_budget import MemoryBudget, get_conversion_budget
+
+module_logger = logging.getLogger(__name__)
+
+try:
+    LANCZOS = Image.Resampling.LANCZOS
+except AttributeError:
+    LANCZOS = Image.LANCZOS
+
+# Các mode resample trực tiếp được, không cần convert full-frame sang RGBA trước
+RESAMPLE_SAFE_MODES = ("RGB", "RGBA", "L", "LA")
+
+# Hệ số cho buffer trung gian của reduce()/resize() trong thumbnail
+RESAMPLE_OVERHEAD = 1.5
+
+
+def estimate_conversion_bytes(decoded_size: Tuple[int, int], mode: str, resize_to: Tuple[int, int]) -> int:
+    """
+    Ước tính peak memory (byte) của một conversion bounded.
+
+    Args:
+        decoded_size: Kích thước ảnh sau khi draft (decode ở scale giảm nếu format hỗ trợ).
+        mode: Mode của ảnh nguồn.
+        resize_to: Kích thước canvas đầu ra.
+    """
+    # Pillow lưu RGB/LA/CMYK... 4 byte mỗi pixel, L/P/1 là 1 byte
+    pixel_bytes = 1 if mode in ("1", "L", "P") else 4
+    source_bytes = decoded_size[0] * decoded_size[1] * pixel_bytes
+    if mode not in RESAMPLE_SAFE_MODES:
+        # convert("RGBA") full-frame trước khi resample
+        source_bytes += decoded_size[0] * decoded_size[1] * 4
+    canvas_bytes = resize_to[0] * resize_to[1] * 4
+    return int(source_bytes * RESAMPLE_OVERHEAD) + canvas_bytes * 2
+
+
+def convert_image_bounded(input_path: str, output_path: str, resize_to: Tuple[int, int] = (1024, 1024),
+                          quality: int = 85, task_logger: Optional[logging.Logger] = None,
+                          budget: Optional[MemoryBudget] = None, budget_timeout: Optional[float] = None) -> None:
+    """
+    Convert image sang WebP có alpha, giới hạn bộ nhớ.
+
+    Khác với convert_image_with_alpha:
+    - Decode ở scale giảm (draft) khi format hỗ trợ (JPEG), rồi thumbnail ngay trên mode gốc
+      nên không có bản RGBA full-frame.
+    - Dùng chính ảnh RGBA làm mask khi paste, không split() alpha thành band riêng.
+    - Reserve bộ nhớ ước tính từ budget chung trước khi decode, nên nhiều conversion
+      song song không thể vượt quá budget.
+
+    Giới hạn: draft() chỉ có tác dụng với JPEG. PNG/WebP/TIFF vẫn decode full-frame
+    (chỉ tránh được bản RGBA copy khi mode resample trực tiếp được), nên estimate và
+    peak memory với các format này tỉ lệ với kích thước ảnh gốc.
+
+    Raises:
+        Exception: Nếu có lỗi trong quá trình mở, xử lý hoặc lưu ảnh.
+    """
+    if task_logger is None:
+        task_logger = module_logger
+    if budget is None:
+        budget = get_conversion_budget()
+
+    input_filename = os.path.basename(input_path)
+    output_filename = os.path.basename(output_path)
+
+    with Image.open(input_path) as img:
+        original_size = img.size
+        # Decode ở scale giảm nếu decoder hỗ trợ (chỉ JPEG: 1/2, 1/4, 1/8; PNG bỏ qua draft)
+        img.draft(None, resize_to)
+        estimate = estimate_conversion_bytes(img.size, img.mode, resize_to)
+        task_logger.debug(f"   📐 Original: {original_size[0]}x{original_size[1]}px, "
+                          f"Decode: {img.size[0]}x{img.size[1]}px ({img.mode}), "
+                          f"Budget estimate: {estimate / (1024 * 1024):.1f} MB")
+
+        with budget.reserve(estimate, timeout=budget_timeout):
+            if img.mode not in RESAMPLE_SAFE_MODES:
+                # P (palette + transparency), CMYK, I;16... cần convert trước khi resample
+                work = img.convert("RGBA")
+            else:
+                work = img
+            # thumbnail() dùng reduce() trước LANCZOS nên chỉ có buffer đã giảm kích thước
+            work.thumbnail(resize_to, LANCZOS)
+            if work.mode in ("L", "LA"):
+                work = work.convert("RGBA" if work.mode == "LA" else "RGB")
+            task_logger.debug(f"   📐 Resized Dimensions: {work.size[0]}x{work.size[1]}px")
+
+            canvas = Image.new("RGBA", resize_to, (255, 255, 255, 0))
+            offset = ((resize_to[0] - work.size[0]) // 2, (resize_to[1] - work.size[1]) // 2)
+            if work.mode == "RGBA":
+                # Ảnh RGBA dùng trực tiếp làm mask (band alpha), giống convert_image_with_alpha
+                canvas.paste(work, offset, mask=work)
+            else:
+                # RGB không có alpha: paste trực tiếp, alpha vùng ảnh = 255
+                canvas.paste(work, offset)
+
+            canvas.save(output_path, format="WEBP", quality=quality, method=6, lossless=False)
+
+    if not os.path.exists(output_path):
+        raise FileNotFoundError(f"WebP file was not created at expected path: {output_path}")
+    file_size_kb = os.path.getsize(output_path) / 1024
+    task_logger.info(f"   ✅ Conversion Successful (bounded) | '{input_filename}' -> '{output_filename}' ({file_size_kb:.2f} KB)")
@@ -0,0 +1,141 @@
+# utils/image_download.py - Tải ảnh input có cache ETag (If-None-Match) và tải tiếp file dở (Range/If-Range)
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import requests
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+INDEX_FILE_NAME = ".etag_index.json"
+
+
+def with_size(url: str, width: Optional[int], height: Optional[int] = None) -> str:
+    """Thêm ?w=<width>&h=<height> vào URL ảnh (giữ các query khác); server chọn biến thể phủ cả hai chiều"""
+    if not width:
+        return url
+    parts = urlparse(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key not in ("w", "h")]
+    query.append(("w", str(int(width))))
+    if height:
+        query.append(("h", str(int(height))))
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+
+def local_file_name(url: str, width: Optional[int] = None, height: Optional[int] = None) -> str:
+    """Tên file trong thư mục downloads: basename của path URL, thêm _w<width>[_h<height>] nếu tải biến thể"""
+    name = os.path.basename(urlparse(url).path) or "image"
+    if width:
+        stem, ext = os.path.splitext(name)
+        suffix = f"_w{int(width)}" + (f"_h{int(height)}" if height else "")
+        name = f"{stem}{suffix}{ext}"
+    return name
+
+
+class ImageDownloadCache:
+    """
+    Index url -> {etag, path, size} lưu ở <directory>/.etag_index.json.
+
+    fetch():
+    - đã có file với ETag: gửi If-None-Match, server trả 304 thì dùng lại file, không tải lại
+    - còn file .part từ lần tải bị ngắt: gửi Range + If-Range, server trả 206 thì ghi tiếp
+    - tải xong mới os.replace .part -> file đích
+    """
+
+    def __init__(self, directory: str = "downloads", max_entries: int = 5000):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE_NAME)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.index: Dict[str, Dict[str, Any]] = self._load()
+        self.stats = {"downloaded": 0, "not_modified": 0, "resumed": 0, "failed": 0, "bytes": 0}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        with self.lock:
+            if len(self.index) > self.max_entries:
+                # Bỏ các entry cũ nhất
+                oldest = sorted(self.index, key=lambda url: self.index[url].get("time", 0))
+                for url in oldest[:len(self.index) - self.max_entries]:
+                    del self.index[url]
+            data = json.dumps(self.index, ensure_ascii=False)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+    def _record(self, url: str, **entry) -> None:
+        with self.lock:
+            self.index[url] = {**entry, "time": time.time()}
+        self._save()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += amount
+
+    def fetch(self, url: str, path: str, timeout: float = 10,
+              on_chunk: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        """
+        Tải url về path. Trả về {"status": "downloaded" | "not_modified" | "failed", "bytes", "resumed",
+        "status_code"}. Exception của on_chunk (vd hết deadline) được ném lại, file .part được giữ.
+        """
+        with self.lock:
+            entry = dict(self.index.get(url) or {})
+        part_path = path + ".part"
+        headers = {}
+        if entry.get("etag") and os.path.exists(path) and os.path.getsize(path) == entry.get("size"):
+            headers["If-None-Match"] = entry["etag"]
+        elif entry.get("partial_etag") and os.path.exists(part_path):
+            headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+            headers["If-Range"] = entry["partial_etag"]
+
+        response = requests.get(url, headers=headers, stream=True, timeout=timeout)
+        try:
+            if response.status_code == 304:
+                self._count("not_modified")
+                return {"status": "not_modified", "bytes": 0, "resumed": False, "status_code": 304}
+            if response.status_code not in (200, 206):
+                self._count("failed")
+                return {"status": "failed", "bytes": 0, "resumed": False, "status_code": response.status_code}
+
+            resumed = response.status_code == 206
+            etag = response.headers.get("ETag")
+            received = 0
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            try:
+                with open(part_path, "ab" if resumed else "wb") as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        received += len(chunk)
+                        if on_chunk is not None:
+                            on_chunk()
+            except BaseException:
+                if etag and not etag.startswith("W/"):
+                    # Giữ .part để lần sau tải tiếp bằng Range (chỉ với ETag mạnh)
+                    self._record(url, partial_etag=etag)
+                raise
+            os.replace(part_path, path)
+        finally:
+            response.close()
+
+        size = os.path.getsize(path)
+        if etag:
+            self._record(url, etag=etag, path=path, size=size)
+        self._count("downloaded")
+        self._count("bytes", received)
+        if resumed:
+            self._count("resumed")
+        return {"status": "downloaded", "bytes": received, "resumed": resumed, "status_code": response.status_code}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, "entries": len(self.index)}
@@ -0,0 +1,286 @@
+# utils/log_retention.py - Catalog log đã rotate, nén và dọn dẹp bằng một worker dùng chung
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.load_config import ConfigLoader
+
+COPY_BUFFER_SIZE = 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 60
+
+
+class _CatalogEntry:
+    __slots__ = ("path", "directory", "size", "mtime", "compressed", "max_age_days")
+
+    def __init__(self, path: str, size: int, mtime: float, compressed: bool, max_age_days: float):
+        self.path = path
+        self.directory = os.path.dirname(path)
+        self.size = size
+        self.mtime = mtime
+        self.compressed = compressed
+        self.max_age_days = max_age_days
+
+
+class LogRetentionService:
+    """
+    Giữ catalog trong bộ nhớ các file log đã rotate (handler báo qua register_rotated),
+    nên không cần listdir/getmtime cả thư mục mỗi lần rollover.
+
+    Một worker thread duy nhất:
+    - nén file cũ hơn compress_after_seconds (copyfileobj buffer lớn, ghi .gz.tmp rồi rename)
+    - xóa file quá max_age_days của từng file
+    - giữ tổng dung lượng catalog dưới max_total_bytes (xóa file cũ nhất trước)
+    Thống kê lấy từ counters của catalog, không walk filesystem.
+    """
+
+    def __init__(self, compress_after_seconds: float = 86400, max_total_bytes: Optional[int] = None,
+                 check_interval: float = 300, compress_level: int = 6, copy_buffer_size: int = COPY_BUFFER_SIZE):
+        self.compress_after_seconds = compress_after_seconds
+        self.max_total_bytes = max_total_bytes
+        self.check_interval = check_interval
+        self.compress_level = compress_level
+        self.copy_buffer_size = copy_buffer_size
+        self.catalog: Dict[str, _CatalogEntry] = {}
+        self.live_files: Dict[str, str] = {}  # path -> directory của file đang ghi
+        self.lock = threading.RLock()
+        self.jobs: queue.Queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._dir_counts: Dict[str, int] = {}
+        self._dir_bytes: Dict[str, int] = {}
+        self._counters = {
+            'registered': 0,
+            'compressed': 0,
+            'deleted_age': 0,
+            'deleted_quota': 0,
+            'bytes_saved': 0,
+            'errors': 0,
+        }
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'LogRetentionService':
+        """Tạo service từ config settings.log_retention"""
+        loader = config_loader or ConfigLoader()
+        config = loader.get_config_value("settings.log_retention", {}) or {}
+        max_total_mb = config.get("max_total_mb")
+        return cls(
+            compress_after_seconds=float(config.get("compress_after_hours", 24)) * 3600,
+            max_total_bytes=int(float(max_total_mb) * 1024 * 1024) if max_total_mb else None,
+            check_interval=float(config.get("check_interval", 300)),
+        )
+
+    # --- Lifecycle ---
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self.running:
+            return
+        self._stop_event.set()
+        self.jobs.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # --- Catalog ---
+
+    def _add(self, entry: _CatalogEntry) -> None:
+        with self.lock:
+            old = self.catalog.pop(entry.path, None)
+            if old is not None:
+                self._account(old, -1)
+            self.catalog[entry.path] = entry
+            self._account(entry, 1)
+
+    def _remove(self, path: str) -> Optional[_CatalogEntry]:
+        with self.lock:
+            entry = self.catalog.pop(path, None)
+            if entry is not None:
+                self._account(entry, -1)
+            return entry
+
+    def _account(self, entry: _CatalogEntry, sign: int) -> None:
+        self._dir_counts[entry.directory] = self._dir_counts.get(entry.directory, 0) + sign
+        self._dir_bytes[entry.directory] = self._dir_bytes.get(entry.directory, 0) + sign * entry.size
+
+    def register_live(self, path: str) -> None:
+        """File đang được handler ghi (chỉ dùng cho thống kê)"""
+        with self.lock:
+            self.live_files[os.path.abspath(path)] = os.path.dirname(os.path.abspath(path))
+
+    def register_rotated(self, path: str, max_age_days: float = DEFAULT_MAX_AGE_DAYS) -> None:
+        """Handler vừa rotate ra file `path`: thêm vào catalog và báo worker"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        self._add(_CatalogEntry(path, stat.st_size, stat.st_mtime, path.endswith(".gz"), max_age_days))
+        with self.lock:
+            self._counters['registered'] += 1
+        self.jobs.put(path)
+
+    def scan_existing(self, base_filename: str, max_age_days: float = DEFAULT_MAX_AGE_DAYS) -> int:
+        """
+        Nạp các file rotate có sẵn của một handler (base_filename.*) vào catalog.
+        Chỉ gọi một lần lúc khởi động.
+        """
+        base_filename = os.path.abspath(base_filename)
+        directory, base_name = os.path.split(base_filename)
+        self.register_live(base_filename)
+        count = 0
+        try:
+            with os.scandir(directory) as it:
+                for item in it:
+                    if (item.is_file() and item.name.startswith(base_name + ".")
+                            and not item.name.endswith(".tmp")):
+                        stat = item.stat()
+                        self._add(_CatalogEntry(item.path, stat.st_size, stat.st_mtime,
+                                                item.name.endswith(".gz"), max_age_days))
+                        count += 1
+        except OSError as e:
+            print(f"Error scanning log directory {directory}: {e}")
+        return count
+
+    # --- Maintenance ---
+
+    def compress(self, path: str) -> bool:
+        """Nén một file trong catalog bằng streaming copy buffer lớn"""
+        with self.lock:
+            entry = self.catalog.get(path)
+        if entry is None or entry.compressed:
+            return False
+        gz_path = path + ".gz"
+        tmp_path = gz_path + ".tmp"
+        try:
+            with open(path, "rb") as f_in, open(tmp_path, "wb") as raw_out:
+                with gzip.GzipFile(fileobj=raw_out, mode="wb", compresslevel=self.compress_level,
+                                   mtime=entry.mtime) as f_out:
+                    shutil.copyfileobj(f_in, f_out, self.copy_buffer_size)
+            os.replace(tmp_path, gz_path)
+            os.utime(gz_path, (entry.mtime, entry.mtime))  # Giữ mtime gốc để tính tuổi
+            os.remove(path)
+        except Exception as e:
+            print(f"Error compressing {path}: {e}")
+            with self.lock:
+                self._counters['errors'] += 1
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+        compressed_size = os.path.getsize(gz_path)
+        self._remove(path)
+        self._add(_CatalogEntry(gz_path, compressed_size, entry.mtime, True, entry.max_age_days))
+        with self.lock:
+            self._counters['compressed'] += 1
+            self._counters['bytes_saved'] += max(0, entry.size - compressed_size)
+        return True
+
+    def _delete(self, path: str, reason: str) -> None:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Error removing old file {path}: {e}")
+            with self.lock:
+                self._counters['errors'] += 1
+            return
+        self._remove(path)
+        with self.lock:
+            self._counters[reason] += 1
+
+    def run_maintenance(self, now: Optional[float] = None) -> None:
+        """Một lượt: xóa theo tuổi, nén file đủ cũ, rồi áp quota dung lượng"""
+        now = time.time() if now is None else now
+        with self.lock:
+            entries = list(self.catalog.values())
+
+        for entry in entries:
+            age = now - entry.mtime
+            if age > entry.max_age_days * 86400:
+                self._delete(entry.path, 'deleted_age')
+            elif not entry.compressed and age > self.compress_after_seconds:
+                self.compress(entry.path)
+
+        if self.max_total_bytes is not None:
+            with self.lock:
+                total = sum(self._dir_bytes.values())
+                oldest_first = sorted(self.catalog.values(), key=lambda e: e.mtime)
+            for entry in oldest_first:
+                if total <= self.max_total_bytes:
+                    break
+                self._delete(entry.path, 'deleted_quota')
+                total -= entry.size
+
+    def _run(self) -> None:
+        next_check = 0.0
+        while not self._stop_event.is_set():
+            try:
+                timeout = max(0.0, next_check - time.monotonic())
+                try:
+                    self.jobs.get(timeout=timeout)
+                except queue.Empty:
+                    pass
+                # Gom các thông báo rotate tới cùng lúc vào một lượt
+                while True:
+                    try:
+                        self.jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                if self._stop_event.is_set():
+                    break
+                self.run_maintenance()
+                next_check = time.monotonic() + self.check_interval
+            except Exception as e:
+                print(f"Error in log retention worker: {e}")
+
+    # --- Statistics ---
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Thống kê từ counters trong bộ nhớ (file đang ghi chỉ stat riêng từng file)"""
+        with self.lock:
+            dir_counts = dict(self._dir_counts)
+            dir_bytes = dict(self._dir_bytes)
+            live_files = dict(self.live_files)
+            counters = dict(self._counters)
+            catalog_files = len(self.catalog)
+            compressed_files = sum(1 for e in self.catalog.values() if e.compressed)
+
+        for path, directory in live_files.items():
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            dir_counts[directory] = dir_counts.get(directory, 0) + 1
+            dir_bytes[directory] = dir_bytes.get(directory, 0) + size
+
+        directories: List[Dict[str, Any]] = []
+        for directory in sorted(dir_counts):
+            if dir_counts[directory] <= 0:
+                continue
+            directories.append({
+                'name': os.path.basename(directory),
+                'path': directory,
+                'file_count': dir_counts[directory],
+                'total_size_mb': round(dir_bytes.get(directory, 0) / (1024 * 1024), 2),
+            })
+
+        counters['catalog_files'] = catalog_files
+        counters['compressed_files'] = compressed_files
+        counters['total_size_mb'] = round(sum(dir_bytes.values()) / (1024 * 1024), 2)
+        return {'log_directories': directories, 'retention': counters}
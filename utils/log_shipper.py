@@ -0,0 +1,287 @@
+# utils/log_shipper.py - Gửi log của task lên server theo batch, nén gzip, chạy nền
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from utils.load_config import ConfigLoader
+from utils.metrics import track_stage
+
+logger = logging.getLogger(__name__)
+
+# Server chưa có route batch: chuyển sang route cũ /task-logs/ (một task mỗi request)
+LEGACY_FALLBACK_STATUSES = (404, 405)
+
+
+def rebuild_log_string(logs: List[Dict[str, Any]]) -> str:
+    """Dựng lại log_string (định dạng cũ, kèm traceback) từ danh sách logs của TaskLogHandler.get_logs"""
+    return "\n".join(
+        f"{log.get('timestamp', '')} - {log.get('level', '')} - {log.get('message', '')}"
+        + (f"\n{log['exc_text']}" if log.get("exc_text") else "")
+        for log in logs
+    )
+
+
+class LogShipper:
+    """
+    Gom log_data của nhiều task thành một batch, gửi POST body JSON nén gzip tới
+    /{client_name}/task-logs/batch/ từ một thread nền.
+
+    - Bỏ log_string khi đã có logs (server dựng lại được từ logs), không gửi trùng dữ liệu
+    - Mỗi entry tối đa max_entry_bytes: cắt bớt phần giữa của logs nếu quá lớn
+    - Mỗi batch tối đa batch_size entry và max_batch_bytes (JSON chưa nén)
+    - Retry với backoff cho lỗi mạng, 429 và 5xx; hàng đợi đầy thì bỏ entry mới
+    - Server trả 404/405 cho route batch (server production chưa có): chuyển hẳn sang legacy_url
+      (/{client_name}/task-logs/, payload như send_logs_to_server), log_string được dựng lại
+    """
+
+    def __init__(self, url: str, client_name: str, batch_size: int = 20, flush_interval: float = 5.0,
+                 max_batch_bytes: int = 1024 * 1024, max_entry_bytes: int = 256 * 1024,
+                 max_queue: int = 500, max_retries: int = 3, retry_backoff: float = 2.0,
+                 timeout: float = 15, compress_level: int = 6, legacy_url: Optional[str] = None):
+        self.url = url
+        self.legacy_url = legacy_url
+        self.legacy_mode = False
+        self.client_name = client_name
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.compress_level = compress_level
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.session = requests.Session()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'shipped': 0,
+            'dropped_queue_full': 0,
+            'dropped_failed': 0,
+            'truncated': 0,
+            'batches': 0,
+            'retries': 0,
+            'raw_bytes': 0,
+            'sent_bytes': 0,
+        }
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'LogShipper':
+        """Tạo shipper từ config app.server_url, app.client_name, app.log_shipping"""
+        loader = config_loader or ConfigLoader()
+        server_url = loader.get_config_value("app.server_url", "http://localhost:8000")
+        client_name = loader.get_config_value("app.client_name", "default_client_name")
+        config = loader.get_config_value("app.log_shipping", {}) or {}
+        return cls(
+            url=f"{server_url}/{client_name}/task-logs/batch/",
+            legacy_url=f"{server_url}/{client_name}/task-logs/",
+            client_name=client_name,
+            batch_size=int(config.get("batch_size", 20)),
+            flush_interval=float(config.get("flush_interval", 5.0)),
+            max_batch_bytes=int(config.get("max_batch_bytes", 1024 * 1024)),
+            max_entry_bytes=int(config.get("max_entry_bytes", 256 * 1024)),
+            max_queue=int(config.get("max_queue", 500)),
+            max_retries=int(config.get("max_retries", 3)),
+        )
+
+    # --- Public API ---
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Gửi nốt các entry còn trong hàng đợi rồi dừng thread"""
+        if not self.running:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, task_id: str, log_data: Dict[str, Any]) -> bool:
+        """Đưa log_data của task vào hàng đợi gửi (không block thread gọi)"""
+        entry = self._prepare_entry(task_id, log_data)
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self._incr('dropped_queue_full')
+            logger.warning(f"⚠️ Log shipper queue full, dropping logs for task {task_id}")
+            return False
+        self._incr('submitted')
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self.queue.qsize()
+        stats['compression_ratio'] = (round(stats['raw_bytes'] / stats['sent_bytes'], 2)
+                                      if stats['sent_bytes'] else 0.0)
+        return stats
+
+    # --- Entry preparation ---
+
+    def _incr(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    @staticmethod
+    def _encode(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+    def _prepare_entry(self, task_id: str, log_data: Dict[str, Any]) -> bytes:
+        """
+        Bỏ dữ liệu trùng và cắt entry về max_entry_bytes, trả về JSON đã encode.
+        log_string trùng với logs (mỗi dict có exc_text), server dựng lại khi lưu.
+        """
+        entry = dict(log_data)
+        entry['task_id'] = task_id
+        if entry.get('logs'):
+            entry.pop('log_string', None)
+
+        data = self._encode(entry)
+        if len(data) <= self.max_entry_bytes:
+            return data
+
+        self._incr('truncated')
+        logs = entry.get('logs') or []
+        if logs:
+            # Giữ đầu và cuối (khởi động + kết quả), bỏ dần phần giữa
+            keep = len(logs)
+            while keep > 2 and len(data) > self.max_entry_bytes:
+                keep //= 2
+                head, tail = logs[:keep // 2], logs[-(keep - keep // 2):]
+                entry['logs'] = head + tail
+                entry['logs_truncated'] = len(logs) - len(entry['logs'])
+                data = self._encode(entry)
+        elif entry.get('log_string'):
+            log_string = entry['log_string']
+            entry['log_string'] = log_string[-(self.max_entry_bytes // 2):]
+            entry['log_string_truncated'] = len(log_string) - len(entry['log_string'])
+            data = self._encode(entry)
+        return data
+
+    # --- Background thread ---
+
+    def _collect_batch(self) -> List[bytes]:
+        batch: List[bytes] = []
+        batch_bytes = 0
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if self._stop_event.is_set():
+                remaining = 0
+            try:
+                entry = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(entry)
+            batch_bytes += len(entry)
+            if batch_bytes >= self.max_batch_bytes:
+                break
+        return batch
+
+    def _build_body(self, entries: List[bytes]) -> bytes:
+        client = self._encode(self.client_name)
+        return b'{"client_name":' + client + b',"entries":[' + b",".join(entries) + b"]}"
+
+    def _send(self, entries: List[bytes]) -> bool:
+        if self.legacy_mode:
+            return self._send_legacy(entries)
+        body = self._build_body(entries)
+        payload = gzip.compress(body, compresslevel=self.compress_level)
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with track_stage("log_shipping") as stage:
+                    stage.bytes = len(payload)
+                    response = self.session.post(self.url, data=payload, headers=headers, timeout=self.timeout)
+                    if response.status_code != 200:
+                        stage.outcome = "error"
+                if response.status_code == 200:
+                    self._incr('batches')
+                    self._incr('shipped', len(entries))
+                    self._incr('raw_bytes', len(body))
+                    self._incr('sent_bytes', len(payload))
+                    logger.info(f"📤 Shipped logs for {len(entries)} tasks "
+                                f"({len(body):,} -> {len(payload):,} bytes gzip)")
+                    return True
+                if response.status_code in LEGACY_FALLBACK_STATUSES and self.legacy_url:
+                    logger.warning(f"⚠️ Log batch route not available ({response.status_code}), "
+                                   f"falling back to {self.legacy_url}")
+                    self.legacy_mode = True
+                    return self._send_legacy(entries)
+                if response.status_code != 429 and response.status_code < 500:
+                    logger.error(f"❌ Log batch rejected: {response.status_code} {response.text[:200]}")
+                    break
+                logger.warning(f"⚠️ Log batch attempt {attempt}/{self.max_retries} failed: {response.status_code}")
+            except Exception as e:
+                logger.warning(f"⚠️ Log batch attempt {attempt}/{self.max_retries} failed: {e}")
+
+            if attempt < self.max_retries:
+                self._incr('retries')
+                # Khi đang stop vẫn retry nhưng không chờ lâu
+                self._stop_event.wait(self.retry_backoff * attempt)
+
+        self._incr('dropped_failed', len(entries))
+        logger.error(f"💥 Dropping logs for {len(entries)} tasks after {self.max_retries} attempts")
+        return False
+
+    def _send_legacy(self, entries: List[bytes]) -> bool:
+        """Gửi từng entry qua route cũ /task-logs/ (không nén), retry như batch"""
+        all_sent = True
+        for raw in entries:
+            log_data = json.loads(raw)
+            task_id = log_data.pop('task_id', 'unknown')
+            if log_data.get('logs') and 'log_string' not in log_data:
+                log_data['log_string'] = rebuild_log_string(log_data['logs'])
+            payload = {"task_id": task_id, "client_name": self.client_name, "log_data": log_data}
+            sent = False
+            for attempt in range(1, self.max_retries + 1):
+                retryable = True
+                try:
+                    response = self.session.post(self.legacy_url, json=payload, timeout=self.timeout)
+                    if response.status_code == 200:
+                        sent = True
+                        break
+                    retryable = response.status_code == 429 or response.status_code >= 500
+                    logger.warning(f"⚠️ Logs for task {task_id} attempt {attempt}/{self.max_retries} failed: "
+                                   f"{response.status_code} {response.text[:200]}")
+                except Exception as e:
+                    logger.warning(f"⚠️ Logs for task {task_id} attempt {attempt}/{self.max_retries} failed: {e}")
+                if not retryable or attempt == self.max_retries:
+                    break
+                self._incr('retries')
+                self._stop_event.wait(self.retry_backoff * attempt)
+            if sent:
+                self._incr('shipped')
+            else:
+                self._incr('dropped_failed')
+                all_sent = False
+        return all_sent
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                try:
+                    self._send(batch)
+                except Exception as e:
+                    logger.error(f"💥 Error in log shipper: {e}", exc_info=True)
+            elif self._stop_event.is_set():
+                break
@@ -0,0 +1,93 @@
+# utils/memory_budget.py - Semaphore theo số byte để giới hạn bộ nhớ dùng cho xử lý ảnh song song
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from utils.load_config import ConfigLoader
+
+DEFAULT_CONVERSION_BUDGET_MB = 1024
+
+
+class MemoryBudget:
+    """
+    Semaphore đếm theo byte. Mỗi tác vụ reserve số byte ước tính trước khi chạy,
+    và phải đợi nếu tổng đã reserve vượt capacity.
+
+    Một request lớn hơn capacity được clamp về capacity, tức là chạy một mình.
+    """
+
+    def __init__(self, capacity_bytes: int):
+        if capacity_bytes <= 0:
+            raise ValueError("capacity_bytes phải > 0")
+        self.capacity_bytes = capacity_bytes
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self.waits = 0
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None) -> int:
+        """
+        Reserve nbytes. Trả về số byte thực tế đã reserve (để truyền cho release).
+
+        Raises:
+            TimeoutError: Nếu không reserve được trong timeout giây.
+        """
+        nbytes = max(0, min(int(nbytes), self.capacity_bytes))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            waited = False
+            while self.used_bytes > 0 and self.used_bytes + nbytes > self.capacity_bytes:
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for {nbytes:,} bytes of memory budget")
+                self._cond.wait(remaining)
+            self.used_bytes += nbytes
+            self.active += 1
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+        return nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self._cond:
+            self.used_bytes = max(0, self.used_bytes - nbytes)
+            self.active = max(0, self.active - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: Optional[float] = None):
+        """Context manager: with budget.reserve(n): ..."""
+        reserved = self.acquire(nbytes, timeout)
+        try:
+            yield reserved
+        finally:
+            self.release(reserved)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'capacity_bytes': self.capacity_bytes,
+                'used_bytes': self.used_bytes,
+                'peak_bytes': self.peak_bytes,
+                'active': self.active,
+                'waits': self.waits,
+            }
+
+
+_conversion_budget: Optional[MemoryBudget] = None
+_conversion_budget_lock = threading.Lock()
+
+
+def get_conversion_budget() -> MemoryBudget:
+    """Budget dùng chung cho mọi conversion trong process (settings.conversion_memory_budget_mb)"""
+    global _conversion_budget
+    with _conversion_budget_lock:
+        if _conversion_budget is None:
+            budget_mb = ConfigLoader().get_config_value(
+                "settings.conversion_memory_budget_mb", DEFAULT_CONVERSION_BUDGET_MB
+            )
+            _conversion_budget = MemoryBudget(int(float(budget_mb) * 1024 * 1024))
+        return _conversion_budget
@@ -0,0 +1,407 @@
+# utils/metrics.py - Counter/Histogram/Gauge theo stage, xuất Prometheus text và JSON snapshot
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.load_config import ConfigLoader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BIND_ATTEMPTS = 3
+BIND_RETRY_SECONDS = 1.0
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "") or "") for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in items]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [{"labels": dict(zip(self.labelnames, key)), "value": value} for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class _HistogramState:
+    __slots__ = ("bucket_counts", "count", "sum", "max")
+
+    def __init__(self, bucket_count: int):
+        self.bucket_counts = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self.values: Dict[LabelValues, _HistogramState] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = _HistogramState(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state.bucket_counts[i] += 1
+                    break
+            state.count += 1
+            state.sum += value
+            state.max = max(state.max, value)
+
+    def _quantile(self, state: _HistogramState, q: float) -> float:
+        """Ước lượng quantile từ bucket (nội suy tuyến tính trong bucket)"""
+        if state.count == 0:
+            return 0.0
+        rank = q * state.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, state.bucket_counts):
+            if count and cumulative + count >= rank:
+                return min(lower + (bound - lower) * (rank - cumulative) / count, state.max)
+            cumulative += count
+            lower = bound
+        return state.max
+
+    def summary(self, group_by: Iterable[str] = ()) -> Dict[LabelValues, Dict[str, Any]]:
+        """Gộp các series theo một phần label (vd chỉ theo stage), trả về count/avg/p50/p95/max"""
+        indexes = [self.labelnames.index(name) for name in group_by]
+        merged: Dict[LabelValues, _HistogramState] = {}
+        with self.lock:
+            for key, state in self.values.items():
+                group = tuple(key[i] for i in indexes)
+                target = merged.get(group)
+                if target is None:
+                    target = merged[group] = _HistogramState(len(self.buckets))
+                target.bucket_counts = [a + b for a, b in zip(target.bucket_counts, state.bucket_counts)]
+                target.count += state.count
+                target.sum += state.sum
+                target.max = max(target.max, state.max)
+        return {group: {
+            "count": state.count,
+            "avg": round(state.sum / state.count, 6) if state.count else 0.0,
+            "p50": round(self._quantile(state, 0.5), 6),
+            "p95": round(self._quantile(state, 0.95), 6),
+            "max": round(state.max, 6),
+        } for group, state in sorted(merged.items())}
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted((key, list(s.bucket_counts), s.count, s.sum) for key, s in self.values.items())
+        lines = self.header()
+        for key, bucket_counts, count, total in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        result = []
+        with self.lock:
+            for key, state in sorted(self.values.items()):
+                result.append({
+                    "labels": dict(zip(self.labelnames, key)),
+                    "count": state.count,
+                    "sum": round(state.sum, 6),
+                    "avg": round(state.sum / state.count, 6) if state.count else 0.0,
+                    "p50": round(self._quantile(state, 0.5), 6),
+                    "p95": round(self._quantile(state, 0.95), 6),
+                    "max": round(state.max, 6),
+                })
+        return result
+
+
+class MetricsRegistry:
+    """Tập metrics của process; đăng ký lại cùng tên trả về metric đã có"""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Iterable[str], **kwargs) -> Any:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {
+            "timestamp": time.time(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "metrics": {metric.name: {"type": metric.kind, "values": metric.snapshot()} for metric in metrics},
+        }
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "mockup_stage_seconds", "Thời gian mỗi stage (poll, download, render, convert, upload, log_shipping)",
+    ("stage", "store", "product_type"))
+STAGE_TOTAL = metrics.counter(
+    "mockup_stage_total", "Số lần chạy mỗi stage theo kết quả", ("stage", "store", "product_type", "outcome"))
+STAGE_BYTES = metrics.counter(
+    "mockup_stage_bytes_total", "Số byte đi qua stage (download, upload, log_shipping)",
+    ("stage", "store", "product_type"))
+TASKS_TOTAL = metrics.counter(
+    "mockup_tasks_total", "Số task đã xử lý theo trạng thái cuối", ("store", "product_type", "status"))
+TASK_SECONDS = metrics.histogram(
+    "mockup_task_seconds", "Tổng thời gian một task từ lúc nhận đến lúc update", ("store", "product_type"))
+WORKER_RESOURCES = metrics.gauge(
+    "mockup_worker_resource", "Tài nguyên process sau task gần nhất (rss_bytes, handles, task_loggers, threads)",
+    ("resource",))
+WORKER_RSS_GROWTH = metrics.gauge(
+    "mockup_worker_rss_growth_bytes_per_task", "Độ dốc RSS theo số task trong cửa sổ watchdog")
+WORKER_RECYCLES = metrics.counter(
+    "mockup_worker_recycles_total", "Số lần watchdog yêu cầu recycle worker theo lý do", ("reason",))
+
+
+class StageTimer:
+    """Đo một stage; outcome mặc định 'ok', 'error' khi có exception, hoặc gán tay"""
+
+    def __init__(self, stage: str, store: str = "", product_type: str = ""):
+        self.stage = stage
+        self.store = store
+        self.product_type = product_type
+        self.outcome = "ok"
+        self.bytes = 0
+        self.start = 0.0
+
+    def __enter__(self) -> 'StageTimer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.start
+        if exc_type is not None and self.outcome == "ok":
+            self.outcome = "error"
+        labels = {"stage": self.stage, "store": self.store, "product_type": self.product_type}
+        STAGE_SECONDS.observe(elapsed, **labels)
+        STAGE_TOTAL.inc(outcome=self.outcome, **labels)
+        if self.bytes:
+            STAGE_BYTES.inc(self.bytes, **labels)
+        return False
+
+
+def track_stage(stage: str, store: str = "", product_type: str = "") -> StageTimer:
+    """with track_stage("render", task.store, task.product_type): ..."""
+    return StageTimer(stage, store or "", product_type or "")
+
+
+# --- Export ---
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = metrics
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in ("/metrics", "/"):
+            body = self.registry.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(self.registry.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Không ghi access log của mỗi lần scrape
+        pass
+
+
+class MetricsExporter:
+    """HTTP endpoint /metrics (Prometheus) + /metrics.json, và ghi JSON snapshot định kỳ"""
+
+    def __init__(self, registry: MetricsRegistry = metrics, host: str = "127.0.0.1", port: Optional[int] = None,
+                 snapshot_path: Optional[str] = None, snapshot_interval: float = 60):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'MetricsExporter':
+        loader = config_loader or ConfigLoader()
+        config = loader.get_config_value("app.metrics", {}) or {}
+        port = config.get("port")
+        return cls(
+            host=config.get("host", "127.0.0.1"),
+            port=int(port) if port else None,
+            snapshot_path=config.get("snapshot_path"),
+            snapshot_interval=float(config.get("snapshot_interval", 60)),
+        )
+
+    def _bind(self, handler, attempts: int = BIND_ATTEMPTS) -> Optional[ThreadingHTTPServer]:
+        """
+        Mở port, thử lại vài lần (process cũ sau recycle có thể chưa nhả port).
+        Port vẫn bận (worker khác cùng máy) thì log cảnh báo và chạy tiếp không có endpoint.
+        """
+        for attempt in range(attempts):
+            try:
+                return ThreadingHTTPServer((self.host, self.port), handler)
+            except OSError as e:
+                if attempt + 1 < attempts:
+                    time.sleep(BIND_RETRY_SECONDS)
+                    continue
+                logger.warning(f"⚠️ Metrics endpoint disabled, cannot bind {self.host}:{self.port}: {e}")
+        return None
+
+    def start(self) -> None:
+        if self.port is not None and self.server is None:
+            handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"registry": self.registry})
+            self.server = self._bind(handler)
+            if self.server is not None:
+                self.server.daemon_threads = True
+                thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+                logger.info(f"📈 Metrics endpoint: http://{self.host}:{self.server.server_address[1]}/metrics")
+        if self.snapshot_path:
+            thread = threading.Thread(target=self._snapshot_loop, name="metrics-snapshot", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def write_snapshot(self) -> None:
+        """Ghi snapshot JSON (file tạm rồi replace để reader không đọc file dở)"""
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.registry.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _snapshot_loop(self) -> None:
+        while not self._stop_event.wait(self.snapshot_interval):
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                print(f"Error writing metrics snapshot: {e}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.snapshot_path:
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                print(f"Error writing metrics snapshot: {e}")
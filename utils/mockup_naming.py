@@ -0,0 +1,166 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+LABELS = [
+    "best-selling",
+    "fashion-forward",
+    "high-quality",
+    "latest-model",
+    "new-arrival",
+    "premium-grade",
+    "top-rated",
+    "trendy"
+]
+
+_MK_INDEX_RE = re.compile(r'-MK-(\d+)', re.IGNORECASE)
+
+
+def get_index_from_filename(mockup_filename: str) -> Optional[int]:
+    """
+    Tìm số thứ tự (1-2-3...) trong tên file mockup, ví dụ JacketWow-MK-3.psd -> 3
+    """
+    match = _MK_INDEX_RE.search(mockup_filename)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def get_label_for_filename(mockup_filename: str, labels: list = LABELS, default_label: str = "main") -> str:
+    """
+    Chọn label tương ứng với hậu tố -MK-N của file mockup.
+    """
+    idx = get_index_from_filename(mockup_filename)
+    if idx is not None and 1 <= idx <= len(labels):
+        return labels[idx - 1]
+    return default_label
+
+
+def generate_image_filename(mockup_filename: str, image_filename: str, labels: list, default_label: str = "main") -> str:
+    """
+    Sinh tên file ảnh mới dựa vào tên mockup, tên file ảnh và danh sách label.
+    """
+    label = get_label_for_filename(mockup_filename, labels, default_label)
+    return f"{image_filename}-{label}"
+
+
+# --- Slug ---
+
+# Ký tự NFKD không tách được dấu (đ, ø, ß...) -> ASCII; phần còn lại để NFKD bỏ dấu
+_TRANSLITERATE = str.maketrans({
+    "đ": "d", "Đ": "D", "ð": "d", "Ð": "D", "ø": "o", "Ø": "O", "ł": "l", "Ł": "L",
+    "ß": "ss", "æ": "ae", "Æ": "AE", "œ": "oe", "Œ": "OE", "þ": "th", "Þ": "TH", "ı": "i",
+})
+# Trên bytes ASCII đã lower: ' ' -> '-', giữ a-z 0-9 '-', xoá mọi ký tự khác kể cả tab/newline (như create_slug cũ)
+_SLUG_KEEP = set(b"abcdefghijklmnopqrstuvwxyz0123456789-")
+_SLUG_TABLE = bytes(ord("-") if c == ord(" ") else c for c in range(256))
+_SLUG_DELETE = bytes(c for c in range(256) if c not in _SLUG_KEEP and c != ord(" "))
+_REPEATED_HYPHENS_RE = re.compile(rb"-{2,}")
+SLUG_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=SLUG_CACHE_SIZE)
+def slugify(text: str) -> str:
+    """
+    Slug ASCII cho tên sản phẩm: bỏ dấu tiếng Việt / Latin ("Áo thun Đỏ" -> "ao-thun-do") thay vì xoá ký tự.
+    Với chuỗi ASCII kết quả giống create_slug cũ. Cache LRU theo text (cùng sản phẩm cho nhiều PSD).
+    """
+    if not text:
+        return ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text.translate(_TRANSLITERATE))
+    data = text.lower().encode("ascii", "ignore").translate(_SLUG_TABLE, _SLUG_DELETE)
+    return _REPEATED_HYPHENS_RE.sub(b"-", data).strip(b"-").decode("ascii")
+
+
+# --- Output name ---
+
+class OutputNameAllocator:
+    """
+    Cấp tên output (không có extension) trong export_folder không trùng giữa các task đang chạy:
+
+    - trong process: dict (folder, name) -> owner, tên đã cấp thì thêm hậu tố -2, -3...
+    - giữa các process dùng chung output folder: file đánh dấu .<name>.reserved tạo bằng O_EXCL,
+      file quá stale_seconds (worker chết) được lấy lại
+    - cùng owner + key (vd task_id + psd) gọi lại, ví dụ khi retry, nhận lại đúng tên cũ
+    - release(owner) sau khi output đã upload xong; task chạy sau có thể ghi đè như trước
+    """
+
+    def __init__(self, marker_suffix: str = ".reserved", stale_seconds: float = 6 * 3600, max_suffix: int = 1000):
+        self.marker_suffix = marker_suffix
+        self.stale_seconds = stale_seconds
+        self.max_suffix = max_suffix
+        self.lock = threading.Lock()
+        self.reserved: Dict[Tuple[str, str], str] = {}
+        self.by_owner: Dict[str, Dict[Tuple[str, str], Tuple[str, str]]] = {}
+
+    def _marker_path(self, folder: str, name: str) -> str:
+        return os.path.join(folder, f".{name}{self.marker_suffix}")
+
+    def _claim_marker(self, folder: str, name: str, owner: str) -> bool:
+        marker = self._marker_path(folder, name)
+        for _ in range(2):
+            try:
+                fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(marker) < self.stale_seconds:
+                        return False
+                    os.remove(marker)  # Marker của worker đã chết
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(f"{owner} {os.getpid()}")
+            return True
+        return False
+
+    def allocate(self, export_folder: str, base_name: str, owner: str, key: Optional[str] = None) -> str:
+        """Tên không trùng cho base_name trong export_folder (export_folder phải tồn tại)"""
+        folder = os.path.normcase(os.path.abspath(export_folder))
+        request_key = (folder, key if key is not None else base_name)
+        with self.lock:
+            owned = self.by_owner.setdefault(owner, {})
+            if key is not None and request_key in owned:
+                return owned[request_key][1]
+            for index in range(1, self.max_suffix + 1):
+                name = base_name if index == 1 else f"{base_name}-{index}"
+                if (folder, name) in self.reserved:
+                    continue
+                if not self._claim_marker(export_folder, name, owner):
+                    continue
+                self.reserved[(folder, name)] = owner
+                owned[request_key if key is not None else (folder, f"{base_name}#{index}")] = (export_folder, name)
+                return name
+        raise RuntimeError(f"No free output name for '{base_name}' in {export_folder}")
+
+    def release(self, owner: str) -> int:
+        """Trả lại mọi tên của owner (xoá file đánh dấu)"""
+        with self.lock:
+            owned = self.by_owner.pop(owner, {})
+            for export_folder, name in owned.values():
+                self.reserved.pop((os.path.normcase(os.path.abspath(export_folder)), name), None)
+                try:
+                    os.remove(self._marker_path(export_folder, name))
+                except OSError:
+                    pass
+        return len(owned)
+
+    @contextmanager
+    def session(self, owner: str) -> Iterator['OutputNameAllocator']:
+        try:
+            yield self
+        finally:
+            self.release(owner)
+
+    def reserved_names(self, owner: str) -> List[str]:
+        with self.lock:
+            return [name for _, name in self.by_owner.get(owner, {}).values()]
+
+
+output_names = OutputNameAllocator()
@@ -0,0 +1,241 @@
+# utils/profiling.py - Profile CPU (cProfile) / bộ nhớ (tracemalloc) cho từng task khi cần
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.load_config import ConfigLoader
+
+PROFILE_MODES = ("cpu", "memory")
+PROFILE_PREFIX = "profile_"
+
+
+def parse_modes(value: Any, default: Iterable[str] = PROFILE_MODES) -> Tuple[str, ...]:
+    """
+    Chuẩn hóa giá trị bật profile: True -> default, "cpu" / "cpu,memory" / ["memory"] -> các mode đó,
+    False/None/"" -> ()
+    """
+    if value is None or value is False:
+        return ()
+    if value is True:
+        return tuple(default)
+    if isinstance(value, str):
+        value = [part.strip() for part in value.split(",")]
+    modes = tuple(mode for mode in PROFILE_MODES if mode in set(value))
+    return modes
+
+
+class _ProfileSession:
+    """Một lần profile: bật cProfile/tracemalloc khi vào, ghi report khi ra"""
+
+    def __init__(self, profiler: 'TaskProfiler', task_id: str, modes: Tuple[str, ...]):
+        self.profiler = profiler
+        self.task_id = task_id
+        self.modes = modes
+        self.reports: Dict[str, Any] = {}
+        self.cpu: Optional[cProfile.Profile] = None
+        self.snapshot_before: Optional[tracemalloc.Snapshot] = None
+        self.started = 0.0
+
+    def __enter__(self) -> '_ProfileSession':
+        if "memory" in self.modes:
+            self.profiler._start_tracemalloc()
+            self.snapshot_before = tracemalloc.take_snapshot()
+        if "cpu" in self.modes:
+            self.cpu = cProfile.Profile()
+            try:
+                self.cpu.enable()
+            except ValueError as e:
+                # Đã có profiler khác đang chạy trên thread này
+                self.reports["cpu"] = {"error": str(e)}
+                self.cpu = None
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = time.perf_counter() - self.started
+        if self.cpu is not None:
+            self.cpu.disable()
+        stem = f"{PROFILE_PREFIX}{self.task_id}_{time.strftime('%Y%m%d_%H%M%S')}"
+        try:
+            if self.cpu is not None:
+                self.reports["cpu"] = self.profiler._write_cpu_report(self.cpu, stem, duration)
+            if self.snapshot_before is not None:
+                snapshot_after = tracemalloc.take_snapshot()
+                self.reports["memory"] = self.profiler._write_memory_report(
+                    self.snapshot_before, snapshot_after, stem)
+        except Exception as e:
+            self.reports["error"] = str(e)
+        finally:
+            if self.snapshot_before is not None:
+                self.profiler._stop_tracemalloc()
+        self.reports["duration"] = round(duration, 4)
+        return False
+
+
+class TaskProfiler:
+    """
+    Bọc process_task bằng cProfile và/hoặc tracemalloc cho các task được chọn:
+    - field "profile" trên task (True, "cpu", "memory", "cpu,memory")
+    - task_ids trong config
+    - sample_rate: tỉ lệ task được profile, quyết định theo hash của task_id
+
+    Report ghi cạnh task log (logs/tasks): <stem>.pstats mở bằng `python -m pstats` hoặc snakeviz,
+    <stem>.alloc.txt là top allocation theo dòng code. Đường dẫn được gắn vào log_data["profile"].
+    Khi không có task nào được chọn, call() chỉ kiểm tra vài điều kiện rồi gọi thẳng hàm.
+    """
+
+    def __init__(self, enabled: bool = False, modes: Iterable[str] = PROFILE_MODES,
+                 task_ids: Iterable[str] = (), sample_rate: float = 0.0, allow_task_field: bool = True,
+                 output_dir: str = os.path.join("logs", "tasks"), top_n: int = 30,
+                 traceback_frames: int = 1, retention_days: float = 7):
+        self.enabled = enabled
+        self.modes = parse_modes(list(modes))
+        self.task_ids = set(str(task_id) for task_id in task_ids)
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.allow_task_field = allow_task_field
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.traceback_frames = max(1, traceback_frames)
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self._tracemalloc_users = 0
+        self._tracemalloc_owned = False
+        self.profiled = 0
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'TaskProfiler':
+        loader = config_loader or ConfigLoader()
+        config = loader.get_config_value("app.profiling", {}) or {}
+        return cls(
+            enabled=bool(config.get("enabled", False)),
+            modes=config.get("modes", list(PROFILE_MODES)),
+            task_ids=config.get("task_ids", []),
+            sample_rate=float(config.get("sample_rate", 0.0)),
+            allow_task_field=bool(config.get("allow_task_field", True)),
+            output_dir=config.get("output_dir", os.path.join("logs", "tasks")),
+            top_n=int(config.get("top_n", 30)),
+            traceback_frames=int(config.get("traceback_frames", 1)),
+            retention_days=float(config.get("retention_days", 7)),
+        )
+
+    # --- Chọn task ---
+
+    def modes_for(self, task: Dict[str, Any]) -> Tuple[str, ...]:
+        """Các mode cần profile cho task này, () nếu không profile"""
+        if self.allow_task_field and task.get("profile"):
+            return parse_modes(task.get("profile"), self.modes)
+        if not self.enabled:
+            return ()
+        task_id = str(task.get("id", ""))
+        if task_id in self.task_ids:
+            return self.modes
+        if self.sample_rate > 0 and (zlib.crc32(task_id.encode("utf-8")) % 10000) < self.sample_rate * 10000:
+            return self.modes
+        return ()
+
+    def profile(self, task_id: str, modes: Iterable[str] = PROFILE_MODES) -> _ProfileSession:
+        return _ProfileSession(self, str(task_id), parse_modes(list(modes)))
+
+    def call(self, task: Dict[str, Any], func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Gọi func(*args, **kwargs), profile nếu task được chọn.
+        Nếu func trả về (images, log_data) thì report được gắn vào log_data["profile"].
+        """
+        modes = self.modes_for(task)
+        if not modes:
+            return func(*args, **kwargs)
+
+        session = self.profile(task.get("id", "unknown"), modes)
+        with session:
+            result = func(*args, **kwargs)
+        self.profiled += 1
+        if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], dict):
+            result[1]["profile"] = session.reports
+        return result
+
+    # --- tracemalloc (global cho cả process, đếm số session đang dùng) ---
+
+    def _start_tracemalloc(self) -> None:
+        with self.lock:
+            if self._tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(self.traceback_frames)
+                self._tracemalloc_owned = True
+            self._tracemalloc_users += 1
+
+    def _stop_tracemalloc(self) -> None:
+        with self.lock:
+            self._tracemalloc_users = max(0, self._tracemalloc_users - 1)
+            if self._tracemalloc_users == 0 and self._tracemalloc_owned:
+                tracemalloc.stop()
+                self._tracemalloc_owned = False
+
+    # --- Report ---
+
+    def _write_cpu_report(self, profile: cProfile.Profile, stem: str, duration: float) -> Dict[str, Any]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{stem}.pstats")
+        profile.dump_stats(path)
+
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        top: List[Dict[str, Any]] = []
+        for func, (_, ncalls, tottime, cumtime, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:10]:
+            filename, line, name = func
+            top.append({
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "calls": ncalls,
+                "tottime": round(tottime, 4),
+                "cumtime": round(cumtime, 4),
+            })
+        self._prune()
+        return {"path": path, "total_calls": stats.total_calls, "top_cumulative": top}
+
+    def _write_memory_report(self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot,
+                             stem: str) -> Dict[str, Any]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{stem}.alloc.txt")
+        # Bỏ allocation của chính tracemalloc/cProfile và import lazy
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        net_bytes = sum(stat.size_diff for stat in diff)
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Top {self.top_n} allocations (lineno, after - before)\n")
+            f.write(f"Net: {net_bytes:+,} bytes | Traced now: {current:,} bytes | Peak: {peak:,} bytes\n\n")
+            for stat in diff[:self.top_n]:
+                f.write(f"{stat}\n")
+        self._prune()
+        return {
+            "path": path,
+            "net_bytes": net_bytes,
+            "peak_bytes": peak,
+            "top": [str(stat) for stat in diff[:5]],
+        }
+
+    def _prune(self) -> None:
+        """Xóa report cũ hơn retention_days (chỉ chạy khi có task được profile)"""
+        if not self.retention_days:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            with os.scandir(self.output_dir) as it:
+                for item in it:
+                    if item.name.startswith(PROFILE_PREFIX) and item.stat().st_mtime < cutoff:
+                        os.remove(item.path)
+        except OSError as e:
+            print(f"Error pruning profile reports in {self.output_dir}: {e}")
+
+
+task_profiler = TaskProfiler.from_config()
@@ -0,0 +1,303 @@
+# utils/psd_manifest.py - Manifest metadata của PSD template, build offline (không cần Photoshop)
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.load_config import ConfigLoader
+from utils.mockup_naming import LABELS, get_index_from_filename, get_label_for_filename
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST_PATH = os.path.join("statics", "psd_manifest.json")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_manifest_path() -> str:
+    """Đường dẫn file manifest theo config (app.psd_manifest_path), chấp nhận cả \\ lẫn / làm phân cách"""
+    path = ConfigLoader().get_config_value("app.psd_manifest_path", DEFAULT_MANIFEST_PATH)
+    # Config viết theo kiểu Windows ("statics\\psd_manifest.json") vẫn đúng khi chạy trên Linux
+    return os.path.normpath(path.replace("\\", "/"))
+
+
+def hash_file(file_path: str) -> str:
+    """Tính sha1 của nội dung file theo từng chunk"""
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _smart_object_size(layer) -> Dict[str, int]:
+    """Kích thước gốc của smart object (Sz trong placed layer), fallback về bbox của layer"""
+    try:
+        config = layer.smart_object._config
+        size = config.get(b'Sz  ') if config is not None else None
+        if size is not None:
+            return {"width": int(size.get(b'Wdth')), "height": int(size.get(b'Hght'))}
+    except Exception:
+        pass
+    return {"width": int(layer.width), "height": int(layer.height)}
+
+
+def read_psd_metadata(psd_path: str) -> Dict[str, Any]:
+    """
+    Đọc metadata của một file PSD bằng psd-tools.
+
+    Args:
+        psd_path: Đường dẫn file PSD.
+
+    Returns:
+        Dict gồm kích thước canvas, color mode, danh sách layer và smart object.
+        Các thông tin phụ thuộc tên file (label -MK-N) nằm ở entry của file, không ở đây.
+
+    Raises:
+        ImportError: Nếu psd-tools chưa được cài đặt.
+    """
+    from psd_tools import PSDImage
+
+    psd = PSDImage.open(psd_path)
+    layers: List[str] = []
+    smart_objects: List[Dict[str, Any]] = []
+
+    for layer in psd.descendants():
+        layers.append(layer.name)
+        if layer.kind == "smartobject":
+            smart_object = {
+                "name": layer.name,
+                "bbox": list(layer.bbox),
+            }
+            smart_object.update(_smart_object_size(layer))
+            smart_objects.append(smart_object)
+
+    color_mode = psd.color_mode
+    return {
+        "width": psd.width,
+        "height": psd.height,
+        "color_mode": getattr(color_mode, "name", str(color_mode)),
+        "depth": psd.depth,
+        "layers": layers,
+        "smart_objects": smart_objects,
+    }
+
+
+class PsdManifest:
+    """
+    Index metadata của PSD template, key theo content hash.
+
+    Layout file JSON:
+        files:     {relative_path: {hash, size, mtime_ns, mk_index, label}}
+        templates: {hash: metadata}
+    """
+
+    def __init__(self, manifest_path: Optional[str] = None):
+        self.manifest_path = manifest_path or get_manifest_path()
+        self.root = ""
+        self.generated_at = None
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.templates: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, manifest_path: Optional[str] = None) -> 'PsdManifest':
+        """Đọc manifest từ file. Nếu file không tồn tại hoặc lỗi trả về manifest rỗng."""
+        manifest = cls(manifest_path)
+        try:
+            with open(manifest.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                manifest.root = data.get("root", "")
+                manifest.generated_at = data.get("generated_at")
+                manifest.files = data.get("files", {})
+                manifest.templates = data.get("templates", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return manifest
+
+    def save(self) -> None:
+        """Ghi manifest dạng JSON compact, atomic qua file tạm"""
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "generated_at": self.generated_at,
+            "root": self.root,
+            "files": self.files,
+            "templates": self.templates,
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.manifest_path)
+
+    def _relative_key(self, psd_path: str) -> str:
+        try:
+            rel_path = os.path.relpath(psd_path, self.root) if self.root else psd_path
+        except ValueError:
+            # Khác ổ đĩa trên Windows
+            rel_path = psd_path
+        return rel_path.replace("\\", "/")
+
+    def _describe(self, rel_path: str, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        template = self.templates.get(entry["hash"])
+        if template is None:
+            return None
+        result = dict(template)
+        result.update({
+            "path": rel_path,
+            "hash": entry["hash"],
+            "mk_index": entry.get("mk_index"),
+            "label": entry.get("label"),
+        })
+        return result
+
+    def get_template(self, psd_path: str) -> Optional[Dict[str, Any]]:
+        """Lấy metadata của template theo đường dẫn PSD (tuyệt đối hoặc tương đối so với root)"""
+        rel_key = self._relative_key(psd_path)
+        entry = self.files.get(rel_key)
+        if entry is None:
+            rel_key = psd_path.replace("\\", "/")
+            entry = self.files.get(rel_key)
+        if entry is None:
+            return None
+        return self._describe(rel_key, entry)
+
+    def templates_for_folder(self, folder_name: str) -> Dict[str, Dict[str, Any]]:
+        """Lấy metadata của tất cả template trong một thư mục mockup (vd: '<store>-<product_type>')"""
+        prefix = folder_name.rstrip("/") + "/"
+        result = {}
+        for rel_path, entry in self.files.items():
+            if rel_path.startswith(prefix):
+                template = self._describe(rel_path, entry)
+                if template is not None:
+                    result[rel_path] = template
+        return result
+
+    def max_smart_object_size(self, folder_name: str) -> Optional[Tuple[int, int]]:
+        """
+        (width, height) lớn nhất của smart object trong một thư mục mockup (lấy max từng chiều riêng),
+        None nếu manifest chưa có thư mục này. Height 0 nếu manifest không ghi height.
+        """
+        sizes = [(smart_object.get("width", 0) or 0, smart_object.get("height", 0) or 0)
+                 for template in self.templates_for_folder(folder_name).values()
+                 for smart_object in template.get("smart_objects", [])]
+        sizes = [size for size in sizes if size[0]]
+        if not sizes:
+            return None
+        return max(width for width, _ in sizes), max(height for _, height in sizes)
+
+    def build(self, mockup_folder: str, full: bool = False) -> Dict[str, int]:
+        """
+        Scan mockup_folder và cập nhật manifest.
+
+        Chỉ parse lại các file có size/mtime thay đổi, trừ khi full=True.
+        File trùng nội dung (cùng hash) chỉ được parse một lần.
+
+        Returns:
+            Thống kê: scanned, reused, parsed, removed, errors.
+        """
+        if self.root and os.path.normcase(os.path.abspath(self.root)) != os.path.normcase(os.path.abspath(mockup_folder)):
+            # Đổi root, không thể dùng lại các key cũ
+            self.files = {}
+            self.templates = {}
+        self.root = mockup_folder
+
+        stats = {"scanned": 0, "reused": 0, "parsed": 0, "removed": 0, "errors": 0}
+        previous_files = {} if full else self.files
+        new_files: Dict[str, Dict[str, Any]] = {}
+        new_templates: Dict[str, Dict[str, Any]] = {}
+
+        for dir_path, _, file_names in os.walk(mockup_folder):
+            for file_name in file_names:
+                if not file_name.lower().endswith(".psd"):
+                    continue
+                psd_path = os.path.join(dir_path, file_name)
+                rel_key = self._relative_key(psd_path)
+                stats["scanned"] += 1
+
+                try:
+                    st = os.stat(psd_path)
+                    previous = previous_files.get(rel_key)
+                    if (previous and previous["size"] == st.st_size and
+                            previous["mtime_ns"] == st.st_mtime_ns and
+                            previous["hash"] in self.templates):
+                        content_hash = previous["hash"]
+                        new_templates[content_hash] = self.templates[content_hash]
+                        stats["reused"] += 1
+                    else:
+                        content_hash = hash_file(psd_path)
+                        if content_hash in new_templates:
+                            stats["reused"] += 1
+                        elif not full and content_hash in self.templates:
+                            new_templates[content_hash] = self.templates[content_hash]
+                            stats["reused"] += 1
+                        else:
+                            new_templates[content_hash] = read_psd_metadata(psd_path)
+                            stats["parsed"] += 1
+                            logger.info(f"🧩 Parsed template: {rel_key}")
+
+                    new_files[rel_key] = {
+                        "hash": content_hash,
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "mk_index": get_index_from_filename(file_name),
+                        "label": get_label_for_filename(file_name, LABELS),
+                    }
+                except ImportError:
+                    raise
+                except Exception as e:
+                    stats["errors"] += 1
+                    logger.error(f"❌ Failed to read template {rel_key}: {e}")
+
+        stats["removed"] = len(set(self.files) - set(new_files))
+        self.files = new_files
+        self.templates = new_templates
+        self.generated_at = datetime.now().isoformat()
+        return stats
+
+
+def build_manifest(mockup_folder: Optional[str] = None, manifest_path: Optional[str] = None,
+                   full: bool = False) -> Dict[str, int]:
+    """Build (incremental) và lưu manifest cho mockup_folder"""
+    if mockup_folder is None:
+        mockup_folder = ConfigLoader().get_config_value("app.mockup_folder", "")
+    if not mockup_folder or not os.path.isdir(mockup_folder):
+        raise FileNotFoundError(f"Mockup folder not found: {mockup_folder}")
+
+    manifest = PsdManifest.load(manifest_path)
+    start_time = time.time()
+    stats = manifest.build(mockup_folder, full=full)
+    manifest.save()
+    logger.info(
+        f"✅ Manifest saved: {manifest.manifest_path} | Templates: {len(manifest.templates)}, "
+        f"Scanned: {stats['scanned']}, Parsed: {stats['parsed']}, Reused: {stats['reused']}, "
+        f"Removed: {stats['removed']}, Errors: {stats['errors']} ({time.time() - start_time:.2f}s)"
+    )
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build PSD template manifest from app.mockup_folder")
+    parser.add_argument("--mockup-folder", help="Thư mục mockup (mặc định: app.mockup_folder)")
+    parser.add_argument("--output", help="File manifest (mặc định: app.psd_manifest_path)")
+    parser.add_argument("--full", action="store_true", help="Parse lại toàn bộ, bỏ qua cache")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        stats = build_manifest(args.mockup_folder, args.output, full=args.full)
+    except Exception as e:
+        logger.error(f"💥 Manifest build failed: {e}")
+        return 1
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,130 @@
-from fastapi.responses import JSONResponse
-from typing import Any, Optional, Dict
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional, Dict, Union
 import json
-import re
-from datetime import datetime
-from schemas.api_response import APIResponseSchema
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from uuid import UUID
+from pydantic import BaseModel
+from utils.mockup_naming import slugify
+
+# Số item encode thành một chunk của stream_json_response
+STREAM_CHUNK_ITEMS = 256
 
 
 def create_slug(text: str) -> str:
     """
     Create a URL-friendly slug from text.
+    Bỏ dấu tiếng Việt/Latin thay vì xoá ("Áo thun" -> "ao-thun"), có cache; xem utils.mockup_naming.slugify.
     """
-    # Convert to lowercase and replace spaces with hyphens
-    slug = text.lower().replace(' ', '-')
-    
-    # Remove special characters except hyphens and alphanumeric
-    slug = re.sub(r'[^a-z0-9\-]', '', slug)
-    
-    # Remove multiple consecutive hyphens
-    slug = re.sub(r'-+', '-', slug)
-    
-    # Remove leading/trailing hyphens
-    slug = slug.strip('-')
-    
-    return slug
-
-
-def convert_datetime_to_isoformat(obj: Any) -> Any:
+    return slugify(text)
+
+
+def json_default(obj: Any) -> Any:
     """
-    Recursively convert datetime objects to ISO format strings.
-    This handles nested dictionaries and lists.
+    default hook cho json encoder: chỉ được gọi với object json không encode được,
+    nên không phải duyệt và copy lại cả payload trước khi encode.
     """
-    if isinstance(obj, dict):
-        return {k: convert_datetime_to_isoformat(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_datetime_to_isoformat(item) for item in obj]
-    elif isinstance(obj, datetime):
+    if isinstance(obj, (datetime, date, time)):
         return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(exclude_none=True)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (UUID, Decimal)):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# Cùng tham số với JSONResponse.render, thêm default hook
+_ENCODER = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=json_default)
+
+
+def encode_json(content: Any) -> bytes:
+    """Encode một lần ra bytes UTF-8 (datetime -> ISO format)"""
+    return _ENCODER.encode(content).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encode trực tiếp bằng encode_json, không cần chuẩn hóa payload trước"""
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def build_envelope(success: bool, message: str, data: Any = None, errors: Optional[Dict] = None,
+                   meta: Optional[Dict] = None) -> Dict[str, Any]:
+    """Dict cùng shape với APIResponseSchema(...).model_dump(exclude_none=True)"""
+    envelope: Dict[str, Any] = {"success": success, "message": message}
+    if data is not None:
+        envelope["data"] = data
+    if errors is not None:
+        envelope["errors"] = errors
+    if meta is not None:
+        envelope["meta"] = meta
+    return envelope
+
+
+def _encode_batch(batch: list, first: bool) -> bytes:
+    # Encode cả batch một lần rồi bỏ "[" "]": nhanh hơn encode từng item rồi join
+    encoded = _ENCODER.encode(batch)[1:-1]
+    return (encoded if first else "," + encoded).encode("utf-8")
+
+
+def _iter_json_chunks(head: bytes, items: Iterable[Any], tail: bytes, chunk_items: int) -> Iterator[bytes]:
+    yield head
+    batch = []
+    first = True
+    for item in items:
+        batch.append(item)
+        if len(batch) >= chunk_items:
+            yield _encode_batch(batch, first)
+            first = False
+            batch = []
+    if batch:
+        yield _encode_batch(batch, first)
+    yield tail
+
+
+async def _aiter_json_chunks(head: bytes, items: AsyncIterator[Any], tail: bytes,
+                             chunk_items: int) -> AsyncIterator[bytes]:
+    yield head
+    batch = []
+    first = True
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= chunk_items:
+            yield _encode_batch(batch, first)
+            first = False
+            batch = []
+    if batch:
+        yield _encode_batch(batch, first)
+    yield tail
+
+
+def stream_json_response(
+    items: Union[Iterable[Any], AsyncIterator[Any]],
+    message: str = "Operation successful",
+    meta: Optional[Dict] = None,
+    status_code: int = 200,
+    chunk_items: int = STREAM_CHUNK_ITEMS
+) -> StreamingResponse:
+    """
+    Response dạng success_response với data là list, encode và gửi dần từng nhóm chunk_items item.
+    Dùng cho list lớn (danh sách task, dump log): không giữ cả list và cả body trong bộ nhớ.
+    items có thể là iterable thường hoặc async iterator (vd đọc từ DB theo batch).
+    """
+    envelope = encode_json(build_envelope(True, message, meta=meta))
+    # Chèn "data":[ ... ] vào cuối envelope: {"success":true,"message":"..."[,"meta":{...}],"data":[...]}
+    head = envelope[:-1] + b',"data":['
+    tail = b"]}"
+    if hasattr(items, "__aiter__"):
+        body = _aiter_json_chunks(head, items, tail, chunk_items)
     else:
-        return obj
+        body = _iter_json_chunks(head, items, tail, chunk_items)
+    return StreamingResponse(body, status_code=status_code, media_type="application/json")
 
 
 def success_response(
@@ -48,20 +135,11 @@ def success_response(
 ) -> JSONResponse:
     """
     Create a successful JSON response with proper datetime serialization.
+    Shape giống APIResponseSchema; encode một lần, datetime xử lý trong json_default.
     """
-    response_data = APIResponseSchema(
-        success=True,
-        message=message,
-        data=data,
-        meta=meta
-    ).model_dump(exclude_none=True)
-    
-    # Convert datetime objects to ISO format strings
-    response_data = convert_datetime_to_isoformat(response_data)
-    
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=status_code,
-        content=response_data
+        content=build_envelope(True, message, data=data, meta=meta)
     )
 
 def error_response(
@@ -75,16 +153,7 @@ def error_response(
     if errors and isinstance(errors, str):
         errors = {"detail": errors}
 
-    response_data = APIResponseSchema(
-        success=False,
-        message=message,
-        errors=errors
-    ).model_dump(exclude_none=True)
-    
-    # Convert datetime objects to ISO format strings
-    response_data = convert_datetime_to_isoformat(response_data)
-
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=status_code,
-        content=response_data
+        content=build_envelope(False, message, errors=errors)
     )
\ No newline at end of file
@@ -0,0 +1,313 @@
+# utils/scratch_space.py - Thư mục làm việc tạm cho mỗi task trên volume nhanh (tmpfs/RAM disk), quota và dọn dẹp
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.load_config import ConfigLoader
+
+try:
+    import psutil
+except ImportError:  # Thiếu psutil thì GC chỉ dựa vào tuổi thư mục
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+TASKS_DIR_NAME = "tasks"
+DOWNLOADS_DIR_NAME = "downloads"
+OWNER_FILE_NAME = ".owner"
+MB = 1024 * 1024
+_UNSAFE_CHARS_RE = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+def default_scratch_root() -> str:
+    """/dev/shm (tmpfs) nếu có, không thì thư mục temp của hệ điều hành"""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, "mockup-scratch")
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += _tree_size(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+    return total
+
+
+def _read_owner(task_dir: str) -> Tuple[Optional[int], Optional[float]]:
+    """(pid, created) từ file .owner; (None, None) nếu không đọc được"""
+    try:
+        with open(os.path.join(task_dir, OWNER_FILE_NAME), "r", encoding="utf-8") as f:
+            pid, created = f.read().split()[:2]
+        return int(pid), float(created)
+    except (OSError, ValueError):
+        return None, None
+
+
+def _pid_alive(pid: int) -> bool:
+    if psutil is None:
+        return True
+    try:
+        return psutil.pid_exists(pid)
+    except Exception:
+        return True
+
+
+class ScratchSpace:
+    """
+    Layout (fallback_root trên ổ chính có cùng layout):
+        <root>/tasks/<task_id>-<pid>/     thư mục làm việc của task (PNG export từ Photoshop, file convert)
+        <root>/tasks/<...>/.owner          "<pid> <created>" để GC biết thư mục còn chủ không
+        <root>/downloads/                  cache ảnh input (ImageDownloadCache)
+
+    - task_dir(): tạo thư mục cho task; root vượt quota hoặc hết chỗ thì dùng fallback_root
+    - promote(): chỉ chuyển output cuối cùng ra export folder (os.replace, khác volume thì copy rồi xoá)
+    - release(): xoá cả thư mục task một lần thay vì xoá lẻ từng file trung gian
+    - collect_garbage(): lúc worker khởi động, xoá thư mục task của process đã chết / quá stale_seconds
+      và ảnh download quá download_max_age_seconds
+    Quota tính trên tasks/ + downloads/ của root; thiếu chỗ thì xoá ảnh download cũ nhất trước
+    (trừ file mới dùng trong protect_seconds, có thể là input của task đang chạy).
+    """
+
+    def __init__(self, root: Optional[str] = None, fallback_root: str = "scratch", quota_bytes: Optional[int] = None,
+                 task_reserve_bytes: int = 256 * MB, stale_seconds: float = 24 * 3600,
+                 download_max_age_seconds: float = 72 * 3600, protect_seconds: float = 3600, enabled: bool = True):
+        self.enabled = enabled
+        self.fallback_root = os.path.abspath(fallback_root)
+        self.root = os.path.abspath(root or default_scratch_root()) if enabled else self.fallback_root
+        self.quota_bytes = quota_bytes
+        self.task_reserve_bytes = task_reserve_bytes
+        self.stale_seconds = stale_seconds
+        self.download_max_age_seconds = download_max_age_seconds
+        self.protect_seconds = protect_seconds
+        self.lock = threading.RLock()
+        self.active: Dict[str, str] = {}  # task_id -> thư mục làm việc
+        self.stats = {"tasks": 0, "fallbacks": 0, "released": 0, "promoted": 0, "promoted_bytes": 0,
+                      "copied_across_volumes": 0, "evicted_downloads": 0, "evicted_bytes": 0,
+                      "gc_task_dirs": 0, "gc_downloads": 0}
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'ScratchSpace':
+        """Tạo từ config app.scratch"""
+        loader = config_loader or ConfigLoader()
+        config = loader.get_config_value("app.scratch", {}) or {}
+        quota_mb = config.get("quota_mb")
+        return cls(
+            root=config.get("root") or None,
+            fallback_root=config.get("fallback_root") or "scratch",
+            quota_bytes=int(float(quota_mb) * MB) if quota_mb else None,
+            task_reserve_bytes=int(float(config.get("task_reserve_mb", 256)) * MB),
+            stale_seconds=float(config.get("stale_hours", 24)) * 3600,
+            download_max_age_seconds=float(config.get("download_max_age_hours", 72)) * 3600,
+            enabled=bool(config.get("enabled", True)),
+        )
+
+    @property
+    def downloads_dir(self) -> str:
+        return os.path.join(self.root, DOWNLOADS_DIR_NAME)
+
+    # --- Quota ---
+
+    def usage_bytes(self) -> int:
+        """Dung lượng đang dùng trên root (tasks/ + downloads/)"""
+        return _tree_size(os.path.join(self.root, TASKS_DIR_NAME)) + _tree_size(self.downloads_dir)
+
+    def _download_files(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) của ảnh trong downloads/, bỏ qua file index (tên bắt đầu bằng '.')"""
+        files = []
+        try:
+            entries = list(os.scandir(self.downloads_dir))
+        except OSError:
+            return files
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def _remove_downloads(self, files: List[Tuple[float, int, str]], needed: Optional[int] = None) -> int:
+        """Xoá từ file cũ nhất tới khi đủ needed byte (None: xoá hết danh sách). Trả về số byte đã xoá."""
+        freed = 0
+        for _, size, path in sorted(files):
+            if needed is not None and freed >= needed:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            freed += size
+            self.stats["evicted_downloads"] += 1
+            self.stats["evicted_bytes"] += size
+        return freed
+
+    def ensure_room(self, nbytes: int) -> bool:
+        """Root còn đủ nbytes (quota và dung lượng trống của volume), xoá ảnh download cũ nếu cần"""
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            free = shutil.disk_usage(self.root).free
+        except OSError as e:
+            logger.warning(f"⚠️ Scratch root unavailable: {self.root} ({e})")
+            return False
+        with self.lock:
+            if self.quota_bytes:
+                used = self.usage_bytes()
+                over = used + nbytes - self.quota_bytes
+                if over > 0:
+                    cutoff = time.time() - self.protect_seconds
+                    evictable = [item for item in self._download_files() if item[0] < cutoff]
+                    used -= self._remove_downloads(evictable, needed=over)
+                if used + nbytes > self.quota_bytes:
+                    return False
+            if free < nbytes:
+                cutoff = time.time() - self.protect_seconds
+                evictable = [item for item in self._download_files() if item[0] < cutoff]
+                free += self._remove_downloads(evictable, needed=nbytes - free)
+            return free >= nbytes
+
+    def touch(self, path: str) -> None:
+        """Đánh dấu ảnh download vừa được dùng lại (không bị evict trong protect_seconds)"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    # --- Task dirs ---
+
+    def task_dir(self, task_id: str) -> str:
+        """Thư mục làm việc của task (tạo nếu chưa có); gọi lại trong cùng task trả về cùng thư mục"""
+        task_id = str(task_id)
+        with self.lock:
+            path = self.active.get(task_id)
+            if path is not None and os.path.isdir(path):
+                return path
+            base = self.root
+            if base != self.fallback_root and not self.ensure_room(self.task_reserve_bytes):
+                base = self.fallback_root
+                self.stats["fallbacks"] += 1
+                logger.warning(f"⚠️ Scratch space full, task {task_id} uses fallback: {self.fallback_root}")
+            name = f"{_UNSAFE_CHARS_RE.sub('_', task_id)[:80]}-{os.getpid()}"
+            path = os.path.join(base, TASKS_DIR_NAME, name)
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, OWNER_FILE_NAME), "w", encoding="utf-8") as f:
+                f.write(f"{os.getpid()} {time.time()}")
+            self.active[task_id] = path
+            self.stats["tasks"] += 1
+            return path
+
+    def promote(self, task_id: str, paths: List[str], dest_folder: str) -> List[str]:
+        """Chuyển output cuối cùng ra dest_folder (giữ tên file), trả về đường dẫn mới theo thứ tự"""
+        os.makedirs(dest_folder, exist_ok=True)
+        promoted = []
+        for path in paths:
+            target = os.path.join(dest_folder, os.path.basename(path))
+            if os.path.abspath(path) == os.path.abspath(target):
+                promoted.append(target)
+                continue
+            size = os.path.getsize(path)
+            try:
+                os.replace(path, target)
+            except OSError:
+                # Khác volume (tmpfs -> ổ chính): copy ra file tạm cạnh đích rồi replace, không để file dở
+                tmp_path = f"{target}.{os.getpid()}.tmp"
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, target)
+                os.remove(path)
+                self.stats["copied_across_volumes"] += 1
+            self.stats["promoted"] += 1
+            self.stats["promoted_bytes"] += size
+            promoted.append(target)
+        return promoted
+
+    def release(self, task_id: str) -> None:
+        """Xoá thư mục làm việc của task (cả file trung gian)"""
+        with self.lock:
+            path = self.active.pop(str(task_id), None)
+        if path is None:
+            return
+        shutil.rmtree(path, ignore_errors=True)
+        self.stats["released"] += 1
+
+    # --- GC ---
+
+    def collect_garbage(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Dọn thư mục task bị bỏ lại (process chết giữa chừng) trên root và fallback_root,
+        và ảnh download quá download_max_age_seconds. Gọi lúc worker khởi động.
+        """
+        now = time.time() if now is None else now
+        removed_dirs = 0
+        with self.lock:
+            active = set(self.active.values())
+        for base in sorted({self.root, self.fallback_root}):
+            tasks_dir = os.path.join(base, TASKS_DIR_NAME)
+            try:
+                entries = list(os.scandir(tasks_dir))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False) or entry.path in active:
+                    continue
+                pid, created = _read_owner(entry.path)
+                if created is None:
+                    try:
+                        created = entry.stat(follow_symlinks=False).st_mtime
+                    except OSError:
+                        continue
+                age = now - created
+                if pid is None:
+                    abandoned = age > self.protect_seconds
+                elif pid == os.getpid():
+                    abandoned = True  # Không nằm trong active của process này
+                else:
+                    abandoned = not _pid_alive(pid) or age > self.stale_seconds
+                if abandoned:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed_dirs += 1
+
+        cutoff = now - self.download_max_age_seconds
+        with self.lock:
+            expired = [item for item in self._download_files() if item[0] < cutoff]
+            evicted_before = self.stats["evicted_downloads"]
+            freed = self._remove_downloads(expired)
+            removed_downloads = self.stats["evicted_downloads"] - evicted_before
+            self.stats["gc_task_dirs"] += removed_dirs
+            self.stats["gc_downloads"] += removed_downloads
+        if removed_dirs or removed_downloads:
+            logger.info(f"🧹 Scratch GC | Task dirs removed: {removed_dirs}, "
+                        f"Downloads removed: {removed_downloads} ({freed / MB:.1f} MB)")
+        return {"task_dirs": removed_dirs, "downloads": removed_downloads, "bytes": freed}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, "root": self.root, "active": len(self.active), "usage_bytes": self.usage_bytes(),
+                    "quota_bytes": self.quota_bytes}
+
+
+_scratch_space: Optional[ScratchSpace] = None
+_scratch_lock = threading.Lock()
+
+
+def get_scratch_space() -> ScratchSpace:
+    """ScratchSpace dùng chung của process (tạo từ config lần đầu gọi)"""
+    global _scratch_space
+    with _scratch_lock:
+        if _scratch_space is None:
+            _scratch_space = ScratchSpace.from_config()
+        return _scratch_space
@@ -0,0 +1,105 @@
+# utils/task_heartbeat.py - Gia hạn lease của task trong lúc worker xử lý (thread nền)
+import contextlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+
+from utils.load_config import ConfigLoader
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostError(Exception):
+    """Server đã giao task cho worker khác (heartbeat nhận 409): worker bỏ task, không upload"""
+
+
+class TaskHeartbeat:
+    """
+    with TaskHeartbeat.for_task(task): process_task(...)
+    hoặc TaskHeartbeat.start_for_task(task) ngay lúc claim, stop() khi xử lý xong (task chờ trong
+    scheduler cục bộ vẫn được gia hạn lease).
+
+    Mỗi interval giây POST {server_url}/{client}/tasks/{id}/heartbeat/ với lease_token của task.
+    Server trả 409 khi lease đã mất (task đã giao cho worker khác): dừng heartbeat, đặt lost=True;
+    worker đọc heartbeat.lost sau khi xử lý và bỏ task thay vì upload.
+    Lỗi mạng chỉ log, lần sau thử lại.
+    """
+
+    def __init__(self, url: str, task_id: str, lease_token: str, interval: float,
+                 extend_seconds: Optional[float] = None, timeout: float = 10):
+        self.url = url
+        self.task_id = task_id
+        self.lease_token = lease_token
+        self.interval = interval
+        self.extend_seconds = extend_seconds
+        self.timeout = timeout
+        self.lost = False
+        self.beats = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_task(cls, task: Dict[str, Any], config_loader: Optional[ConfigLoader] = None):
+        """TaskHeartbeat nếu server cấp lease và app.heartbeat_interval > 0, ngược lại context rỗng"""
+        heartbeat = cls.create(task, config_loader)
+        return heartbeat if heartbeat is not None else contextlib.nullcontext()
+
+    @classmethod
+    def start_for_task(cls, task: Dict[str, Any],
+                       config_loader: Optional[ConfigLoader] = None) -> Optional['TaskHeartbeat']:
+        """Tạo và chạy heartbeat ngay (gọi stop() khi xong), None nếu không cần heartbeat"""
+        heartbeat = cls.create(task, config_loader)
+        if heartbeat is not None:
+            heartbeat.start()
+        return heartbeat
+
+    @classmethod
+    def create(cls, task: Dict[str, Any], config_loader: Optional[ConfigLoader] = None) -> Optional['TaskHeartbeat']:
+        loader = config_loader or ConfigLoader()
+        interval = float(loader.get_config_value("app.heartbeat_interval", 0) or 0)
+        if interval <= 0 or not task.get("lease_token"):
+            return None
+        server_url = loader.get_config_value("app.server_url", "http://localhost:8000")
+        client_name = loader.get_config_value("app.client_name", "default_client_name")
+        task_id = str(task.get("id", "unknown"))
+        extend = loader.get_config_value("app.heartbeat_extend_seconds", None)
+        return cls(f"{server_url}/{client_name}/tasks/{task_id}/heartbeat/", task_id, task["lease_token"],
+                   interval, float(extend) if extend else None)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"heartbeat-{self.task_id}", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout)
+
+    def __enter__(self) -> 'TaskHeartbeat':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.stop()
+        return False
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                response = requests.post(self.url, json={"lease_token": self.lease_token,
+                                                         "extend_seconds": self.extend_seconds},
+                                         timeout=self.timeout)
+                if response.status_code == 409:
+                    self.lost = True
+                    logger.warning(f"⚠️ Lease lost for task {self.task_id}: {response.text}")
+                    return
+                if response.status_code != 200:
+                    logger.warning(f"⚠️ Heartbeat failed for task {self.task_id} ({response.status_code})")
+                    continue
+                self.beats += 1
+                logger.debug(f"💓 Heartbeat task {self.task_id} | Lease until {response.json().get('lease_expires_at')}")
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat error for task {self.task_id}: {e}")
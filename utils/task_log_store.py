@@ -0,0 +1,406 @@
+# utils/task_log_store.py - Log store dạng segment append-only, dùng chung cho mọi task
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment_"
+SEGMENT_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+COMPRESSED_SUFFIX = ".log.gz"
+
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+# maintain() không đụng segment có .idx vừa được ghi trong khoảng này (có thể còn mở ở process khác)
+ACTIVE_GRACE_SECONDS = 10 * 60
+
+# (segment_name, offset, length)
+Extent = Tuple[str, int, int]
+
+
+class SegmentedTaskLogStore:
+    """
+    Log của tất cả task ghi nối tiếp vào một segment đang mở (segment_<ngày>_<seq>.log).
+    Segment đang mở thuộc riêng một process (tạo bằng O_EXCL), mở lại store luôn sang seq mới.
+    Mỗi lần ghi thêm một dòng `task_id<TAB>offset<TAB>length` vào file .idx cạnh segment,
+    và index trong bộ nhớ task_id -> danh sách extent (extent liền nhau được gộp lại).
+
+    Segment được roll khi sang ngày mới hoặc vượt segment_max_bytes. Segment đã đóng
+    có thể compact (gom log của từng task thành một khối liền) và nén gzip riêng lẻ.
+
+    Nhiều process dùng chung thư mục: mỗi lần read_task, store đọc tiếp
+    phần mới của các file .idx (theo offset đã đọc, đọc lại từ đầu nếu file bị thay thế).
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.index: Dict[str, List[Extent]] = {}
+        # segment -> (inode, số byte .idx đã đọc vào index)
+        self._index_state: Dict[str, Tuple[int, int]] = {}
+        self.lock = threading.RLock()
+        self._active_name: Optional[str] = None
+        self._active_date: Optional[str] = None
+        self._active_file = None
+        self._active_index_file = None
+        self._active_size = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    # --- Segment naming ---
+
+    @staticmethod
+    def _segment_key(name: str) -> Tuple[str, int]:
+        """segment_20250101_00003 -> ('20250101', 3)"""
+        date_part, seq_part = name[len(SEGMENT_PREFIX):].split("_", 1)
+        return date_part, int(seq_part)
+
+    def _path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.directory, name + suffix)
+
+    def segment_names(self) -> List[str]:
+        """Tất cả segment (đang mở, đã đóng, đã nén) theo thứ tự thời gian"""
+        names = set()
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith(SEGMENT_PREFIX) and file_name.endswith(INDEX_SUFFIX):
+                names.add(file_name[:-len(INDEX_SUFFIX)])
+        return sorted(names, key=self._segment_key)
+
+    def is_compressed(self, name: str) -> bool:
+        return os.path.exists(self._path(name, COMPRESSED_SUFFIX))
+
+    # --- Index ---
+
+    @staticmethod
+    def _add_extent(extents: List[Extent], segment: str, offset: int, length: int) -> None:
+        if extents:
+            last_segment, last_offset, last_length = extents[-1]
+            if last_segment == segment and last_offset + last_length == offset:
+                extents[-1] = (segment, last_offset, last_length + length)
+                return
+        extents.append((segment, offset, length))
+
+    def _read_index_file(self, name: str, start: int = 0) -> Tuple[Dict[str, List[Extent]], int]:
+        """Đọc .idx từ byte start, trả về (extents, offset sau dòng hoàn chỉnh cuối cùng)"""
+        extents: Dict[str, List[Extent]] = {}
+        try:
+            with open(self._path(name, INDEX_SUFFIX), "rb") as f:
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            return extents, start
+        # Dòng cuối chưa có newline có thể đang được process khác ghi: để lần sau đọc
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8", errors="replace").splitlines():
+            parts = line.split("\t")
+            if len(parts) != 3:
+                continue  # Dòng ghi dở khi crash
+            task_id, offset, length = parts[0], int(parts[1]), int(parts[2])
+            self._add_extent(extents.setdefault(task_id, []), name, offset, length)
+        return extents, start + len(complete)
+
+    def _index_inode(self, name: str) -> Optional[int]:
+        try:
+            return os.stat(self._path(name, INDEX_SUFFIX)).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _merge_index(self, name: str, start: int = 0) -> None:
+        """Gọi khi giữ lock: đưa phần .idx từ start vào index và ghi nhận offset đã đọc"""
+        inode = self._index_inode(name)
+        if inode is None:
+            return
+        extents, end = self._read_index_file(name, start)
+        for task_id, task_extents in extents.items():
+            target = self.index.setdefault(task_id, [])
+            in_order = not target or self._segment_key(target[-1][0]) <= self._segment_key(name)
+            for extent in task_extents:
+                self._add_extent(target, *extent)
+            if not in_order:
+                target.sort(key=lambda e: self._segment_key(e[0]))
+        self._index_state[name] = (inode, end)
+
+    def _drop_segment_extents(self, name: str) -> None:
+        for task_id in list(self.index.keys()):
+            kept = [e for e in self.index[task_id] if e[0] != name]
+            if kept:
+                self.index[task_id] = kept
+            else:
+                del self.index[task_id]
+        self._index_state.pop(name, None)
+
+    def _load_index(self) -> None:
+        for name in self.segment_names():
+            self._merge_index(name)
+
+    def refresh_index(self) -> None:
+        """Đọc phần .idx mới do process khác ghi; segment bị compact/xóa ở nơi khác thì nạp lại"""
+        with self.lock:
+            names = set(self.segment_names())
+            for name in list(self._index_state):
+                if name not in names:
+                    self._drop_segment_extents(name)
+            for name in sorted(names, key=self._segment_key):
+                if name == self._active_name:
+                    continue  # Segment của chính process này, index đã cập nhật khi ghi
+                state = self._index_state.get(name)
+                if state is None:
+                    self._merge_index(name)
+                elif state[0] != self._index_inode(name):
+                    self._drop_segment_extents(name)
+                    self._merge_index(name)
+                else:
+                    self._merge_index(name, state[1])
+
+    # --- Write path ---
+
+    def _open_segment(self) -> None:
+        today = datetime.now().strftime("%Y%m%d")
+        seq = 0
+        for name in self.segment_names():
+            date_part, seq_part = self._segment_key(name)
+            if date_part == today:
+                seq = max(seq, seq_part + 1)
+        # Tạo segment mới bằng O_EXCL: mỗi process (nhiều worker chung logs/tasks) giữ segment riêng,
+        # offset tính từ _active_size luôn đúng vì không process nào khác append vào cùng file
+        while True:
+            name = f"{SEGMENT_PREFIX}{today}_{seq:05d}"
+            try:
+                fd = os.open(self._path(name, SEGMENT_SUFFIX),
+                             os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND | getattr(os, "O_BINARY", 0))
+                break
+            except FileExistsError:
+                seq += 1
+        self._active_name = name
+        self._active_date = today
+        self._active_file = os.fdopen(fd, "ab")
+        self._active_index_file = open(self._path(self._active_name, INDEX_SUFFIX), "a", encoding="utf-8")
+        self._active_size = 0
+
+    def _close_segment(self) -> None:
+        for f in (self._active_file, self._active_index_file):
+            if f is not None:
+                try:
+                    f.close()
+                except Exception as e:
+                    logger.error(f"❌ Error closing log segment {self._active_name}: {e}")
+        if self._active_name is not None:
+            # Index của segment này đã có đủ trong bộ nhớ: refresh_index chỉ đọc phần ghi sau (nếu có)
+            inode = self._index_inode(self._active_name)
+            if inode is not None:
+                size = os.path.getsize(self._path(self._active_name, INDEX_SUFFIX))
+                self._index_state[self._active_name] = (inode, size)
+        self._active_file = None
+        self._active_index_file = None
+        self._active_name = None
+
+    def _maybe_roll(self) -> None:
+        today = datetime.now().strftime("%Y%m%d")
+        if (self._active_file is None or self._active_date != today or
+                self._active_size >= self.segment_max_bytes):
+            self._close_segment()
+            self._open_segment()
+
+    def append(self, task_id: str, text: str) -> None:
+        """Ghi text (đã format, có newline) cho task_id vào segment đang mở"""
+        data = text.encode("utf-8")
+        with self.lock:
+            self._maybe_roll()
+            offset = self._active_size
+            self._active_file.write(data)
+            self._active_index_file.write(f"{task_id}\t{offset}\t{len(data)}\n")
+            self._active_size += len(data)
+            self._add_extent(self.index.setdefault(task_id, []), self._active_name, offset, len(data))
+
+    def flush(self) -> None:
+        with self.lock:
+            for f in (self._active_file, self._active_index_file):
+                if f is not None:
+                    f.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            self._close_segment()
+
+    # --- Read path ---
+
+    def read_task(self, task_id: str) -> str:
+        """Đọc toàn bộ log của một task (qua tất cả segment)"""
+        with self.lock:
+            # Task có thể được process khác ghi (chưa có trong index hoặc đã có thêm log): chỉ
+            # listdir + stat, phần .idx đọc tiếp từ offset cũ nên rẻ so với đọc log
+            self.refresh_index()
+            extents = list(self.index.get(task_id, []))
+            if extents and self._active_file is not None:
+                self._active_file.flush()
+
+        chunks: List[bytes] = []
+        open_files = {}
+        try:
+            for segment, offset, length in extents:
+                f = open_files.get(segment)
+                if f is None:
+                    plain_path = self._path(segment, SEGMENT_SUFFIX)
+                    if os.path.exists(plain_path):
+                        f = open(plain_path, "rb")
+                    else:
+                        f = gzip.open(self._path(segment, COMPRESSED_SUFFIX), "rb")
+                    open_files[segment] = f
+                f.seek(offset)
+                chunks.append(f.read(length))
+        except FileNotFoundError:
+            # Segment đã bị xóa bởi retention
+            pass
+        finally:
+            for f in open_files.values():
+                f.close()
+        return b"".join(chunks).decode("utf-8", errors="replace")
+
+    def task_ids(self) -> List[str]:
+        with self.lock:
+            return list(self.index.keys())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê từ index trong bộ nhớ"""
+        with self.lock:
+            segments = {extent[0] for extents in self.index.values() for extent in extents}
+            return {
+                'tasks': len(self.index),
+                'segments': len(segments),
+                'active_segment': self._active_name,
+                'active_segment_mb': round(self._active_size / (1024 * 1024), 2),
+            }
+
+    # --- Maintenance (per segment) ---
+
+    def closed_segments(self) -> List[str]:
+        with self.lock:
+            active = self._active_name
+        return [name for name in self.segment_names() if name != active]
+
+    def compact_segment(self, name: str) -> bool:
+        """
+        Viết lại một segment đã đóng để log của mỗi task nằm liền một khối,
+        đọc một task chỉ cần một lần seek.
+        """
+        with self.lock:
+            if name == self._active_name or self.is_compressed(name):
+                return False
+        segment_index, _ = self._read_index_file(name)
+        if all(len(extents) <= 1 for extents in segment_index.values()):
+            return False
+
+        plain_path = self._path(name, SEGMENT_SUFFIX)
+        tmp_log = plain_path + ".compact"
+        tmp_idx = self._path(name, INDEX_SUFFIX) + ".compact"
+        new_extents: Dict[str, Extent] = {}
+        with open(plain_path, "rb") as src, open(tmp_log, "wb") as dst, \
+                open(tmp_idx, "w", encoding="utf-8") as idx:
+            for task_id, extents in segment_index.items():
+                start = dst.tell()
+                for _, offset, length in extents:
+                    src.seek(offset)
+                    dst.write(src.read(length))
+                total = dst.tell() - start
+                idx.write(f"{task_id}\t{start}\t{total}\n")
+                new_extents[task_id] = (name, start, total)
+
+        with self.lock:
+            os.replace(tmp_log, plain_path)
+            os.replace(tmp_idx, self._path(name, INDEX_SUFFIX))
+            self._index_state[name] = (self._index_inode(name), os.path.getsize(self._path(name, INDEX_SUFFIX)))
+            for task_id, extent in new_extents.items():
+                kept = [e for e in self.index.get(task_id, []) if e[0] != name]
+                kept.append(extent)
+                kept.sort(key=lambda e: self._segment_key(e[0]))
+                self.index[task_id] = kept
+        return True
+
+    def compress_segment(self, name: str) -> bool:
+        """Nén gzip một segment đã đóng (index giữ nguyên offset trên dữ liệu gốc)"""
+        with self.lock:
+            if name == self._active_name:
+                return False
+        plain_path = self._path(name, SEGMENT_SUFFIX)
+        if not os.path.exists(plain_path):
+            return False
+        gz_path = self._path(name, COMPRESSED_SUFFIX)
+        with open(plain_path, "rb") as f_in, gzip.open(gz_path + ".tmp", "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, COPY_BUFFER_SIZE)
+        with self.lock:
+            os.replace(gz_path + ".tmp", gz_path)
+            os.remove(plain_path)
+        return True
+
+    def delete_segment(self, name: str) -> None:
+        """Xóa segment và gỡ extent khỏi index"""
+        with self.lock:
+            if name == self._active_name:
+                return
+            for suffix in (SEGMENT_SUFFIX, COMPRESSED_SUFFIX, INDEX_SUFFIX):
+                path = self._path(name, suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._drop_segment_extents(name)
+
+    def maintain(self, compress_after_days: float = 1, retention_days: float = 7) -> Dict[str, int]:
+        """
+        Compact + nén segment đã đóng cũ hơn compress_after_days, xóa segment quá retention_days.
+
+        Segment của hôm nay hoặc có .idx ghi trong ACTIVE_GRACE_SECONDS được bỏ qua: có thể vẫn
+        đang mở ở process khác. Segment ngày cũ thì an toàn vì process nào cũng roll sang ngày mới
+        trước khi ghi tiếp.
+        """
+        stats = {"compacted": 0, "compressed": 0, "deleted": 0, "skipped_active": 0}
+        now = time.time()
+        today = datetime.now().strftime("%Y%m%d")
+        for name in self.closed_segments():
+            try:
+                idx_path = self._path(name, INDEX_SUFFIX)
+                age = now - os.path.getmtime(idx_path)
+                if self._segment_key(name)[0] >= today or age < ACTIVE_GRACE_SECONDS:
+                    stats["skipped_active"] += 1
+                    continue
+                if age > retention_days * 86400:
+                    self.delete_segment(name)
+                    stats["deleted"] += 1
+                elif age > compress_after_days * 86400 and not self.is_compressed(name):
+                    if self.compact_segment(name):
+                        stats["compacted"] += 1
+                    if self.compress_segment(name):
+                        stats["compressed"] += 1
+            except Exception as e:
+                logger.error(f"❌ Error maintaining log segment {name}: {e}")
+        return stats
+
+
+class TaskLogStoreHandler(logging.Handler):
+    """Handler ghi log của một task vào SegmentedTaskLogStore dùng chung"""
+
+    def __init__(self, store: SegmentedTaskLogStore, task_id: str):
+        super().__init__()
+        self.store = store
+        self.task_id = task_id
+        # Khi chạy sau BatchingQueueListener, flush do listener quyết định
+        self.defer_flush = False
+
+    def emit(self, record):
+        try:
+            self.store.append(self.task_id, self.format(record) + "\n")
+            if not self.defer_flush:
+                self.store.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if not self.defer_flush:
+            self.store.flush()
+
+    def force_flush(self):
+        self.store.flush()
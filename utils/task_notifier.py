@@ -0,0 +1,161 @@
+# utils/task_notifier.py - Worker nghe SSE "có task" từ server, tự fallback về polling khi mất kết nối
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from utils.load_config import ConfigLoader
+
+logger = logging.getLogger(__name__)
+
+# Server không có route task-events (server production): tắt notifier, không reconnect mãi
+UNSUPPORTED_STATUSES = (404, 405, 501)
+
+
+class EventsUnsupportedError(ConnectionError):
+    """Server không hỗ trợ SSE task-events"""
+
+
+class TaskNotifier:
+    """
+    Thread nền giữ kết nối GET {server_url}/{client}/task-events/ (text/event-stream).
+
+    worker_loop gọi wait_for_task(poll_interval) thay cho time.sleep khi không có task:
+    - đang kết nối: chờ tới khi có event "available" (hoặc idle_poll_interval, phòng event bị lỡ)
+    - mất kết nối / server không hỗ trợ SSE: chờ poll_interval như polling cũ
+    Kết nối lại sau reconnect_delay (tăng dần tới max_reconnect_delay).
+    Server trả 404/405/501 thì notifier tắt hẳn (disabled=True), worker chỉ còn polling.
+    """
+
+    def __init__(self, url: str, idle_poll_interval: float = 60, reconnect_delay: float = 5,
+                 max_reconnect_delay: float = 60, read_timeout: float = 45):
+        self.url = url
+        self.idle_poll_interval = idle_poll_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.read_timeout = read_timeout
+        self.connected = False
+        self.disabled = False
+        self.available = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._response = None
+        self.stats = {"connects": 0, "disconnects": 0, "notifications": 0, "wakeups": 0, "timeouts": 0}
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'TaskNotifier':
+        loader = config_loader or ConfigLoader()
+        server_url = loader.get_config_value("app.server_url", "http://localhost:8000")
+        client_name = loader.get_config_value("app.client_name", "default_client_name")
+        config = loader.get_config_value("app.task_events", {}) or {}
+        return cls(
+            url=f"{server_url}/{client_name}/task-events/",
+            idle_poll_interval=float(config.get("idle_poll_interval", 60)),
+            reconnect_delay=float(config.get("reconnect_delay", 5)),
+            max_reconnect_delay=float(config.get("max_reconnect_delay", 60)),
+            read_timeout=float(config.get("read_timeout", 45)),
+        )
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="task-notifier", daemon=True)
+        self._thread.start()
+        logger.info(f"📡 Task notifier subscribing to {self.url}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.available.set()  # Đánh thức worker đang chờ
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    def wait_for_task(self, poll_interval: float) -> bool:
+        """Chờ task; trả về True nếu được đánh thức bởi notification"""
+        timeout = self.idle_poll_interval if self.connected else poll_interval
+        notified = self.available.wait(timeout)
+        self.available.clear()
+        self.stats["wakeups" if notified else "timeouts"] += 1
+        return notified
+
+    # --- SSE ---
+
+    def _handle_event(self, event: str, data: str) -> None:
+        if event != "available":
+            return
+        try:
+            payload: Dict[str, Any] = json.loads(data) if data else {}
+        except ValueError:
+            payload = {}
+        self.stats["notifications"] += 1
+        logger.info(f"🔔 Task available notification | Pending: {payload.get('pending', '?')}, "
+                    f"Reason: {payload.get('reason', 'initial')}")
+        self.available.set()
+
+    def _listen(self) -> None:
+        with requests.get(self.url, stream=True, timeout=(10, self.read_timeout),
+                          headers={"Accept": "text/event-stream"}) as response:
+            self._response = response
+            if response.status_code in UNSUPPORTED_STATUSES:
+                raise EventsUnsupportedError(f"status {response.status_code}")
+            if response.status_code != 200:
+                raise ConnectionError(f"status {response.status_code}")
+            self.connected = True
+            self.stats["connects"] += 1
+            logger.info("✅ Task notifier connected, idle polling relaxed to "
+                        f"{self.idle_poll_interval:.0f}s")
+            event, data_lines = "message", []
+            for line in response.iter_lines(decode_unicode=True):
+                if self._stop.is_set():
+                    return
+                if line is None:
+                    continue
+                if not line:
+                    # Dòng trống kết thúc một event
+                    if data_lines or event != "message":
+                        self._handle_event(event, "\n".join(data_lines))
+                    event, data_lines = "message", []
+                elif line.startswith(":"):
+                    continue  # keepalive
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[5:].strip())
+
+    def _run(self) -> None:
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self._listen()
+            except EventsUnsupportedError as e:
+                self.disabled = True
+                logger.warning(f"⚠️ Server has no task-events route ({e}), task notifier disabled, polling only")
+                return
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.warning(f"⚠️ Task notifier disconnected ({e}), falling back to polling")
+            finally:
+                self._response = None
+                if self.connected:
+                    self.connected = False
+                    self.stats["disconnects"] += 1
+                    # Có thể đã lỡ event trong lúc mất kết nối: cho worker poll ngay một lần
+                    self.available.set()
+            if time.time() - started > self.max_reconnect_delay:
+                delay = self.reconnect_delay  # Kết nối trước đó giữ được lâu, reset backoff
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "connected": self.connected, "disabled": self.disabled}
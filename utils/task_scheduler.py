@@ -0,0 +1,169 @@
+# utils/task_scheduler.py - Scheduler ưu tiên cục bộ cho các task đã claim/prefetch
+import heapq
+import itertools
+import threading
+import time
+from collections import deque, Counter
+from typing import Any, Deque, Dict, List, Optional
+
+from models.task import PRIORITY_NAMES
+from utils.load_config import ConfigLoader
+
+DEFAULT_PRIORITY = PRIORITY_NAMES["normal"]
+
+
+def parse_priority(value: Any, default: float = DEFAULT_PRIORITY) -> float:
+    """Priority dạng số hoặc tên (low/normal/high/urgent). Số lớn hơn = ưu tiên hơn."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        name = value.strip().lower()
+        if name in PRIORITY_NAMES:
+            return PRIORITY_NAMES[name]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class _QueueEntry:
+    __slots__ = ("sort_key", "seq", "task", "store", "priority", "enqueued_at")
+
+    def __init__(self, sort_key: float, seq: int, task: Dict[str, Any], store: str,
+                 priority: float, enqueued_at: float):
+        self.sort_key = sort_key
+        self.seq = seq
+        self.task = task
+        self.store = store
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+
+    def __lt__(self, other: '_QueueEntry') -> bool:
+        return (self.sort_key, self.seq) < (other.sort_key, other.seq)
+
+
+class TaskScheduler:
+    """
+    Priority queue có aging và quota công bằng theo store.
+
+    Priority hiệu dụng = priority + aging_rate * thời gian chờ (giây). Vì mọi task già đi
+    cùng tốc độ, thứ tự chỉ phụ thuộc vào (priority - aging_rate * enqueued_at), nên có thể
+    dùng heap với key cố định.
+
+    Quota: trong store_window lần dispatch gần nhất, một store không được chiếm quá
+    store_max_share, trừ khi không còn store nào khác đang chờ.
+    """
+
+    def __init__(self, aging_rate: float = 0.1, store_max_share: float = 1.0, store_window: int = 10,
+                 store_priorities: Optional[Dict[str, float]] = None, wait_samples: int = 1000):
+        self.aging_rate = aging_rate
+        self.store_max_share = store_max_share
+        self.store_window = store_window
+        self.store_priorities = store_priorities or {}
+        self._heap: List[_QueueEntry] = []
+        self._seq = itertools.count()
+        self._recent_stores: Deque[str] = deque(maxlen=max(1, store_window))
+        self._wait_times: Deque[float] = deque(maxlen=wait_samples)
+        self._dispatched = 0
+        self._quota_skips = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'TaskScheduler':
+        """Tạo scheduler từ config app.scheduler"""
+        loader = config_loader or ConfigLoader()
+        config = loader.get_config_value("app.scheduler", {}) or {}
+        return cls(
+            aging_rate=float(config.get("aging_rate", 0.1)),
+            store_max_share=float(config.get("store_max_share", 1.0)),
+            store_window=int(config.get("store_window", 10)),
+            store_priorities=config.get("store_priorities", {}),
+        )
+
+    def task_priority(self, task: Dict[str, Any]) -> float:
+        """Priority từ payload, fallback về priority cấu hình theo store"""
+        store = task.get("store", "")
+        default = parse_priority(self.store_priorities.get(store), DEFAULT_PRIORITY)
+        return parse_priority(task.get("priority"), default)
+
+    def push(self, task: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        priority = self.task_priority(task)
+        # Heap là min-heap: key nhỏ hơn được lấy trước
+        sort_key = -(priority - self.aging_rate * now)
+        entry = _QueueEntry(sort_key, next(self._seq), task, task.get("store", ""), priority, now)
+        with self.lock:
+            heapq.heappush(self._heap, entry)
+
+    def _over_quota(self, store: str) -> bool:
+        if self.store_max_share >= 1.0 or not self._recent_stores:
+            return False
+        used = sum(1 for s in self._recent_stores if s == store)
+        return used + 1 > self.store_max_share * self._recent_stores.maxlen
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """Lấy task có priority hiệu dụng cao nhất mà store chưa vượt quota"""
+        with self.lock:
+            if not self._heap:
+                return None
+            skipped: List[_QueueEntry] = []
+            chosen = None
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                if self._over_quota(entry.store):
+                    skipped.append(entry)
+                    continue
+                chosen = entry
+                break
+            if chosen is None:
+                # Chỉ còn store đã vượt quota: vẫn phải chạy để không bị treo
+                chosen = skipped.pop(0)
+            elif skipped:
+                self._quota_skips += 1
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+
+            self._recent_stores.append(chosen.store)
+            self._wait_times.append(time.monotonic() - chosen.enqueued_at)
+            self._dispatched += 1
+            return chosen.task
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Lấy hết task còn trong hàng đợi (worker dừng), không tính vào thống kê dispatch"""
+        with self.lock:
+            tasks = [entry.task for entry in sorted(self._heap)]
+            self._heap.clear()
+        return tasks
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._heap)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth và thống kê thời gian chờ"""
+        now = time.monotonic()
+        with self.lock:
+            depth_by_store = Counter(entry.store for entry in self._heap)
+            queued_waits = [now - entry.enqueued_at for entry in self._heap]
+            waits = sorted(self._wait_times)
+            dispatched = self._dispatched
+            quota_skips = self._quota_skips
+
+        def percentile(values: List[float], pct: float) -> float:
+            if not values:
+                return 0.0
+            return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+        return {
+            'depth': sum(depth_by_store.values()),
+            'depth_by_store': dict(depth_by_store),
+            'oldest_wait_seconds': round(max(queued_waits), 3) if queued_waits else 0.0,
+            'dispatched': dispatched,
+            'quota_skips': quota_skips,
+            'wait_seconds': {
+                'avg': round(sum(waits) / len(waits), 3) if waits else 0.0,
+                'p50': round(percentile(waits, 50), 3),
+                'p95': round(percentile(waits, 95), 3),
+                'max': round(waits[-1], 3) if waits else 0.0,
+            },
+        }
@@ -0,0 +1,359 @@
+# utils/task_store.py - Task store JSONL append-only: index id trong bộ nhớ, upsert O(1), expiry theo thời gian, compaction nền
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock, compaction chỉ dựa vào việc đọc lại phần đuôi file
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Compact khi số dòng chết (bị ghi đè / đã xoá) vượt max(COMPACT_MIN_DEAD, live * COMPACT_RATIO)
+COMPACT_MIN_DEAD = 1000
+COMPACT_RATIO = 1.0
+
+
+def store_path_for(file_path: str) -> str:
+    """tasks.json -> tasks.jsonl (file JSONL cạnh file JSON cũ)"""
+    if file_path.endswith(".jsonl"):
+        return file_path
+    return os.path.splitext(file_path)[0] + ".jsonl"
+
+
+def _parse_created_at(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+class JsonlTaskStore:
+    """
+    Mỗi dòng của file là một thao tác:
+        {"id": ..., "created_at": <epoch>, "task": {...}}   upsert
+        {"id": ..., "deleted": true}                        xoá
+
+    - Khi mở: replay file để dựng index id -> task (dòng sau ghi đè dòng trước, dòng hỏng cuối file bị bỏ qua)
+    - upsert/delete: append một dòng + cập nhật index, không đọc lại hay ghi lại cả file
+    - created_at giữ nguyên từ lần ghi đầu tiên; heap (created_at, id) để expire() chỉ duyệt task quá hạn
+    - Dòng chết nhiều hơn ngưỡng thì compact trong thread nền: ghi các task còn sống ra file tạm,
+      đọc lại phần đuôi file cũ (dòng do mọi process ghi trong lúc compact), nối vào rồi os.replace
+    - Nếu process khác ghi vào file (size/inode thay đổi) thì tự replay lại trước khi đọc
+    - Ghi và replace giữ flock trên file .lock (POSIX) để không mất dòng của process khác
+    """
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None, fsync: bool = False,
+                 compact_min_dead: int = COMPACT_MIN_DEAD, compact_ratio: float = COMPACT_RATIO):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.fsync = fsync
+        self.compact_min_dead = compact_min_dead
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.created: Dict[str, Optional[float]] = {}
+        self._expiry: List[Tuple[float, str]] = []
+        self.dead_lines = 0
+        self._file = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._lock_file = None
+        self._flock_depth = 0
+        # Offset file lúc snapshot khi đang compact; None = không compact
+        self._compacting: Optional[int] = None
+        self._compact_thread: Optional[threading.Thread] = None
+        self.stats = {"upserts": 0, "deletes": 0, "expired": 0, "compactions": 0, "reloads": 0}
+        self._load()
+
+    # --- File ---
+
+    def _current_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @contextmanager
+    def _file_lock(self):
+        """flock liên process (gọi khi giữ self.lock), re-entrant trong cùng process"""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(f"{self.path}.lock", "a")
+        if self._flock_depth == 0:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        self._flock_depth += 1
+        try:
+            yield
+        finally:
+            self._flock_depth -= 1
+            if self._flock_depth == 0:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        task_id = str(record.get("id", ""))
+        existed = task_id in self.tasks
+        if existed:
+            self.dead_lines += 1
+        if record.get("deleted"):
+            if task_id in self.tasks:
+                del self.tasks[task_id]
+                del self.created[task_id]
+            self.dead_lines += 1  # Chính dòng xoá cũng là dòng chết
+            return
+        created_at = self.created.get(task_id) if task_id in self.created else record.get("created_at")
+        self.tasks[task_id] = record.get("task") or {}
+        self.created[task_id] = created_at
+        if created_at is not None and not existed:
+            heapq.heappush(self._expiry, (created_at, task_id))
+
+    def _load(self) -> None:
+        self.tasks, self.created, self._expiry, self.dead_lines = {}, {}, [], 0
+        if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+            self._migrate_legacy()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        # Dòng ghi dở (process chết giữa chừng)
+                        self.dead_lines += 1
+        except FileNotFoundError:
+            pass
+        if self._file is not None:
+            self._file.close()
+        self._open()
+        self._signature = self._current_signature()
+
+    def _migrate_legacy(self) -> None:
+        """Import một lần file JSON list cũ của write_tasks"""
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, list):
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in data:
+                if isinstance(item, dict):
+                    f.write(self._encode(str(item.get("id", "")), item, _parse_created_at(item.get("created_at"))))
+        os.replace(tmp_path, self.path)
+        logger.info(f"📦 Migrated {len(data)} tasks from {self.legacy_path} to {self.path}")
+
+    def _sync(self) -> None:
+        """Replay lại nếu file bị process khác ghi hoặc thay thế"""
+        if self._current_signature() != self._signature:
+            self.stats["reloads"] += 1
+            self._load()
+
+    @staticmethod
+    def _encode(task_id: str, task: Dict[str, Any], created_at: Optional[float]) -> str:
+        record: Dict[str, Any] = {"id": task_id, "task": task}
+        if created_at is not None:
+            record["created_at"] = created_at
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def _append(self, lines: List[str]) -> None:
+        data = "".join(lines)
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        if self._signature is not None:
+            self._signature = (self._signature[0], self._signature[1] + len(data.encode("utf-8")))
+        else:
+            self._signature = self._current_signature()
+
+    # --- API ---
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            self._sync()
+            task = self.tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            self._sync()
+            return [dict(task) for task in self.tasks.values()]
+
+    def __len__(self) -> int:
+        with self.lock:
+            self._sync()
+            return len(self.tasks)
+
+    def upsert_many(self, tasks: Iterable[Dict[str, Any]], now: Optional[float] = None) -> int:
+        """Ghi đè theo id, created_at giữ theo lần ghi đầu tiên (lấy từ task, thiếu thì dùng now)"""
+        now = time.time() if now is None else now
+        with self.lock, self._file_lock():
+            self._sync()
+            lines = []
+            for task in tasks:
+                task_id = str(task.get("id", ""))
+                if task_id in self.created:
+                    created_at = self.created[task_id]
+                else:
+                    created_at = _parse_created_at(task.get("created_at"))
+                    if created_at is None:
+                        created_at = now
+                record = {"id": task_id, "task": task, "created_at": created_at}
+                lines.append(self._encode(task_id, task, created_at))
+                self._apply(record)
+            if lines:
+                self._append(lines)
+                self.stats["upserts"] += len(lines)
+                self._maybe_compact()
+            return len(lines)
+
+    def upsert(self, task: Dict[str, Any]) -> None:
+        self.upsert_many([task])
+
+    def delete_many(self, task_ids: Iterable[str]) -> int:
+        with self.lock, self._file_lock():
+            self._sync()
+            lines = []
+            for task_id in task_ids:
+                if task_id in self.tasks:
+                    lines.append(json.dumps({"id": task_id, "deleted": True}, ensure_ascii=False) + "\n")
+                    self._apply({"id": task_id, "deleted": True})
+            if lines:
+                self._append(lines)
+                self.stats["deletes"] += len(lines)
+                self._maybe_compact()
+            return len(lines)
+
+    def expire(self, cutoff: float) -> int:
+        """Xoá task có created_at < cutoff; chỉ pop heap tới mốc cutoff, không duyệt toàn bộ"""
+        with self.lock, self._file_lock():
+            self._sync()
+            expired = []
+            while self._expiry and self._expiry[0][0] < cutoff:
+                created_at, task_id = heapq.heappop(self._expiry)
+                # Entry cũ trong heap (task đã xoá / tạo lại) thì bỏ qua
+                if self.created.get(task_id) == created_at and task_id in self.tasks:
+                    expired.append(task_id)
+            removed = self.delete_many(expired)
+            self.stats["expired"] += removed
+            return removed
+
+    # --- Compaction ---
+
+    def _should_compact(self) -> bool:
+        return self.dead_lines >= max(self.compact_min_dead, len(self.tasks) * self.compact_ratio)
+
+    def _snapshot(self) -> List[Tuple[str, Dict[str, Any], Optional[float]]]:
+        """Bắt đầu compaction (gọi khi giữ lock, state đã sync): nhớ offset để sau đó đọc lại phần đuôi"""
+        self._compacting = self._signature[1] if self._signature is not None else 0
+        return [(task_id, task, self.created[task_id]) for task_id, task in self.tasks.items()]
+
+    def _maybe_compact(self) -> None:
+        if self._compacting is None and self._should_compact():
+            args = (self._snapshot(), self.dead_lines)
+            self._compact_thread = threading.Thread(target=self._compact, args=args,
+                                                    name="task-store-compact", daemon=True)
+            self._compact_thread.start()
+
+    def _compact(self, snapshot: List[Tuple[str, Dict[str, Any], Optional[float]]], dead_before: int) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.compact"
+        try:
+            # Encode và ghi phần lớn ngoài lock, upsert vẫn append bình thường vào file cũ
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for task_id, task, created_at in snapshot:
+                    f.write(self._encode(task_id, task, created_at))
+            with self.lock, self._file_lock():
+                inode = self._signature[0] if self._signature is not None else None
+                current = self._current_signature()
+                if current is None or current[0] != inode:
+                    # Process khác đã compact / thay file trong lúc này: bỏ bản của mình
+                    os.remove(tmp_path)
+                    return
+                # Phần đuôi file cũ từ lúc snapshot: dòng của thread này lẫn của process khác
+                with open(self.path, "rb") as old, open(tmp_path, "ab") as f:
+                    old.seek(self._compacting or 0)
+                    f.write(old.read())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._file.close()
+                os.replace(tmp_path, self.path)
+                # Replay file đã compact (chỉ còn dòng sống + phần đuôi) để index khớp cả dòng của process khác
+                self._load()
+                self.stats["compactions"] += 1
+                logger.info(f"🗜️ Compacted task store {self.path} | Live: {len(self.tasks)}, "
+                            f"Dead lines removed: {dead_before}")
+        except Exception as e:
+            logger.error(f"❌ Task store compaction failed: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            with self.lock:
+                self._compacting = None
+
+    def compact(self) -> None:
+        """Compact đồng bộ (vd trước khi backup file)"""
+        with self.lock, self._file_lock():
+            self._sync()
+            if self._compacting is not None:
+                thread = self._compact_thread
+            else:
+                thread = None
+                args = (self._snapshot(), self.dead_lines)
+        if thread is not None:
+            thread.join()
+            return
+        self._compact(*args)
+
+    def close(self) -> None:
+        thread = self._compact_thread
+        if thread is not None:
+            thread.join()
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, "live": len(self.tasks), "dead_lines": self.dead_lines}
+
+
+_stores: Dict[str, JsonlTaskStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_task_store(file_path: str) -> JsonlTaskStore:
+    """Một store cho mỗi file (cache theo đường dẫn tuyệt đối); file JSON cũ được migrate lần đầu"""
+    path = os.path.abspath(store_path_for(file_path))
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            legacy_path = os.path.abspath(file_path) if os.path.abspath(file_path) != path else None
+            store = JsonlTaskStore(path, legacy_path=legacy_path)
+            _stores[path] = store
+        return store
@@ -0,0 +1,259 @@
+# utils/tracing.py - Span nhẹ cho từng stage, xuất Chrome/Perfetto trace-event JSON
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from utils.load_config import ConfigLoader
+
+logger = logging.getLogger(__name__)
+
+TRACE_MODES = ("task", "window")
+
+
+class _NoopSpan:
+    """Span dùng khi tracing tắt hoặc task không được sample: không đo, không ghi"""
+    __slots__ = ()
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set(self, **args) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start_ns")
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start_ns = 0
+
+    def __enter__(self) -> 'Span':
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._record(self, end_ns)
+        return False
+
+    def set(self, **args) -> None:
+        """Gắn thêm args (vd task_id chỉ biết sau khi server trả về)"""
+        self.args.update(args)
+
+
+class _TracedContext:
+    """Bọc một context manager, tách span cho __enter__ và __exit__"""
+
+    def __init__(self, tracer: 'Tracer', context, name: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.context = context
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        with self.tracer.span(f"{self.name}.enter", cat="session", **self.args):
+            return self.context.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        with self.tracer.span(f"{self.name}.exit", cat="session", **self.args):
+            return self.context.__exit__(exc_type, exc, tb)
+
+
+class Tracer:
+    """
+    Ghi complete event ("ph": "X") vào buffer trong bộ nhớ, xuất ra file JSON mở được bằng
+    chrome://tracing hoặc ui.perfetto.dev.
+
+    - mode "task": mỗi task một file trace_<task_id>.json khi gọi finish_task(); span không
+      gắn task_id bị bỏ qua
+    - mode "window": mọi span được gom theo cửa sổ window_seconds, mỗi cửa sổ một file;
+      hết cửa sổ thì đổi buffer trong lock, file ghi ở thread nền chứ không trên thread của span
+    - sample_rate: tỉ lệ task được trace, quyết định theo hash của task_id (ổn định giữa các stage)
+    Khi tắt, span() trả về một no-op span dùng chung.
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 1.0, mode: str = "task",
+                 output_dir: str = os.path.join("logs", "traces"), window_seconds: float = 60,
+                 max_events: int = 100000):
+        if mode not in TRACE_MODES:
+            raise ValueError(f"Unknown trace mode: {mode}")
+        self.enabled = enabled
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.mode = mode
+        self.output_dir = output_dir
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        self._task_events: Dict[str, List[Dict[str, Any]]] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._window_start = time.time()
+        self._epoch_ns = time.perf_counter_ns()
+        self._write_queue: "queue.Queue[tuple]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'Tracer':
+        loader = config_loader or ConfigLoader()
+        config = loader.get_config_value("app.tracing", {}) or {}
+        return cls(
+            enabled=bool(config.get("enabled", False)),
+            sample_rate=float(config.get("sample_rate", 1.0)),
+            mode=config.get("mode", "task"),
+            output_dir=config.get("output_dir", os.path.join("logs", "traces")),
+            window_seconds=float(config.get("window_seconds", 60)),
+        )
+
+    # --- Recording ---
+
+    def sampled(self, task_id: Optional[str]) -> bool:
+        if self.sample_rate >= 1.0 or task_id is None:
+            return True
+        return (zlib.crc32(str(task_id).encode("utf-8")) % 10000) < self.sample_rate * 10000
+
+    def span(self, name: str, cat: str = "worker", task_id: Optional[str] = None, **args):
+        """with tracer.span("convert", task_id=task_id, file=filename): ..."""
+        if not self.enabled or not self.sampled(task_id):
+            return _NOOP_SPAN
+        if task_id is not None:
+            args["task_id"] = str(task_id)
+        return Span(self, name, cat, args)
+
+    def traced(self, context, name: str, task_id: Optional[str] = None, **args):
+        """Bọc context manager (vd PhotoshopAutomation) để đo riêng enter/exit"""
+        if not self.enabled or not self.sampled(task_id):
+            return context
+        if task_id is not None:
+            args["task_id"] = str(task_id)
+        return _TracedContext(self, context, name, args)
+
+    def _record(self, span: Span, end_ns: int) -> None:
+        task_id = span.args.get("task_id")
+        if task_id is not None and not self.sampled(task_id):
+            return
+        if self.mode == "task" and task_id is None:
+            return
+        thread = threading.current_thread()
+        event = {
+            "name": span.name,
+            "cat": span.cat,
+            "ph": "X",
+            "ts": (span.start_ns - self._epoch_ns) / 1000.0,
+            "dur": (end_ns - span.start_ns) / 1000.0,
+            "pid": self.pid,
+            "tid": thread.ident,
+            "args": span.args,
+        }
+        flush_window = None
+        with self.lock:
+            self._thread_names.setdefault(thread.ident, thread.name)
+            if self.mode == "task":
+                events = self._task_events.setdefault(task_id, [])
+            else:
+                events = self._events
+            if len(events) >= self.max_events:
+                self.dropped += 1
+                return
+            events.append(event)
+            if self.mode == "window" and time.time() - self._window_start >= self.window_seconds:
+                flush_window = self._swap_window()
+                self._start_writer()
+        if flush_window:
+            self._write_queue.put(flush_window)
+
+    # --- Export ---
+
+    def _metadata(self) -> List[Dict[str, Any]]:
+        events = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "mockup-worker"}}]
+        for tid, name in self._thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}})
+        return events
+
+    def _swap_window(self):
+        events, self._events = self._events, []
+        name = f"trace_window_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self._window_start))}.json"
+        self._window_start = time.time()
+        return name, self._metadata() + events
+
+    def _start_writer(self) -> None:
+        """Gọi khi giữ lock: thread nền ghi các cửa sổ đã đổi buffer"""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._write_queue.get()
+            try:
+                self._write(*item)
+            finally:
+                self._write_queue.task_done()
+
+    def _write(self, file_name: str, events: List[Dict[str, Any]]) -> Optional[str]:
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, file_name)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+            return path
+        except Exception as e:
+            logger.error(f"❌ Error writing trace {file_name}: {e}")
+            return None
+
+    @staticmethod
+    def _task_file_name(task_id: str) -> str:
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(task_id))
+        return f"trace_{safe_id}.json"
+
+    def finish_task(self, task_id: str) -> Optional[str]:
+        """mode "task": ghi trace của task ra file, trả về đường dẫn (None nếu không có span)"""
+        if not self.enabled or self.mode != "task":
+            return None
+        with self.lock:
+            events = self._task_events.pop(str(task_id), None)
+            metadata = self._metadata() if events else []
+        if not events:
+            return None
+        return self._write(self._task_file_name(task_id), metadata + events)
+
+    def flush(self) -> None:
+        """Ghi cửa sổ hiện tại (mode "window") hoặc các task còn dở (mode "task")"""
+        if not self.enabled:
+            return
+        if self.mode == "window":
+            with self.lock:
+                window = self._swap_window() if self._events else None
+            # Chờ các cửa sổ đang xếp hàng ở thread nền để thứ tự file giữ đúng
+            self._write_queue.join()
+            if window:
+                self._write(*window)
+        else:
+            # Đổi cả dict trong lock, ghi file ngoài lock: span mới vẫn ghi vào dict mới
+            with self.lock:
+                pending, self._task_events = self._task_events, {}
+                metadata = self._metadata() if pending else []
+            for task_id, events in pending.items():
+                if events:
+                    self._write(self._task_file_name(task_id), metadata + events)
+
+
+tracer = Tracer.from_config()
@@ -0,0 +1,196 @@
+# utils/watchdog.py - Theo dõi RSS / handle / task logger sau mỗi task, recycle worker khi vượt ngưỡng
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from utils.load_config import ConfigLoader
+from utils.metrics import WORKER_RECYCLES, WORKER_RESOURCES, WORKER_RSS_GROWTH
+
+try:
+    import psutil
+except ImportError:  # psutil có trong requirements.txt, thiếu thì watchdog tự tắt
+    psutil = None
+
+RECYCLE_MODES = ("auto", "exit", "reexec")
+# Biến môi trường cho biết worker đang chạy dưới supervisor (systemd, supervisord, NSSM tự set)
+SUPERVISOR_ENV_VARS = ("MOCKUP_SUPERVISED", "SUPERVISOR_ENABLED", "INVOCATION_ID")
+RECYCLE_EXIT_CODE = 3
+
+logger = logging.getLogger(__name__)
+
+
+def _slope(points: List[Tuple[float, float]]) -> float:
+    """Hệ số góc least-squares của (x, y)"""
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if not denominator:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+
+class WorkerWatchdog:
+    """
+    Gọi observe() sau mỗi task. Recycle khi:
+    - RSS vượt max_rss_mb, số handle vượt max_handles, số task logger còn sống vượt max_task_loggers
+    - RSS tăng đều hơn max_growth_mb_per_task (độ dốc trên cửa sổ window task) và đã quá
+      growth_floor_mb (tránh recycle lúc mới khởi động khi cache còn đang warm-up)
+    - đã xử lý max_tasks task (0 = không giới hạn)
+
+    Worker ngừng claim task mới, xử lý hết task đã prefetch rồi gọi recycle():
+    - "exit": thoát với RECYCLE_EXIT_CODE để supervisor khởi động lại
+    - "reexec": tự chạy lại chính nó (os.execv, trên Windows spawn process mới rồi thoát)
+    - "auto": "exit" nếu thấy biến môi trường của supervisor, ngược lại "reexec"
+    """
+
+    def __init__(self, enabled: bool = True, max_rss_mb: float = 2048, max_handles: int = 4000,
+                 max_task_loggers: int = 50, max_growth_mb_per_task: float = 5.0, growth_floor_mb: float = 512,
+                 window: int = 20, max_tasks: int = 0, log_every: int = 10, recycle_mode: str = "auto"):
+        if recycle_mode not in RECYCLE_MODES:
+            raise ValueError(f"Unknown recycle mode: {recycle_mode}")
+        self.enabled = enabled and psutil is not None
+        if enabled and psutil is None:
+            logger.warning("⚠️ psutil not installed, worker watchdog disabled")
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.max_handles = max_handles
+        self.max_task_loggers = max_task_loggers
+        self.max_growth_bytes = max_growth_mb_per_task * 1024 * 1024
+        self.growth_floor_bytes = growth_floor_mb * 1024 * 1024
+        self.window = max(2, window)
+        self.max_tasks = max_tasks
+        self.log_every = max(1, log_every)
+        self.recycle_mode = recycle_mode
+        self.process = psutil.Process() if self.enabled else None
+        self.tasks = 0
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=self.window)
+        self.baseline: Optional[Dict[str, Any]] = None
+        self.reason: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, config_loader: Optional[ConfigLoader] = None) -> 'WorkerWatchdog':
+        loader = config_loader or ConfigLoader()
+        config = loader.get_config_value("app.watchdog", {}) or {}
+        return cls(
+            enabled=bool(config.get("enabled", True)),
+            max_rss_mb=float(config.get("max_rss_mb", 2048)),
+            max_handles=int(config.get("max_handles", 4000)),
+            max_task_loggers=int(config.get("max_task_loggers", 50)),
+            max_growth_mb_per_task=float(config.get("max_growth_mb_per_task", 5.0)),
+            growth_floor_mb=float(config.get("growth_floor_mb", 512)),
+            window=int(config.get("window", 20)),
+            max_tasks=int(config.get("max_tasks", 0)),
+            log_every=int(config.get("log_every", 10)),
+            recycle_mode=config.get("recycle_mode", "auto"),
+        )
+
+    # --- Sampling ---
+
+    def sample(self, task_loggers: int = 0) -> Dict[str, Any]:
+        memory = self.process.memory_info()
+        try:
+            # Windows: handle (file, COM, GDI...), POSIX: file descriptor
+            handles = self.process.num_handles() if os.name == "nt" else self.process.num_fds()
+        except (AttributeError, psutil.Error):
+            handles = -1
+        return {
+            "task": self.tasks,
+            "time": time.time(),
+            "rss_bytes": memory.rss,
+            "handles": handles,
+            "task_loggers": task_loggers,
+            "threads": threading.active_count(),
+        }
+
+    def growth_per_task(self) -> float:
+        return _slope([(s["task"], s["rss_bytes"]) for s in self.samples])
+
+    def observe(self, task_loggers: int = 0) -> Optional[str]:
+        """Lấy mẫu sau một task; trả về lý do recycle hoặc None"""
+        if not self.enabled:
+            return None
+        self.tasks += 1
+        current = self.sample(task_loggers)
+        if self.baseline is None:
+            self.baseline = current
+        self.samples.append(current)
+        growth = self.growth_per_task()
+
+        for resource in ("rss_bytes", "handles", "task_loggers", "threads"):
+            WORKER_RESOURCES.set(current[resource], resource=resource)
+        WORKER_RSS_GROWTH.set(round(growth, 1))
+
+        if self.tasks % self.log_every == 0:
+            logger.info(
+                f"🩺 Watchdog | Tasks: {self.tasks}, RSS: {current['rss_bytes'] / 1048576:.1f} MB "
+                f"(start {self.baseline['rss_bytes'] / 1048576:.1f} MB, {growth / 1048576:+.2f} MB/task), "
+                f"Handles: {current['handles']}, Task loggers: {task_loggers}, Threads: {current['threads']}"
+            )
+
+        reason = self._check(current, growth)
+        if reason and not self.reason:
+            self.reason = reason
+            WORKER_RECYCLES.inc(reason=reason.split(":", 1)[0])
+            logger.warning(f"♻️ Watchdog requests worker recycle | {reason}")
+        return reason
+
+    def _check(self, current: Dict[str, Any], growth: float) -> Optional[str]:
+        if current["rss_bytes"] > self.max_rss_bytes:
+            return f"rss: {current['rss_bytes'] / 1048576:.0f} MB > {self.max_rss_bytes / 1048576:.0f} MB"
+        if self.max_handles and current["handles"] > self.max_handles:
+            return f"handles: {current['handles']} > {self.max_handles}"
+        if self.max_task_loggers and current["task_loggers"] > self.max_task_loggers:
+            return f"task_loggers: {current['task_loggers']} > {self.max_task_loggers}"
+        if (len(self.samples) >= self.window and growth > self.max_growth_bytes
+                and current["rss_bytes"] > self.growth_floor_bytes):
+            return f"rss_growth: {growth / 1048576:.2f} MB/task over last {self.window} tasks"
+        if self.max_tasks and self.tasks >= self.max_tasks:
+            return f"max_tasks: {self.tasks} tasks processed"
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        latest = self.samples[-1] if self.samples else {}
+        return {
+            "enabled": self.enabled,
+            "tasks": self.tasks,
+            "rss_bytes": latest.get("rss_bytes", 0),
+            "handles": latest.get("handles", 0),
+            "task_loggers": latest.get("task_loggers", 0),
+            "growth_bytes_per_task": round(self.growth_per_task(), 1),
+            "recycle_reason": self.reason,
+        }
+
+    # --- Recycle ---
+
+    def resolve_mode(self) -> str:
+        if self.recycle_mode != "auto":
+            return self.recycle_mode
+        return "exit" if any(os.environ.get(name) for name in SUPERVISOR_ENV_VARS) else "reexec"
+
+    def recycle(self, before_exec=None) -> None:
+        """
+        Khởi động lại process. Gọi sau khi worker đã drain và dừng các thread nền;
+        before_exec (vd enhanced_logger_manager.shutdown) chạy trước exec vì atexit không chạy.
+        """
+        mode = self.resolve_mode()
+        logger.warning(f"♻️ Recycling worker ({mode}) | {self.reason}")
+        if mode == "exit":
+            sys.exit(RECYCLE_EXIT_CODE)
+
+        if before_exec is not None:
+            before_exec()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        argv = [sys.executable] + sys.argv
+        if os.name == "nt":
+            # execv trên Windows không giữ PID và console, spawn process mới rồi thoát
+            subprocess.Popen(argv, close_fds=True)
+            os._exit(0)
+        os.execv(sys.executable, argv)
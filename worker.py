@@ -6,8 +6,21 @@ import logging
 import json
 from datetime import datetime
 from utils.task_utils import *
-from models.task import Base_task
+from models.task import Base_task, TaskValidationError
 from utils.load_config import ConfigLoader
+from utils.deadline import TaskDeadline, TaskTimeoutError
+from utils.task_scheduler import TaskScheduler
+from utils.log_shipper import LogShipper
+from utils.metrics import MetricsExporter, TASKS_TOTAL, TASK_SECONDS, track_stage
+from utils.tracing import tracer
+from utils.profiling import task_profiler
+from utils.watchdog import WorkerWatchdog
+from utils.task_heartbeat import LeaseLostError, TaskHeartbeat
+from utils.image_download import ImageDownloadCache, local_file_name, with_size
+from utils.psd_manifest import PsdManifest
+from utils.task_notifier import TaskNotifier
+from utils.mockup_naming import output_names
+from utils.scratch_space import get_scratch_space
 from utils.enhanced_logger_manager import enhanced_logger_manager  # Import logger manager
 from lib.photoshop_automation import PhotoshopAutomation
 from image_procesing import process_task
@@ -19,6 +32,22 @@ from image_procesing import process_task
 # For now, assuming it configures the root logger or one accessible via getLogger(__name__)
 logger = logging.getLogger(__name__) 
 config_loader = ConfigLoader()
+log_shipper = LogShipper.from_config(config_loader)
+scratch_space = get_scratch_space()
+# Cache ETag cho ảnh input: task lặp lại cùng ảnh chỉ tốn một request 304
+# Nằm trong scratch space (volume nhanh), ảnh cũ bị xoá khi thiếu quota / lúc GC
+download_cache = ImageDownloadCache(scratch_space.downloads_dir)
+_psd_manifest = None
+
+
+def template_image_size(store: str, product_type: str):
+    """(width, height) ảnh input cần cho template của <store>-<product_type> (smart object lớn nhất trong manifest)"""
+    global _psd_manifest
+    if not config_loader.get_config_value("app.image_download.request_width", True):
+        return None, None
+    if _psd_manifest is None:
+        _psd_manifest = PsdManifest.load()
+    return _psd_manifest.max_smart_object_size(f"{store}-{product_type}") or (None, None)
 
 # --- get_task function remains largely the same ---
 def get_task():
@@ -31,12 +60,24 @@ def get_task():
     for attempt in range(3):  # Retry tối đa 3 lần
         try:
             logger.info(f"📡 Attempt {attempt + 1}/3 to get task")
-            response = requests.get(task_json_url, timeout=10)
+            with track_stage("poll") as poll_stage, tracer.span("get_task", attempt=attempt + 1) as get_span:
+                response = requests.get(task_json_url, timeout=10)
+                if response.status_code not in (200, 404):
+                    poll_stage.outcome = "error"
+                elif response.status_code == 404:
+                    poll_stage.outcome = "empty"
+                else:
+                    response_data = response.json()
+                    get_span.set(task_id=str(response_data.get("id", "unknown")))
             if response.status_code == 200:
-                response_data = response.json()
                 task_id = response_data.get("id", "unknown")
                 logger.info(f"✅ Task received: ID={task_id}")
 
+                # Deadline tính từ lúc nhận task, bao gồm cả thời gian download
+                deadline = TaskDeadline.from_task(response_data, config_loader)
+                if deadline.enabled:
+                    logger.info(f"⏱️ Task {task_id} deadline: {deadline.timeout_seconds:.0f}s")
+
                 # Download image nếu có
                 image_url = response_data.get("image_url")
                 image_path = None
@@ -45,20 +86,41 @@ def get_task():
                     image_url_full = (
                         server_url.rstrip("/") + image_url if image_url.startswith("/") else image_url
                     )
-                    os.makedirs("downloads", exist_ok=True)
-                    file_name = os.path.basename(image_url)
-                    image_path = os.path.join("downloads", file_name)
-                    img_resp = requests.get(image_url_full, stream=True, timeout=10)
-                    if img_resp.status_code == 200:
-                        with open(image_path, "wb") as f:
-                            for chunk in img_resp.iter_content(1024):
-                                f.write(chunk)
-                        file_size = os.path.getsize(image_path)
-                        logger.info(f"✅ Image downloaded: {image_path} ({file_size:,} bytes)")
-                    else:
-                        logger.warning(f"❌ Failed to download image: {image_url_full} (status {img_resp.status_code})")
-
+                    # Chỉ tải đúng độ phân giải template cần, đủ cả width lẫn height (server trả ảnh gốc nếu nhỏ hơn)
+                    width, height = template_image_size(response_data.get("store", ""),
+                                                        response_data.get("product_type", ""))
+                    image_url_full = with_size(image_url_full, width, height)
+                    os.makedirs(scratch_space.downloads_dir, exist_ok=True)
+                    image_path = os.path.join(scratch_space.downloads_dir, local_file_name(image_url, width, height))
+                    download_stage = track_stage("download", response_data.get("store", ""),
+                                                 response_data.get("product_type", ""))
+                    try:
+                        with download_stage, tracer.span("download", task_id=task_id, url=image_url, width=width,
+                                                           height=height):
+                            result = download_cache.fetch(image_url_full, image_path, timeout=deadline.bound_timeout(10),
+                                                          on_chunk=lambda: deadline.check("download"))
+                            if result["status"] == "not_modified":
+                                download_stage.outcome = "cached"
+                                scratch_space.touch(image_path)
+                                logger.info(f"♻️ Image unchanged (ETag match), reusing: {image_path}")
+                            elif result["status"] == "downloaded":
+                                download_stage.bytes = result["bytes"]
+                                file_size = os.path.getsize(image_path)
+                                resumed = " (resumed)" if result["resumed"] else ""
+                                logger.info(f"✅ Image downloaded{resumed}: {image_path} ({file_size:,} bytes)")
+                            else:
+                                download_stage.outcome = "error"
+                                logger.warning(f"❌ Failed to download image: {image_url_full} (status {result['status_code']})")
+                    except TaskTimeoutError as e:
+                        # worker_loop sẽ thấy deadline đã hết và báo timeout
+                        logger.error(f"⏰ {e}")
+                        image_path = None
+
+                # Deadline và heartbeat nội bộ, không gửi lên server
+                response_data["_deadline"] = deadline
                 response_data["downloaded_image_path"] = image_path
+                # Gia hạn lease ngay khi nhận task: task prefetch chờ trong scheduler không bị hết lease
+                response_data["_heartbeat"] = TaskHeartbeat.start_for_task(response_data, config_loader)
                 return response_data
 
             elif response.status_code == 404:
@@ -112,7 +174,7 @@ def send_logs_to_server(task_id: str, log_data: dict):
         return False
 
 # --- update_task function with minor adjustments ---
-def update_task(task: dict, image_paths: list = [], log_message_summary: str = ""):
+def update_task(task: dict, image_paths: list = [], log_message_summary: str = "", timeout: float = 30):
     """Update task với logs chi tiết và gửi message lên server"""
     server_url = config_loader.get_config_value("app.server_url", "http://localhost:8000")
     client_name = config_loader.get_config_value('app.client_name', 'default_client_name')
@@ -130,10 +192,14 @@ def update_task(task: dict, image_paths: list = [], log_message_summary: str = "
         "status": task.get("status"),
         "message": final_message # Use the combined message
     }
+    if task.get("lease_token"):
+        # Server có hàng đợi lease: từ chối (409) nếu task đã được giao cho worker khác
+        data["lease_token"] = task["lease_token"]
 
     # Handle files
     files = []
     file_handles = [] # Keep track of opened file handles for safe closing
+    upload_stage = track_stage("upload", task.get("store", ""), task.get("product_type", ""))
     try:
         for i, img_path in enumerate(image_paths):
             if os.path.isfile(img_path):
@@ -141,12 +207,17 @@ def update_task(task: dict, image_paths: list = [], log_message_summary: str = "
                 logger.info(f"📎 Attaching file {i+1}/{len(image_paths)}: {os.path.basename(img_path)} ({file_size:,} bytes)")
                 file_handle = open(img_path, "rb")
                 file_handles.append(file_handle) # Keep track
+                upload_stage.bytes += file_size
                 files.append(("images", (os.path.basename(img_path), file_handle, "image/webp")))
             else:
                 logger.warning(f"❌ File not found: {img_path}")
 
         logger.info(f"📡 Sending update request for task {task_id}...")
-        response = requests.patch(update_url, data=data, files=files, timeout=30)
+        with upload_stage, tracer.span("update_task", task_id=task_id, status=task.get("status"),
+                                       images=len(files)):
+            response = requests.patch(update_url, data=data, files=files, timeout=timeout)
+            if response.status_code != 200:
+                upload_stage.outcome = "error"
 
         if response.status_code == 200:
             logger.info(f"✅ Task {task_id} updated successfully")
@@ -170,36 +241,106 @@ def update_task(task: dict, image_paths: list = [], log_message_summary: str = "
 
     return None
 
+# --- local scheduler over prefetched tasks ---
+def next_task(scheduler: TaskScheduler, prefetch: int, claim: bool = True):
+    """
+    Claim thêm task cho đến khi scheduler có đủ `prefetch` task, rồi lấy task ưu tiên nhất.
+    prefetch=1 giữ nguyên hành vi cũ: claim một task và xử lý ngay.
+    claim=False (đang drain): chỉ lấy task đã prefetch.
+    """
+    while claim and len(scheduler) < prefetch:
+        claimed = get_task()
+        if not claimed:
+            break
+        scheduler.push(claimed)
+
+    task = scheduler.pop()
+    if task and prefetch > 1:
+        stats = scheduler.get_stats()
+        logger.info(
+            f"📋 Scheduler | Dispatch {task.get('id', 'unknown')} (store={task.get('store', '')}, "
+            f"priority={scheduler.task_priority(task):g}) | Queue depth: {stats['depth']}, "
+            f"Wait avg/p95/max: {stats['wait_seconds']['avg']}/{stats['wait_seconds']['p95']}/"
+            f"{stats['wait_seconds']['max']}s"
+        )
+    return task
+
 # --- worker_loop with improved logging capture ---
 def worker_loop():
     """Main worker loop với logging cải thiện"""
     logger.info("🚀 Worker started - Ready to process tasks")
+    # Thư mục task bị bỏ lại từ lần chạy trước (crash, recycle) và ảnh download quá hạn
+    scratch_space.collect_garbage()
     consecutive_failures = 0
     max_consecutive_failures = 10
+    scheduler = TaskScheduler.from_config(config_loader)
+    prefetch = max(1, int(config_loader.get_config_value("app.scheduler.prefetch", 1)))
+    # Tắt mặc định: server production có thể chưa có route nhận log
+    ship_logs = bool(config_loader.get_config_value("app.log_shipping.enabled", False))
+    if ship_logs:
+        log_shipper.start()
+    metrics_exporter = MetricsExporter.from_config(config_loader)
+    metrics_exporter.start()
+    watchdog = WorkerWatchdog.from_config(config_loader)
+    draining = False
+    # Chỉ recycle khi drain xong; Ctrl+C hoặc quá nhiều lỗi thì dừng hẳn
+    drain_completed = False
+    # Server đẩy "có task" qua SSE; mất kết nối thì quay về poll mỗi 5s
+    task_notifier = None
+    # Tắt mặc định: chỉ bật khi server có route task-events (server.py tham chiếu)
+    if config_loader.get_config_value("app.task_events.enabled", False):
+        task_notifier = TaskNotifier.from_config(config_loader)
+        task_notifier.start()
 
     while True:
         task_log_summary = "" # To capture key messages for the task's final update
+        task_id = None
+        heartbeat = None
         try:
             # Reset failure counter khi có task
-            task = get_task()
+            task = next_task(scheduler, prefetch, claim=not draining)
             if not task:
-                logger.info("😴 No tasks available, sleeping...")
-                time.sleep(5)
+                if task_notifier is not None:
+                    logger.info("😴 No tasks available, waiting for notification...")
+                    task_notifier.wait_for_task(poll_interval=5)
+                else:
+                    logger.info("😴 No tasks available, sleeping...")
+                    time.sleep(5)
                 continue
 
             consecutive_failures = 0  # Reset khi có task
+            task_started = time.perf_counter()
             status = task.get("status", "pending")
             task_id = task.get("id", "unknown")
+            deadline = task.pop("_deadline", None) or TaskDeadline.from_task(task, config_loader)
+            heartbeat = task.pop("_heartbeat", None)
             task_log_summary = f"Processing task {task_id}" # Initialize summary
             logger.info(f"🎯 Processing task {task_id} with status: {status}")
 
-            if status == "pending":
-                new_task = Base_task.from_dict(task)
+            if status == "pending" and deadline.expired():
+                # Hết hạn ngay trong lúc download
+                timeout_msg = f"Timed out after {deadline.elapsed():.2f}s at stage 'download'"
+                task["status"] = "timeout"
+                task["message"] = timeout_msg
+                task_log_summary += f" - {timeout_msg}"
+                logger.error(f"⏰ Task {task_id} {timeout_msg}")
+                final_images = []
+
+            elif status == "pending":
                 start_time = time.time()
+                log_data = None
                 try:
+                    if heartbeat is not None and heartbeat.lost:
+                        # Lease mất trong lúc chờ trong scheduler: không xử lý
+                        raise LeaseLostError(f"Lease lost for task {task_id} while queued locally")
+                    # Task sai schema: báo failed lên server thay vì để task nằm leased
+                    new_task = Base_task.from_dict(task)
                     logger.info(f"⚡ Starting processing for task {task_id}")
                     # Gọi process_task, nhận cả kết quả và logs (assuming process_task handles its own logging)
-                    final_images, log_data = process_task(new_task)
+                    # Profile CPU/bộ nhớ nếu task được chọn (config app.profiling hoặc field "profile")
+                    final_images, log_data = task_profiler.call(task, process_task, new_task, deadline=deadline)
+                    if heartbeat is not None and heartbeat.lost:
+                        raise LeaseLostError(f"Lease lost for task {task_id}, task was handed to another worker")
                     if isinstance(final_images, str):
                         final_images = [final_images]
 
@@ -212,6 +353,31 @@ def worker_loop():
                     logger.info(f"🎉 Task {task_id} completed successfully")
                     logger.info(f"📊 Generated {len(final_images)} images in {processing_time:.2f}s")
 
+                except TaskValidationError as e:
+                    task["status"] = "failed"
+                    invalid_msg = f"Invalid task: {e}"
+                    task["message"] = invalid_msg
+                    task_log_summary += f" - {invalid_msg}"
+                    logger.error(f"💥 Task {task_id} rejected: {invalid_msg}")
+                    final_images = []
+
+                except LeaseLostError as e:
+                    # Task đã thuộc worker khác: bỏ kết quả, không upload, không update
+                    task["status"] = "lease_lost"
+                    task_log_summary += f" - {e}"
+                    logger.warning(f"🚫 {e}, abandoning without upload")
+                    final_images = []
+
+                except TaskTimeoutError as e:
+                    processing_time = time.time() - start_time
+                    task["status"] = "timeout"
+                    timeout_msg = f"Timed out after {processing_time:.2f}s at stage '{e.stage}'"
+                    task["message"] = timeout_msg
+                    task_log_summary += f" - {timeout_msg}"
+                    logger.error(f"⏰ Task {task_id} {timeout_msg}")
+                    final_images = []
+                    log_data = getattr(e, "log_data", None)
+
                 except Exception as e:
                     processing_time = time.time() - start_time
                     error_msg = str(e)
@@ -221,12 +387,14 @@ def worker_loop():
                     task_log_summary += f" - {fail_msg}" # Update summary
                     logger.error(f"💥 Error processing task {task_id}: {error_msg}", exc_info=True) # Add exc_info
 
-                    # Optional: Create log_data for failed tasks if needed separately
-                    # log_data is handled by process_task, but if you need specific worker-level logs:
-                    # log_data = { ... } # As before, or capture worker logs if process_task doesn't
-
+                    # process_task gắn log_data (logs của task trước khi cleanup) vào exception
+                    log_data = getattr(e, "log_data", None)
                     final_images = []
 
+                if ship_logs and log_data:
+                    # Gửi nền theo batch, không chờ network (cả task failed / timeout)
+                    log_shipper.submit(task_id, log_data)
+
             else:
                 skip_msg = f"Task {task_id} has status {status}, skipping processing"
                 logger.info(f"⏭️ {skip_msg}")
@@ -234,6 +402,15 @@ def worker_loop():
                 # log_data = None # process_task likely handles this
                 final_images = []
 
+            # Deadline hết trước khi upload: không upload ảnh, chỉ báo timeout
+            if task.get("status") == "completed" and deadline.expired():
+                timeout_msg = f"Timed out after {deadline.elapsed():.2f}s at stage 'upload'"
+                task["status"] = "timeout"
+                task["message"] = timeout_msg
+                task_log_summary += f" - {timeout_msg}"
+                logger.error(f"⏰ Task {task_id} {timeout_msg}")
+                final_images = []
+
             # Log kết quả trước khi gửi
             if final_images:
                 logger.info(f"📤 Uploading {len(final_images)} images for task {task_id}")
@@ -243,8 +420,30 @@ def worker_loop():
                         logger.info(f"  📎 {i}. {os.path.basename(img_path)} ({size:,} bytes)")
 
             # Update task với message summary
-            check = update_task(task, final_images, log_message_summary=task_log_summary)
-            if check:
+            if task.get("status") == "lease_lost":
+                check = True
+            elif task.get("status") == "timeout":
+                check = update_task(task, [], log_message_summary=task_log_summary)
+            else:
+                check = update_task(task, final_images, log_message_summary=task_log_summary,
+                                    timeout=deadline.bound_timeout(30))
+                if not check and final_images and deadline.expired():
+                    # Upload bị cắt bởi deadline, báo timeout không kèm ảnh
+                    timeout_msg = f"Timed out after {deadline.elapsed():.2f}s at stage 'upload'"
+                    task["status"] = "timeout"
+                    task["message"] = timeout_msg
+                    logger.error(f"⏰ Task {task_id} {timeout_msg}")
+                    check = update_task(task, [], log_message_summary=f"{task_log_summary} - {timeout_msg}")
+            task_labels = {"store": task.get("store", ""), "product_type": task.get("product_type", "")}
+            TASKS_TOTAL.inc(status=task.get("status", ""), **task_labels)
+            TASK_SECONDS.observe(time.perf_counter() - task_started, **task_labels)
+            if not draining and watchdog.observe(task_loggers=len(enhanced_logger_manager.task_loggers)):
+                # Ngừng claim task mới, xử lý nốt task đã prefetch rồi recycle
+                draining = True
+                logger.warning(f"♻️ Draining worker before recycle | Prefetched tasks left: {len(scheduler)}")
+            if task.get("status") == "lease_lost":
+                logger.info(f"⏭️ Task {task_id} abandoned, lease belongs to another worker")
+            elif check:
                 logger.info(f"✅ Task {task_id} updated successfully with status: {task['status']}")
             else:
                 logger.error(f"❌ Failed to update task {task_id}")
@@ -262,12 +461,37 @@ def worker_loop():
             if consecutive_failures >= max_consecutive_failures:
                 logger.critical(f"💥 Too many consecutive failures ({consecutive_failures}), stopping worker")
                 break
+        finally:
+            if heartbeat is not None:
+                heartbeat.stop()
+            if task_id is not None:
+                # Cả khi task lỗi giữa chừng: trả lại tên output cho task sau (xoá marker .reserved)
+                # và ghi/giải phóng span của task
+                output_names.release(str(task_id))
+                tracer.finish_task(task_id)
+
+        if draining and not len(scheduler):
+            logger.info("♻️ Drain completed, no prefetched tasks left")
+            drain_completed = True
+            break
 
         # Sleep giữa các task
         logger.info("⏸️ Waiting 5 seconds before next task...")
         time.sleep(5)
 
+    for leftover in scheduler.drain():
+        # Task prefetch chưa xử lý (dừng do lỗi / Ctrl+C): ngừng gia hạn để lease hết hạn và task được giao lại
+        if leftover.get("_heartbeat") is not None:
+            leftover["_heartbeat"].stop()
+    if task_notifier is not None:
+        task_notifier.stop()
+    if ship_logs:
+        log_shipper.stop()
+    metrics_exporter.stop()
+    tracer.flush()
     logger.info("🛑 Worker stopped")
+    if drain_completed:
+        watchdog.recycle(before_exec=enhanced_logger_manager.shutdown)
 
 # --- health_check function remains largely the same ---
 def health_check():
@@ -299,6 +523,11 @@ def health_check():
             logger.info(f"✅ Created output folder: {output_folder}")
         else:
             logger.info(f"✅ Output folder exists: {output_folder}")
+
+        if scratch_space.ensure_room(scratch_space.task_reserve_bytes):
+            logger.info(f"✅ Scratch space OK: {scratch_space.root}")
+        else:
+            logger.warning(f"⚠️ Scratch space full or unavailable, tasks will use fallback: {scratch_space.fallback_root}")
     except Exception as e:
         issues.append(f"❌ Folder check error: {e}")
 